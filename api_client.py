@@ -0,0 +1,67 @@
+import http.client
+import json
+from urllib.parse import urlsplit
+
+from docker_engine import UnixHTTPConnection
+
+DEFAULT_URL = "http://127.0.0.1:8750"
+
+
+class ApiClient:
+    """Thin client for api_server over one keep-alive connection (TCP URL or 'unix:/path')"""
+
+    def __init__(self, url=DEFAULT_URL, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            if self.url.startswith("unix:"):
+                self._conn = UnixHTTPConnection(self.url[5:], timeout=self.timeout)
+            else:
+                parts = urlsplit(self.url)
+                self._conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=self.timeout)
+        return self._conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _send(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                return conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                # Server closed the idle keep-alive connection; reconnect once
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def request(self, method, path, body=None):
+        """Returns (status, decoded JSON)"""
+        resp = self._send(method, path, body)
+        payload = json.loads(resp.read() or b"null")
+        if resp.will_close:
+            self.close()
+        return resp.status, payload
+
+    def stream(self, method, path, body=None):
+        """Yields each NDJSON object of a streaming endpoint (add ?stream=1 to the path)"""
+        resp = self._send(method, path, body)
+        for line in resp:
+            if line.strip():
+                yield json.loads(line)
+        if resp.will_close:
+            self.close()
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def post(self, path, body=None):
+        return self.request("POST", path, body)
@@ -0,0 +1,73 @@
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+
+from api_client import ApiClient, DEFAULT_URL
+
+
+def worker(url, path, deadline, latencies, errors):
+    client = ApiClient(url)
+    local, failed = [], 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status, _ = client.get(path)
+            if status >= 400:
+                failed += 1
+        except OSError:
+            failed += 1
+            client.close()
+        local.append(time.perf_counter() - started)
+    client.close()
+    latencies.extend(local)
+    errors.append(failed)
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def run(url, path, clients, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=worker, args=(url, path, deadline, latencies, errors)) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "path": path, "clients": clients, "seconds": round(elapsed, 2), "requests": len(latencies),
+        "errors": sum(errors), "req_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2), "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure api_server throughput on list/status calls")
+    parser.add_argument("--url", default=DEFAULT_URL, help="http://host:port or unix:/path/to.sock")
+    parser.add_argument("--path", action="append", help="endpoint(s) to hit (default: /vms and /containers)")
+    parser.add_argument("-c", "--clients", type=int, default=8)
+    parser.add_argument("-t", "--seconds", type=float, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = [run(args.url, path, args.clients, args.seconds) for path in (args.path or ["/vms", "/containers"])]
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for r in results:
+            print(f"{r['path']:<15} {r['req_per_sec']:>9} req/s  p50={r['p50_ms']}ms p95={r['p95_ms']}ms "
+                  f"p99={r['p99_ms']}ms  ({r['requests']} requests, {r['errors']} errors, {r['clients']} clients)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
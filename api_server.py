@@ -0,0 +1,520 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import urlsplit, parse_qs
+
+import docker_engine
+from build_context import build_lines, CONTEXT_DIR
+from command_runner import runner as command_runner
+from docker_engine import DockerEngineError, docker_lines
+from disk_images import index as disk_index, rewrite_images
+from disk_templates import TEMPLATE_DIR
+from docker_inventory import inventory
+from pull_scheduler import scheduler as pull_scheduler
+from host_scheduler import scheduler as host_scheduler
+from iso_catalog import ISO_DIR
+from metrics import collector as metrics_collector
+from qmp_client import QMPClient, QMPError
+from state_store import store, parse_since
+from vm_registry import registry, VMError, DISK_DIR
+from vm_snapshots import snapshots, valid_tag, SnapshotError, INTERNAL, FILE
+
+# --- SERVER CONFIGURATION ---
+HOST = "127.0.0.1"
+PORT = 8750
+MAX_BODY = 1024 * 1024
+# A streaming producer re-checks whether its client is still there this often while the queue is full
+PRODUCER_POLL = 1.0
+
+REASONS = {200: "OK", 201: "Created", 202: "Accepted", 204: "No Content", 400: "Bad Request",
+           404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+           500: "Internal Server Error", 502: "Bad Gateway"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, path, query, headers, body, params):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.params = params
+
+    def json(self):
+        if not self.body:
+            return {}
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise ApiError(400, "Body is not valid JSON")
+
+    def flag(self, name):
+        return self.query.get(name, ["0"])[0] in ("1", "true", "yes")
+
+
+# --- HELPERS ---
+async def blocking(fn, *args, **kwargs):
+    """Runs a blocking backend call on the default thread pool"""
+    return await asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, **kwargs))
+
+
+async def iterate_in_thread(make_iter):
+    """Turns a blocking generator into an async one, one line at a time.
+
+    Closing this generator (the client went away) stops the producer thread: its pending put
+    gives up within PRODUCER_POLL and the blocking generator is closed, so its child process
+    or engine stream is released and the executor thread is freed.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=1000)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            except RuntimeError:
+                return False  # the loop is gone
+            try:
+                future.result(PRODUCER_POLL)
+                return True
+            except FutureTimeout:
+                if not future.cancel():
+                    return True  # went in just as the wait ended
+        return False
+
+    def produce():
+        lines = make_iter()
+        try:
+            for item in lines:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(f"ERR: {e}")
+        finally:
+            if hasattr(lines, "close"):
+                lines.close()
+        put(done)
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def lines_response(req, make_lines):
+    """Long-running operations stream NDJSON when ?stream=1, otherwise return all lines at the end"""
+    async def stream():
+        lines = iterate_in_thread(make_lines)
+        try:
+            async for line in lines:
+                yield {"line": line}
+        finally:
+            await lines.aclose()
+
+    if req.flag("stream"):
+        return 200, stream()
+
+    async def collect():
+        return [line async for line in iterate_in_thread(make_lines)]
+    return collect()
+
+
+def confined(path, directory, field):
+    """A client-supplied file name or path, resolved and required to stay inside one data directory"""
+    if not isinstance(path, str) or not path:
+        raise ApiError(400, f"'{field}' must be a non-empty string")
+    resolved = os.path.realpath(os.path.join(directory, path))
+    if os.path.commonpath([resolved, os.path.realpath(directory)]) != os.path.realpath(directory):
+        raise ApiError(400, f"'{field}' must be inside {directory}")
+    return resolved
+
+
+def vm_or_404(name):
+    if name not in registry.vms:
+        raise ApiError(404, f"No VM named '{name}'")
+    return registry.vms[name]
+
+
+def tag_or_400(tag):
+    if not valid_tag(tag):
+        raise ApiError(400, f"Invalid snapshot tag {tag!r}: use letters, digits, '.', '_' and '-' only")
+    return tag
+
+
+# --- VM ENDPOINTS ---
+async def list_vms(req):
+    return registry.list()
+
+
+async def get_vm(req):
+    return vm_or_404(req.params["name"]).info()
+
+
+async def create_vm(req):
+    data = req.json()
+    name = data.pop("name", None)
+    if not name:
+        raise ApiError(400, "'name' is required")
+    settings = {k: data[k] for k in ("ram", "cpu", "disk_size", "iso_path", "disk_path", "template", "accel", "disk_bus")
+                if k in data}
+    # Files the server creates or opens for a client stay in the data directories
+    if settings.get("disk_path"):
+        settings["disk_path"] = confined(settings["disk_path"], DISK_DIR, "disk_path")
+    if settings.get("iso_path"):
+        settings["iso_path"] = confined(settings["iso_path"], ISO_DIR, "iso_path")
+    registry.define(name, **settings)
+    if data.get("start", True):
+        await blocking(registry.launch, name)
+    return 201, registry.get(name).info()
+
+
+async def vm_stats(req):
+    vm = vm_or_404(req.params["name"])
+    try:
+        async with QMPClient(vm.qmp_socket) as qmp:
+            return await qmp.stats()
+    except (QMPError, OSError, asyncio.TimeoutError) as e:
+        raise ApiError(502, f"QMP unavailable for '{vm.name}': {e}")
+
+
+async def stop_vm(req):
+    vm_or_404(req.params["name"])
+    action = registry.stop if req.flag("force") else registry.powerdown
+    return 202, (await blocking(action, req.params["name"])).info()
+
+
+async def list_snapshots(req):
+    vm_or_404(req.params["name"])
+    return await blocking(snapshots.list, req.params["name"])
+
+
+async def save_snapshot(req):
+    vm_or_404(req.params["name"])
+    data = req.json()
+    kind = data.get("kind", FILE)
+    if kind not in (INTERNAL, FILE):
+        raise ApiError(400, f"'kind' must be '{INTERNAL}' or '{FILE}'")
+    tag = data.get("tag")
+    if tag is not None:
+        tag_or_400(tag)
+    entry = await blocking(snapshots.save, req.params["name"], tag, kind=kind, stop=bool(data.get("stop")))
+    return 201, entry
+
+
+async def restore_snapshot(req):
+    vm_or_404(req.params["name"])
+    vm, seconds = await blocking(snapshots.restore, req.params["name"], tag_or_400(req.params["tag"]))
+    return dict(vm.info(), restore_seconds=seconds)
+
+
+async def delete_snapshot(req):
+    vm_or_404(req.params["name"])
+    await blocking(snapshots.delete, req.params["name"], tag_or_400(req.params["tag"]))
+    return {"deleted": req.params["tag"]}
+
+
+# --- DOCKER ENDPOINTS ---
+async def list_containers(req):
+    if inventory.ready and not req.flag("fresh"):
+        return inventory.container_list()
+    engine = docker_engine.get_engine()
+    if engine is None:
+        raise ApiError(502, "Docker engine socket is not reachable")
+    return await blocking(engine.ps)
+
+
+async def list_images(req):
+    if inventory.ready and not req.flag("fresh"):
+        return inventory.image_list()
+    engine = docker_engine.get_engine()
+    if engine is None:
+        raise ApiError(502, "Docker engine socket is not reachable")
+    return await blocking(engine.images)
+
+
+async def run_container(req):
+    data = req.json()
+    if not data.get("image"):
+        raise ApiError(400, "'image' is required")
+    return lines_response(req, lambda: docker_lines("run", image=data["image"], name=data.get("name")))
+
+
+async def stop_container(req):
+    return lines_response(req, lambda: docker_lines("stop", container=req.params["id"]))
+
+
+async def pull_images(req):
+    images = req.json().get("images")
+    if not isinstance(images, list) or not images or not all(isinstance(i, str) and i.strip() for i in images):
+        raise ApiError(400, "'images' must be a non-empty list of image names")
+    futures = pull_scheduler.submit(images)
+    if not req.flag("wait"):
+        return 202, {"scheduled": list(futures)}
+    results = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures.values()))
+    return dict(zip(futures, results))
+
+
+async def pull_progress(req):
+    return {"overall": pull_scheduler.overall(),
+            "images": pull_scheduler.summaries()}
+
+
+async def build_image(req):
+    data = req.json()
+    if not data.get("tag"):
+        raise ApiError(400, "'tag' is required")
+    path = confined(data.get("path"), CONTEXT_DIR, "path")
+    if path == os.path.realpath(CONTEXT_DIR) or not os.path.isdir(path):
+        raise ApiError(400, f"'path' must be a folder inside {CONTEXT_DIR}")
+    return lines_response(req, lambda: build_lines(path, data["tag"]))
+
+
+async def host_status(req):
+    return await blocking(host_scheduler.status)
+
+
+# --- DISK ENDPOINTS ---
+async def list_disks(req):
+    await blocking(disk_index.refresh)
+    return {"summary": disk_index.summary(), "images": disk_index.list()}
+
+
+async def compact_disks(req):
+    data = req.json()
+    mode = data.get("mode", "compact")
+    if mode not in ("compact", "trim"):
+        raise ApiError(400, "'mode' must be 'compact' or 'trim'")
+    paths = data.get("paths") or []
+    if not paths or not isinstance(paths, list):
+        raise ApiError(400, "'paths' must be a non-empty list")
+    # Only VM disks: anything else the server can write is off limits, and so are template bases
+    paths = [confined(path, DISK_DIR, "paths") for path in paths]
+    templates = os.path.realpath(TEMPLATE_DIR)
+    if any(os.path.commonpath([path, templates]) == templates for path in paths):
+        raise ApiError(400, "Template base images cannot be rewritten (their overlays point at them)")
+    in_use = [os.path.realpath(vm.disk_path) for vm in registry.running()]
+    results = await blocking(rewrite_images, paths, compress=mode == "compact", in_use=in_use)
+    await blocking(disk_index.refresh)
+    return {path: {"ok": ok, "saved_bytes" if ok else "error": detail} for path, (ok, detail) in results.items()}
+
+
+async def gc_overlays(req):
+    return {"removed": await blocking(registry.gc_overlays)}
+
+
+async def list_commands(req):
+    return {"commands": command_runner.list(), "summary": command_runner.summary()}
+
+
+async def cancel_command(req):
+    if not command_runner.cancel(int(req.params["id"])):
+        raise ApiError(409, f"Command {req.params['id']} is not queued or cancellable")
+    return 202, {"cancelled": int(req.params["id"])}
+
+
+def since_param(req, default=None):
+    value = req.query.get("since", [default])[0]
+    try:
+        return parse_since(value) if value else None
+    except ValueError:
+        raise ApiError(400, "'since' must look like 7d, 24h, 30m or a number of seconds")
+
+
+async def history(req):
+    kind = req.query.get("kind", [None])[0]
+    since = since_param(req)
+    try:
+        limit = int(req.query.get("limit", ["50"])[0])
+    except ValueError:
+        raise ApiError(400, "'limit' must be an integer")
+    if req.flag("slowest"):
+        if not kind:
+            raise ApiError(400, "'slowest' needs a 'kind'")
+        return {"operations": await blocking(store.slowest, kind, since, limit)}
+    target = req.query.get("target", [None])[0]
+    return {"operations": await blocking(store.operations, kind, target, since, limit)}
+
+
+async def history_summary(req):
+    return {"kinds": await blocking(store.summary, since_param(req, "7d"))}
+
+
+async def workloads(req):
+    return {"workloads": await blocking(store.workloads, req.query.get("kind", [None])[0])}
+
+
+async def metrics(req):
+    return {"interval": metrics_collector.interval, "overhead_percent": round(metrics_collector.overhead(), 3),
+            "workloads": metrics_collector.snapshot()}
+
+
+async def health(req):
+    return {"ok": True, "vms": len(registry.vms), "inventory": inventory.ready}
+
+
+ROUTES = [
+    ("GET", r"/health", health),
+    ("GET", r"/host", host_status),
+    ("GET", r"/metrics", metrics),
+    ("GET", r"/history", history),
+    ("GET", r"/history/summary", history_summary),
+    ("GET", r"/workloads", workloads),
+    ("GET", r"/commands", list_commands),
+    ("POST", r"/commands/(?P<id>\d+)/cancel", cancel_command),
+    ("GET", r"/disks", list_disks),
+    ("POST", r"/disks/compact", compact_disks),
+    ("POST", r"/templates/gc", gc_overlays),
+    ("GET", r"/vms", list_vms),
+    ("POST", r"/vms", create_vm),
+    ("GET", r"/vms/(?P<name>[^/]+)", get_vm),
+    ("GET", r"/vms/(?P<name>[^/]+)/stats", vm_stats),
+    ("POST", r"/vms/(?P<name>[^/]+)/stop", stop_vm),
+    ("GET", r"/vms/(?P<name>[^/]+)/snapshots", list_snapshots),
+    ("POST", r"/vms/(?P<name>[^/]+)/snapshots", save_snapshot),
+    ("POST", r"/vms/(?P<name>[^/]+)/snapshots/(?P<tag>[^/]+)/restore", restore_snapshot),
+    ("DELETE", r"/vms/(?P<name>[^/]+)/snapshots/(?P<tag>[^/]+)", delete_snapshot),
+    ("GET", r"/containers", list_containers),
+    ("POST", r"/containers", run_container),
+    ("POST", r"/containers/(?P<id>[^/]+)/stop", stop_container),
+    ("GET", r"/images", list_images),
+    ("POST", r"/images/pull", pull_images),
+    ("GET", r"/images/pull", pull_progress),
+    ("POST", r"/images/build", build_image),
+]
+ROUTES = [(method, re.compile(pattern + "$"), handler) for method, pattern, handler in ROUTES]
+
+
+async def dispatch(req):
+    allowed = False
+    for method, pattern, handler in ROUTES:
+        match = pattern.match(req.path)
+        if not match:
+            continue
+        if method != req.method:
+            allowed = True
+            continue
+        req.params = match.groupdict()
+        result = await handler(req)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result if isinstance(result, tuple) else (200, result)
+    raise ApiError(405 if allowed else 404, "Method not allowed" if allowed else f"No route for {req.path}")
+
+
+# --- HTTP/1.1 PLUMBING ---
+async def write_response(writer, status, payload, keep_alive):
+    head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+    head += f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+    if hasattr(payload, "__aiter__"):
+        # Streaming: one JSON object per line, sent as HTTP chunks as soon as it is produced
+        writer.write((head + "Transfer-Encoding: chunked\r\n\r\n").encode())
+        try:
+            async for item in payload:
+                data = (json.dumps(item) + "\n").encode()
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await writer.drain()
+        finally:
+            await payload.aclose()  # also when the client disconnected: stops the producer
+        writer.write(b"0\r\n\r\n")
+    else:
+        data = json.dumps(payload).encode()
+        writer.write((head + f"Content-Length: {len(data)}\r\n\r\n").encode() + data)
+    await writer.drain()
+
+
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                await write_response(writer, 400, {"error": "Malformed request line"}, False)
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0) or 0)
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            if length > MAX_BODY:
+                await write_response(writer, 413, {"error": "Body too large"}, False)
+                break
+            body = await reader.readexactly(length) if length else b""
+            url = urlsplit(target)
+            req = Request(method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body, {})
+            try:
+                status, payload = await dispatch(req)
+            except ApiError as e:
+                status, payload = e.status, {"error": str(e)}
+            except (VMError, SnapshotError) as e:
+                status, payload = 409, {"error": str(e)}
+            except DockerEngineError as e:
+                status, payload = e.status if e.status >= 400 else 502, {"error": e.message}
+            except Exception as e:
+                status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+            await write_response(writer, status, payload, keep_alive)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=HOST, port=PORT, unix_path=None):
+    adopted, lost = store.attach(registry=registry, inventory=inventory, runner=command_runner)
+    for name in adopted:
+        print(f"[VM] Re-attached to running VM '{name}'")
+    inventory.start()
+    metrics_collector.start()
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.unlink(unix_path)
+        server = await asyncio.start_unix_server(handle_connection, unix_path)
+        print(f"Cloud Manager API listening on unix:{unix_path}")
+    else:
+        server = await asyncio.start_server(handle_connection, host, port)
+        print(f"Cloud Manager API listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless JSON API for VM and Docker operations")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", help="listen on a Unix socket instead of TCP")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("\nAPI server stopped.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
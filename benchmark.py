@@ -0,0 +1,564 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import socketserver
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+# --- BENCHMARK CONFIGURATION ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, "logs", "bench")
+SCENARIOS = ("docker_cli", "command_pool", "docker_engine", "pull_stream", "log_heavy", "log_follow", "vm_launch",
+             "vm_snapshot", "history_query", "startup", "cli_version")
+# Cold start of a CLI call (fresh interpreter -> parsed command, p50 at concurrency 1); main() fails above it
+STARTUP_BUDGET_MS = 100
+STARTUP_SCENARIOS = ("startup",)
+
+# Stand-in executables. Each reads FAKE_DELAY (seconds before answering), FAKE_LINES and FAKE_LINE_BYTES
+# (output volume), so the same harness covers "slow daemon" and "chatty command" cases.
+FAKE_DOCKER = r"""#!/bin/sh
+sleep "${FAKE_DELAY:-0}"
+case "$1" in
+  --version) echo "Docker version 24.0.0, build fake" ;;
+  *) line=$(printf "%${FAKE_LINE_BYTES:-80}s" "" | tr " " x)
+     yes "$line" | head -n "${FAKE_LINES:-10}" ;;
+esac
+"""
+FAKE_QEMU_IMG = r"""#!/bin/sh
+sleep "${FAKE_DELAY:-0}"
+[ -n "$FAKE_QEMU_LOG" ] && printf '{"qemu-img": "%s"}\n' "$*" >> "$FAKE_QEMU_LOG"
+if [ "$1" = create ]; then
+  shift
+  while [ $# -gt 0 ]; do case "$1" in -f|-b|-F|-o) shift 2 ;; *) break ;; esac; done
+  printf 'QFI\373' > "$1"
+fi
+"""
+FAKE_QEMU_SYSTEM = r"""#!/bin/sh
+if [ "$1" = -accel ] && [ "$2" = help ]; then printf "Accelerators supported in QEMU binary:\ntcg\n"; exit 0; fi
+sleep "${FAKE_DELAY:-0}"
+# FAKE_QMP=1 swaps in a guest that answers QMP (snapshot scenario); plain launches only need a process
+[ -n "$FAKE_QMP" ] && exec "$FAKE_PYTHON" "$(dirname "$0")/fake-qmp.py" "$@"
+exec sleep 3600
+"""
+# Serves the QMP socket from -qmp and logs its argv and every command to FAKE_QEMU_LOG (JSON lines).
+# -incoming reports 'inmigrate' for a few status queries, then 'paused', like a real restore.
+FAKE_QMP_GUEST = r"""
+import json, os, socket, subprocess, sys
+
+argv = sys.argv[1:]
+def log(entry):
+    if os.environ.get("FAKE_QEMU_LOG"):
+        with open(os.environ["FAKE_QEMU_LOG"], "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+log({"argv": argv})
+options = dict(zip(argv, argv[1:]))
+incoming = options.get("-incoming")
+if incoming and not os.path.exists(incoming[5:] if incoming.startswith("file:") else incoming.split()[-1].strip("'")):
+    sys.exit("fake qemu: incoming state not found")
+status, loading = ("inmigrate", 3) if incoming else ("running", 0)
+major, minor = (int(v) for v in os.environ.get("FAKE_QEMU_VERSION", "8.2").split(".")[:2])
+state = b"fake guest memory " * 4096
+path = options["-qmp"][len("unix:"):].split(",")[0]
+server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+server.bind(path)
+server.listen(8)
+while True:
+    conn, _ = server.accept()
+    stream = conn.makefile("rwb")
+    def send(message):
+        stream.write(json.dumps(message).encode() + b"\n")
+        stream.flush()
+    try:
+        send({"QMP": {"version": {"qemu": {"major": major, "minor": minor, "micro": 0}}, "capabilities": []}})
+    except OSError:  # a client that only probed the socket
+        conn.close()
+        continue
+    for line in stream:
+        message = json.loads(line)
+        command, arguments = message.get("execute"), message.get("arguments", {})
+        log({"qmp": command, "arguments": arguments})
+        result = {}
+        if command == "query-status":
+            if status == "inmigrate":
+                loading -= 1
+                status = "paused" if loading <= 0 else status
+            result = {"status": status, "running": status == "running"}
+        elif command in ("stop", "cont"):
+            status = "paused" if command == "stop" else "running"
+        elif command == "query-version":
+            result = {"qemu": {"major": major, "minor": minor, "micro": 0}}
+        elif command == "migrate":
+            uri = arguments["uri"]
+            if uri.startswith("file:"):
+                with open(uri[5:], "wb") as f:
+                    f.write(state)
+            else:
+                subprocess.run(uri[5:], shell=True, input=state, check=True)
+        elif command == "query-migrate":
+            result = {"status": "completed", "ram": {"total": len(state)}}
+        elif command == "human-monitor-command":
+            result = ""
+        elif command in ("query-cpus-fast", "query-blockstats"):
+            result = []
+        send({"return": result, "id": message.get("id")})
+        if command == "quit":
+            os.unlink(path)
+            sys.exit(0)
+    conn.close()
+"""
+
+
+def install_fakes(directory):
+    """Writes the stand-in binaries and puts them first on PATH"""
+    for name, script in (("docker", FAKE_DOCKER), ("qemu-img", FAKE_QEMU_IMG),
+                         ("qemu-system-x86_64", FAKE_QEMU_SYSTEM), ("fake-qmp.py", FAKE_QMP_GUEST)):
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(script)
+        os.chmod(path, 0o755)
+    os.environ["PATH"] = directory + os.pathsep + os.environ.get("PATH", "")
+    os.environ["QEMU_IMG"] = os.path.join(directory, "qemu-img")
+    os.environ["QEMU_SYSTEM"] = os.path.join(directory, "qemu-system-x86_64")
+    os.environ["FAKE_PYTHON"] = sys.executable
+
+
+# --- FAKE ENGINE SOCKET ---
+class FakeEngineHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    containers = 50
+    pull_messages = 500
+    log_lines = 200
+
+    def address_string(self):
+        return "fake-engine"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload, status=200):
+        time.sleep(self.delay)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/_ping":
+            self._send("OK")
+        elif path == "/version":
+            self._send({"Version": "24.0.0", "ApiVersion": "1.43"})
+        elif path == "/containers/json":
+            self._send([{"Id": f"{i:064x}", "Image": "nginx:latest", "Command": "nginx", "Created": 1700000000 + i,
+                         "Status": "Up 5 minutes", "State": "running", "Names": [f"/web{i}"], "Ports": []}
+                        for i in range(self.containers)])
+        elif path.startswith("/containers/") and path.endswith("/logs"):
+            self._logs()
+        elif path == "/images/json":
+            self._send([{"Id": f"sha256:{i:064x}", "RepoTags": [f"app{i}:latest"], "Created": 1700000000,
+                         "Size": 100 << 20} for i in range(self.containers)])
+        else:
+            self._send({"message": "not found"}, 404)
+
+    def _logs(self):
+        """A multiplexed log stream: stdout frames with every tenth line on stderr"""
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.multiplexed-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(self.log_lines):
+            text = f"2024-01-01T00:00:{i % 60:02d}.000000000Z line {i} GET /index.html 200\n".encode()
+            frame = bytes([2 if i % 10 == 9 else 1, 0, 0, 0]) + len(text).to_bytes(4, "big") + text
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.split("?")[0] != "/images/create":
+            return self._send({"message": "not found"}, 404)
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(self.pull_messages):
+            message = {"id": f"layer{i % 8}", "status": "Downloading",
+                       "progressDetail": {"current": i, "total": self.pull_messages}}
+            data = (json.dumps(message) + "\r\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeEngine(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128  # the log scenario connects once per container at the same moment
+
+    def __init__(self, path, delay):
+        handler = type("Handler", (FakeEngineHandler,), {"delay": delay})
+        super().__init__(path, handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+# --- MEASUREMENT ---
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def measure(operation, iterations, concurrency):
+    """Runs `operation` iterations times over `concurrency` threads: end-to-end latency and throughput"""
+    latencies = []
+
+    def timed(_):
+        started = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(iterations)))
+    elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "operations": iterations, "seconds": round(elapsed, 4),
+            "ops_per_sec": round(iterations / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3), "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "max_ms": round(max(latencies) * 1000, 3), "mean_ms": round(statistics.fmean(latencies) * 1000, 3)}
+
+
+def peak_memory(operation):
+    """Peak Python heap of one run, measured separately because tracemalloc slows everything down"""
+    already_tracing = tracemalloc.is_tracing()  # PROFILE_ACTIONS=tracemalloc keeps it running
+    if already_tracing:
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.start()
+    try:
+        operation()
+        return tracemalloc.get_traced_memory()[1] >> 10
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+
+
+def max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss >> 10 if sys.platform == "darwin" else rss  # bytes on macOS, KiB on Linux
+
+
+def drain(lines):
+    count = 0
+    for _ in lines:
+        count += 1
+    return count
+
+
+# --- SCENARIOS ---
+def scenario_docker_cli(args, workdir):
+    """`docker ps` through the CLI fallback, the path run_docker_action takes without the engine socket"""
+    import docker_engine
+    docker_engine._engine = None
+    os.environ.update(FAKE_DELAY=str(args.delay), FAKE_LINES=str(args.lines))
+    return lambda: drain(docker_engine.docker_lines("ps"))
+
+
+def scenario_command_pool(args, workdir):
+    """A burst of 20 clicks' worth of `docker ps` argv commands on the shared bounded pool, plus one cancel"""
+    from command_runner import runner, LOW, CANCELLED
+    os.environ.update(FAKE_DELAY=str(args.delay), FAKE_LINES=str(args.lines))
+
+    def run():
+        commands = [runner.submit(["docker", "ps"], label="bench ps", priority=LOW) for _ in range(20)]
+        commands[-1].cancel()
+        for command in commands:
+            command.wait(30)
+        assert len(runner._threads) <= runner.workers, len(runner._threads)
+        assert all(c.ok for c in commands[:-1]) and commands[-1].state == CANCELLED, \
+            [c.state for c in commands]
+    return run
+
+
+def scenario_docker_engine(args, workdir):
+    """`docker ps` over the engine socket (pooled keep-alive connections)"""
+    import docker_engine
+    docker_engine._engine = docker_engine.DockerEngine(os.path.join(workdir, "engine.sock"))
+    return lambda: drain(docker_engine.docker_lines("ps"))
+
+
+def scenario_pull_stream(args, workdir):
+    """A chunked pull stream with many progress messages, decoded and formatted line by line"""
+    import docker_engine
+    docker_engine._engine = docker_engine.DockerEngine(os.path.join(workdir, "engine.sock"))
+    return lambda: drain(docker_engine.docker_lines("pull", image="nginx:latest"))
+
+
+def scenario_log_heavy(args, workdir):
+    """A chatty command streamed into the bounded terminal log, as run_command_threaded does"""
+    import docker_engine
+    from terminal_log import RingLog
+    docker_engine._engine = None
+    os.environ.update(FAKE_DELAY="0", FAKE_LINES=str(args.log_lines))
+    log = RingLog(log_file=os.path.join(workdir, "terminal.log"))
+
+    def run():
+        batch = []
+        for line in docker_engine.docker_lines("ps"):
+            batch.append(line)
+            if len(batch) >= 500:
+                log.append(batch)
+                batch = []
+        log.append(batch)
+        log.take_evicted()
+    return run
+
+
+def scenario_log_follow(args, workdir):
+    """Tail every fake container at once through one LogFollower (one loop thread, one connection each)"""
+    from container_logs import LogFollower
+    containers = [f"web{i}" for i in range(FakeEngineHandler.containers)]
+    def run():
+        follower = LogFollower(os.path.join(workdir, "engine.sock"))
+        for name in containers:
+            follower.follow(name, pattern=r"GET /index", follow=False)
+        follower.wait(timeout=60)
+        lines = sum(status["buffered"] for status in follower.status())
+        follower.stop()
+        assert lines == len(containers) * FakeEngineHandler.log_lines, lines
+    return run
+
+
+def scenario_vm_launch(args, workdir):
+    """define + disk creation + QEMU spawn until the VM is RUNNING (what start_vm waits for)"""
+    from vm_registry import registry, RUNNING
+    os.environ["FAKE_DELAY"] = str(args.delay)
+    os.environ.pop("FAKE_QMP", None)
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+    launched = []
+
+    def run():
+        with lock:
+            name = f"bench{next(counter)}"
+        registry.define(name, ram="64M", cpu="1", disk_size="1G", accel="tcg",
+                        disk_path=os.path.join(workdir, f"{name}.qcow2"))
+        vm = registry.launch(name)
+        assert vm.state == RUNNING, vm.state
+        launched.append(name)
+
+    def cleanup():
+        # Stopping is not part of the measurement; the reaper's poll interval would dominate it
+        for name in launched:
+            registry.stop(name, force=True)
+        for name in launched:
+            registry.wait(name, timeout=10)
+            registry.remove(name, delete_disk=True)
+        launched.clear()
+
+    run.cleanup = cleanup
+    return run
+
+
+def scenario_vm_snapshot(args, workdir):
+    """Suspend a running VM to a RAM state file, then resume it with -incoming (save + restore round trip)"""
+    from vm_registry import registry, RUNNING
+    from vm_snapshots import SnapshotStore, FILE
+    snapshots = SnapshotStore(registry, os.path.join(workdir, "snapshots"))
+    os.environ.update(FAKE_DELAY=str(args.delay), FAKE_QMP="1", FAKE_QEMU_LOG=os.path.join(workdir, "qemu.log"))
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+    launched = []
+
+    def run():
+        with lock:
+            name = f"snap{next(counter)}"
+        registry.define(name, ram="64M", cpu="1", disk_size="1G", accel="tcg",
+                        disk_path=os.path.join(workdir, f"{name}.qcow2"))
+        registry.launch(name)
+        launched.append(name)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:  # the socket file exists a moment before QEMU listens on it
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                if probe.connect_ex(registry.get(name).qmp_socket) == 0:
+                    break
+            time.sleep(0.005)
+        snapshots.save(name, "bench", kind=FILE, stop=True)
+        registry.wait(name, timeout=10)
+        vm, _ = snapshots.restore(name)
+        assert vm.state == RUNNING and "-incoming" in vm.boot_argv(incoming="x"), vm.state
+
+    def cleanup():
+        for name in launched:
+            registry.stop(name, force=True)
+        for name in launched:
+            registry.wait(name, timeout=10)
+            snapshots.delete(name, "bench")
+            registry.remove(name, delete_disk=True)
+        launched.clear()
+
+    run.cleanup = cleanup
+    return run
+
+
+def scenario_history_query(args, workdir):
+    """slowest('pull', last 7 days) over a year of operation history (--history-rows rows, 5 kinds)"""
+    import random
+    from state_store import StateStore, INSERT_OPERATION, parse_since
+    history = StateStore(os.path.join(workdir, "history.db"))
+    conn = history._open()
+    now, rng = time.time(), random.Random(0)
+    kinds = ("pull", "build", "vm", "command", "snapshot.save")
+    rows = ((kinds[i % len(kinds)], f"image{i % 500}", "done", now - rng.random() * 365 * 86400,
+             rng.random() * 600, None) for i in range(args.history_rows))
+    conn.execute("BEGIN")
+    conn.executemany(INSERT_OPERATION, rows)
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.close()
+
+    def run():
+        since = parse_since("7d")
+        slowest = history.slowest("pull", since=since)
+        assert len(slowest) == 10 and all(op["started_at"] >= since for op in slowest), slowest
+    return run
+
+
+def scenario_startup(args, workdir):
+    """Fresh `python main.py ... --help` processes: imports and argument parsing, no menu, no Tk, no backend"""
+    commands = [["--help"], ["docker", "--help"], ["vm", "start", "--help"]]
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def run():
+        with lock:
+            command = commands[next(counter) % len(commands)]
+        subprocess.run([sys.executable, os.path.join(BASE_DIR, "main.py")] + command,
+                       stdout=subprocess.DEVNULL, check=True)
+    return run
+
+
+def scenario_cli_version(args, workdir):
+    """`python main.py docker version` end to end through the fake CLI (includes the docker backend import)"""
+    os.environ.update(FAKE_DELAY=str(args.delay))
+    return lambda: subprocess.run([sys.executable, os.path.join(BASE_DIR, "main.py"), "docker", "version"],
+                                  stdout=subprocess.DEVNULL, check=True)
+
+
+def run_suite(args):
+    workdir = tempfile.mkdtemp(prefix="cm-bench-")
+    install_fakes(workdir)
+    # Without a reachable socket every docker action takes the CLI path; engine scenarios inject their own client
+    os.environ["DOCKER_SOCKET"] = os.path.join(workdir, "missing.sock")
+    # Launches, pulls and commands are recorded; keep them out of the real data/state.db
+    os.environ["STATE_DB"] = os.path.join(workdir, "state.db")
+    # Launch benchmarks must not be throttled by the host's real capacity
+    os.environ.setdefault("CPU_OVERCOMMIT", "1000")
+    engine = FakeEngine(os.path.join(workdir, "engine.sock"), args.delay)
+    FakeEngineHandler.pull_messages = args.lines * 10
+    FakeEngineHandler.log_lines = args.lines * 4
+
+    results = {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+               "platform": sys.platform, "cpus": os.cpu_count(), "profile": os.environ.get("PROFILE_ACTIONS") or None,
+               "settings": {"delay": args.delay, "lines": args.lines, "log_lines": args.log_lines,
+                            "history_rows": args.history_rows, "iterations": args.iterations, "concurrency": args.concurrency},
+               "scenarios": {}}
+    try:
+        for name in args.scenarios:
+            operation = globals()[f"scenario_{name}"](args, workdir)
+            cleanup = getattr(operation, "cleanup", lambda: None)
+            operation()  # warm-up (imports, first connection, page cache)
+            runs = []
+            for concurrency in args.concurrency:
+                iterations = args.iterations if name not in ("log_heavy", "log_follow") else max(2, args.iterations // 10)
+                runs.append(measure(operation, iterations, concurrency))
+                cleanup()
+                print(f"{name:<14} c={concurrency:<3} {runs[-1]['ops_per_sec']:>9} ops/s  "
+                      f"p50={runs[-1]['p50_ms']}ms p95={runs[-1]['p95_ms']}ms")
+            peak = peak_memory(operation)
+            cleanup()
+            print(f"{name:<14} peak Python heap of one run: {peak} KB")
+            results["scenarios"][name] = {"description": globals()[f"scenario_{name}"].__doc__, "runs": runs,
+                                          "peak_python_kb": peak}
+            if name in STARTUP_SCENARIOS:
+                cold = min(runs, key=lambda r: r["concurrency"])["p50_ms"]
+                results["scenarios"][name]["within_budget"] = cold <= STARTUP_BUDGET_MS
+                print(f"{name:<14} cold start p50 {cold}ms (budget {STARTUP_BUDGET_MS}ms)")
+        results["max_rss_kb"] = max_rss_kb()
+    finally:
+        engine.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    if os.environ.get("PROFILE_ACTIONS"):
+        import profiling
+        results["profile_summary"] = profiling.summary()
+    return results
+
+
+def compare(current, baseline):
+    """Prints p50 and throughput changes against an earlier results file"""
+    for name, scenario in current["scenarios"].items():
+        before = {r["concurrency"]: r for r in baseline.get("scenarios", {}).get(name, {}).get("runs", [])}
+        for run in scenario["runs"]:
+            old = before.get(run["concurrency"])
+            if not old:
+                continue
+            p50 = (run["p50_ms"] - old["p50_ms"]) / max(old["p50_ms"], 1e-9)
+            ops = (run["ops_per_sec"] - old["ops_per_sec"]) / max(old["ops_per_sec"], 1e-9)
+            print(f"{name:<14} c={run['concurrency']:<3} p50 {p50:+.1%}  throughput {ops:+.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Control-plane latency/throughput benchmarks against fake docker and QEMU")
+    parser.add_argument("scenarios", nargs="*", help=f"any of: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds each fake binary/endpoint waits")
+    parser.add_argument("--lines", type=int, default=50, help="output lines per fake docker call")
+    parser.add_argument("--log-lines", type=int, default=200000, help="output lines for the log-heavy scenario")
+    parser.add_argument("--history-rows", type=int, default=1000000,
+                        help="operations seeded for the history-query scenario")
+    parser.add_argument("--profile", choices=("cprofile", "tracemalloc"),
+                        help="also profile every backend action (written to logs/profiles)")
+    parser.add_argument("-o", "--output", help="results file (default: logs/bench/bench-<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    if args.profile:
+        # Must be set before the backend modules are imported; the decorator is a no-op otherwise
+        os.environ["PROFILE_ACTIONS"] = args.profile
+
+    results = run_suite(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {output}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+    over = [n for n, s in results["scenarios"].items() if s.get("within_budget") is False]
+    if over:
+        print(f"[ERROR] Startup budget of {STARTUP_BUDGET_MS}ms exceeded: {', '.join(over)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
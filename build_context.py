@@ -0,0 +1,308 @@
+import functools
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+import docker_engine
+from command_runner import runner
+from docker_engine import DockerEngineError, format_progress
+from profiling import profiled
+from state_store import store
+
+# --- BUILD CONFIGURATION ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Build contexts the API may send to the daemon must live under this folder
+CONTEXT_DIR = os.environ.get("BUILD_CONTEXT_DIR", os.path.join(BASE_DIR, "data", "builds"))
+# Set BUILD_CACHE_DIR to export/import the layer cache to a local folder through buildx
+BUILD_CACHE_DIR = os.environ.get("BUILD_CACHE_DIR")
+
+# Rough cost model for sending the context to the daemon
+TRANSFER_BYTES_PER_SEC = 100 * 1024 * 1024
+PER_FILE_SECONDS = 0.0002
+TOP_N = 10
+# Warn when the context grew this much compared to the previous build of the same tag
+GROWTH_WARNING = 0.2
+
+
+# --- .dockerignore ---
+def _pattern_regex(pattern):
+    regex, i = "", 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[":
+            end = pattern.find("]", i)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                regex += pattern[i:end + 1].replace("[!", "[^")
+                i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    return re.compile(regex + "$")
+
+
+class DockerIgnore:
+    """.dockerignore rules: last matching pattern wins, '!' re-includes, a match on a folder covers its contents"""
+
+    def __init__(self, lines=()):
+        self.rules = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            pattern = os.path.normpath(line.lstrip("!").strip()).lstrip("/").replace(os.sep, "/")
+            self.rules.append((negate, _pattern_regex(pattern)))
+        self.has_exceptions = any(negate for negate, _ in self.rules)
+
+    @classmethod
+    def load(cls, context_dir):
+        try:
+            with open(os.path.join(context_dir, ".dockerignore"), "r") as f:
+                return cls(f.readlines())
+        except FileNotFoundError:
+            return cls()
+
+    def ignored(self, rel_path):
+        parts = rel_path.split("/")
+        prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+        result = False
+        for negate, regex in self.rules:
+            if any(regex.match(p) for p in prefixes):
+                result = not negate
+        return result
+
+
+# --- CONTEXT ANALYSIS ---
+class ContextReport:
+    def __init__(self, path):
+        self.path = path
+        self.files = []
+        self.bytes = 0
+        self.ignored_files = 0
+        self.ignored_bytes = 0
+        self.sizes = {}
+        self.dirs = {}
+        self.hints = []
+        self.scan_seconds = 0.0
+
+    @staticmethod
+    def transfer_seconds(size, count):
+        return size / TRANSFER_BYTES_PER_SEC + count * PER_FILE_SECONDS
+
+    def estimated_seconds(self):
+        return self.transfer_seconds(self.bytes, len(self.files))
+
+    def largest(self, n=TOP_N):
+        return sorted(self.sizes.items(), key=lambda kv: -kv[1])[:n]
+
+    def slowest_dirs(self, n=TOP_N):
+        ranked = sorted(self.dirs.items(), key=lambda kv: -self.transfer_seconds(*kv[1]))
+        return [(d, size, count, self.transfer_seconds(size, count)) for d, (size, count) in ranked[:n]]
+
+    def lines(self):
+        yield (f"[CONTEXT] {len(self.files)} files, {self.bytes / 1e6:.1f} MB to send "
+               f"(~{self.estimated_seconds():.2f}s); {self.ignored_files} files / "
+               f"{self.ignored_bytes / 1e6:.1f} MB skipped by .dockerignore")
+        if self.dirs:
+            yield "[CONTEXT] Slowest top-level paths:"
+            for d, size, count, seconds in self.slowest_dirs(5):
+                yield f"    {d:<40} {size / 1e6:>9.1f} MB {count:>7} files  ~{seconds:.2f}s"
+        if self.sizes:
+            yield "[CONTEXT] Largest files:"
+            for rel, size in self.largest(5):
+                yield f"    {rel:<40} {size / 1e6:>9.1f} MB"
+        for hint in self.hints:
+            yield f"[HINT] {hint}"
+
+    def as_dict(self):
+        return {"context_files": len(self.files), "context_bytes": self.bytes,
+                "ignored_files": self.ignored_files, "ignored_bytes": self.ignored_bytes,
+                "scan_seconds": round(self.scan_seconds, 4)}
+
+
+def analyze(path, dockerfile="Dockerfile"):
+    """Walks the build context honoring .dockerignore and measures what would be sent"""
+    started = time.perf_counter()
+    report = ContextReport(path)
+    rules = DockerIgnore.load(path)
+    always_sent = {dockerfile, ".dockerignore"}
+
+    for root, dirs, files in os.walk(path):
+        rel_root = os.path.relpath(root, path).replace(os.sep, "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        kept = []
+        for d in dirs:
+            rel = rel_root + d
+            if os.path.islink(os.path.join(root, d)):
+                files.append(d)  # symlinked folders are sent as links, not followed
+                continue
+            # Ignored folders are skipped entirely unless an exception could re-include something inside
+            if rules.ignored(rel) and not rules.has_exceptions:
+                size, count = _tree_size(os.path.join(root, d))
+                report.ignored_files += count
+                report.ignored_bytes += size
+            else:
+                kept.append(d)
+        dirs[:] = kept
+        for name in files:
+            rel = rel_root + name
+            try:
+                size = os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+            if rules.ignored(rel) and rel not in always_sent:
+                report.ignored_files += 1
+                report.ignored_bytes += size
+                continue
+            report.files.append(rel)
+            report.bytes += size
+            report.sizes[rel] = size
+            top = rel.split("/", 1)[0]
+            dir_size, dir_count = report.dirs.get(top, (0, 0))
+            report.dirs[top] = (dir_size + size, dir_count + 1)
+
+    report.hints = dockerfile_hints(os.path.join(path, dockerfile))
+    report.scan_seconds = time.perf_counter() - started
+    return report
+
+
+def _tree_size(path):
+    total, count = 0, 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+                count += 1
+            except OSError:
+                pass
+    return total, count
+
+
+PACKAGE_INSTALLS = re.compile(r"\b(pip3? install|apt-get install|apk add|npm (ci|install)|yarn install|go mod download)\b")
+
+
+def dockerfile_hints(dockerfile_path):
+    """Cheap checks for the usual causes of slow rebuilds"""
+    try:
+        with open(dockerfile_path, "r") as f:
+            lines = [l.strip() for l in f if l.strip() and not l.strip().startswith("#")]
+    except OSError:
+        return []
+    hints = []
+    copied_all = False
+    for line in lines:
+        upper = line.upper()
+        if upper.startswith("COPY . ") or upper.startswith("ADD . "):
+            copied_all = True
+        if upper.startswith("RUN") and PACKAGE_INSTALLS.search(line):
+            if "--mount=type=cache" not in line:
+                hints.append(f"'{line[:60]}' could use RUN --mount=type=cache,... to keep the package cache between builds")
+            if copied_all:
+                hints.append(f"'{line[:60]}' runs after copying the whole context, so any file change re-runs it")
+    return hints
+
+
+# --- BUILD ---
+@functools.lru_cache(maxsize=None)
+def buildx_available():
+    try:
+        return subprocess.run(["docker", "buildx", "version"], capture_output=True).returncode == 0
+    except OSError:
+        return False
+
+
+def buildkit_argv(path, tag, dockerfile="Dockerfile"):
+    """BuildKit build that imports the previous image's layer cache and exports its own"""
+    file_arg = ["-f", os.path.join(path, dockerfile)] if dockerfile != "Dockerfile" else []
+    if BUILD_CACHE_DIR and buildx_available():
+        return (["docker", "buildx", "build", "--load",
+                 "--cache-from", f"type=local,src={BUILD_CACHE_DIR}",
+                 "--cache-to", f"type=local,dest={BUILD_CACHE_DIR},mode=max",
+                 "-t", tag] + file_arg + [path])
+    return (["docker", "build", "--build-arg", "BUILDKIT_INLINE_CACHE=1", "--cache-from", tag,
+             "-t", tag] + file_arg + [path])
+
+
+def previous_build(tag):
+    last = store.last("build", tag, state="done")
+    if last is None:
+        return None
+    return dict(last["detail"], tag=tag, started_at=last["started_at"], duration=last["duration"])
+
+
+def record_build(record):
+    detail = {k: v for k, v in record.items() if k not in ("tag", "started_at", "duration")}
+    store.record("build", record["tag"], "done" if record["ok"] else "failed", record["started_at"],
+                 record["duration"], **detail)
+
+
+@profiled("build_lines")
+def build_lines(path, tag, dockerfile="Dockerfile"):
+    """Analyzes the context, runs a cache-aware build and records timing; yields output lines, returns True on success"""
+    path = path or "."
+    report = analyze(path, dockerfile)
+    yield from report.lines()
+
+    started = time.time()
+    ok, backend = True, "buildkit"
+    if shutil.which("docker"):
+        # BuildKit (cache mounts, cache import/export) needs the CLI's session, so it goes through docker itself
+        argv = buildkit_argv(path, tag, dockerfile)
+        yield f"> {' '.join(argv)}"
+        command = runner.start(argv, label="docker build", env=dict(os.environ, DOCKER_BUILDKIT="1"))
+        yield from command.lines()
+        ok = command.ok
+    else:
+        backend = "engine"
+        engine = docker_engine.get_engine()
+        if engine is None:
+            yield "ERR: neither the docker CLI nor the engine socket is available."
+            return False
+        try:
+            # Classic builder over the socket: send only the files that survive .dockerignore
+            for message in engine.build(path, tag, files=report.files, cache_from=[tag]):
+                line = format_progress(message)
+                if line:
+                    yield line
+                if "error" in message:
+                    ok = False
+        except (DockerEngineError, OSError) as e:
+            ok = False
+            yield f"ERR: {e}"
+
+    duration = time.time() - started
+    previous = previous_build(tag)
+    record = dict(report.as_dict(), tag=tag, path=os.path.abspath(path), backend=backend,
+                  started_at=started, duration=round(duration, 3), ok=ok)
+    record_build(record)
+    yield f"[BUILD] {'OK' if ok else 'FAILED'} in {duration:.1f}s ({backend})"
+    if previous:
+        growth = (report.bytes - previous["context_bytes"]) / max(previous["context_bytes"], 1)
+        yield (f"[BUILD] Previous build: {previous['duration']:.1f}s, context "
+               f"{previous['context_bytes'] / 1e6:.1f} MB ({growth:+.0%})")
+        if growth > GROWTH_WARNING:
+            yield "[WARN] Build context grew noticeably since the last build - check .dockerignore."
+    return ok
+
+
+if __name__ == "__main__":
+    # python build_context.py <path>  -> report only
+    for line in analyze(sys.argv[1] if len(sys.argv) > 1 else ".").lines():
+        print(line)
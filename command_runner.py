@@ -0,0 +1,462 @@
+import codecs
+import collections
+import heapq
+import io
+import itertools
+import locale
+import os
+import queue
+import selectors
+import signal
+import subprocess
+import threading
+import time
+
+# --- RUNNER CONFIGURATION ---
+# Commands run by at most this many worker threads; everything else waits in the queue
+WORKERS = int(os.environ.get("COMMAND_WORKERS", "4"))
+# Finished commands kept for status views and timing summaries
+HISTORY = 500
+# Output lines kept per command (the tail is what an error message needs)
+OUTPUT_LINES = 200
+# After SIGTERM to the process group, SIGKILL follows this many seconds later
+KILL_GRACE = 3.0
+# Lines a child wrote to stderr are tagged so the GUI terminal and the API show them as errors
+STDERR_PREFIX = "ERR: "
+# Pipes are read in chunks of this size and decoded like text-mode pipes would be
+READ_BYTES = 65536
+ENCODING = locale.getpreferredencoding(False)
+
+# --- PRIORITIES (lower runs first) ---
+HIGH = 0      # stop/cancel-like actions the user is waiting on
+NORMAL = 10
+LOW = 20      # pulls, builds and other bulk work
+
+# --- COMMAND STATES ---
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed-out"
+FINISHED = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+
+class CommandError(Exception):
+    pass
+
+
+class Command:
+    """One argv list (never a shell string) or Python callable, with its timing and exit record"""
+
+    def __init__(self, runner, target, label=None, priority=NORMAL, timeout=None, on_line=None, cwd=None, env=None):
+        self.runner = runner
+        self.id = next(runner._ids)
+        self.argv = [str(a) for a in target] if not callable(target) else None
+        self.call = target if callable(target) else None
+        self.label = label or (os.path.basename(self.argv[0]) if self.argv else getattr(target, "__name__", "call"))
+        self.priority = priority
+        self.timeout = timeout
+        self.on_line = on_line
+        self.cwd = cwd
+        self.env = env
+        self.state = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.returncode = None
+        self.result = None
+        self.error = None
+        self.output = collections.deque(maxlen=OUTPUT_LINES)
+        self.process = None
+        self.streaming = False
+        self._stop_reason = None
+        self._done = threading.Event()
+
+    @property
+    def ok(self):
+        return self.state == DONE
+
+    def seconds(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def waited(self):
+        return (self.started_at or self.finished_at or time.time()) - self.submitted_at
+
+    def tail(self, lines=5):
+        return "\n".join(list(self.output)[-lines:])
+
+    def wait(self, timeout=None):
+        """Blocks until the command has finished; returns it either way"""
+        self._done.wait(timeout)
+        return self
+
+    def cancel(self):
+        return self.runner.cancel(self)
+
+    def as_dict(self):
+        return {"id": self.id, "label": self.label, "argv": self.argv, "priority": self.priority,
+                "state": self.state, "returncode": self.returncode, "error": self.error,
+                "submitted_at": self.submitted_at, "started_at": self.started_at, "finished_at": self.finished_at,
+                "queued_seconds": round(self.waited(), 3), "run_seconds": round(self.seconds(), 3)}
+
+    # --- PROCESS ---
+    def lines(self):
+        """Starts the process on the calling thread and yields its output; stderr lines carry STDERR_PREFIX.
+
+        Stopping the iteration early kills the process group, so a caller that gives up
+        never leaves a child behind.
+        """
+        if self.process is None and not self.runner._spawn(self):
+            return
+        try:
+            for line in _read_lines(self.process):
+                self.output.append(line)
+                yield line
+            self.returncode = self.process.wait()
+        finally:
+            if self.returncode is None:
+                self.runner._signal(self, signal.SIGKILL if os.name != "nt" else None)
+                self.returncode = self.process.wait()
+                self._stop_reason = self._stop_reason or CANCELLED
+            self.process.stdout.close()
+            self.process.stderr.close()
+            self.runner._finish(self, self._stop_reason or (DONE if self.returncode == 0 else FAILED))
+
+
+def _read_lines(process):
+    """Yields the child's stdout lines and its stderr lines (tagged) as they arrive.
+
+    Both pipes are drained together, so neither can fill up and stall the child: one selector
+    on the calling thread on POSIX, a reader thread per pipe on Windows (no select() on pipes there).
+    """
+    if os.name == "nt":
+        yield from _read_lines_threaded(process)
+        return
+    decoder = codecs.getincrementaldecoder(ENCODING)
+    with selectors.DefaultSelector() as selector:
+        for pipe, prefix in ((process.stdout, ""), (process.stderr, STDERR_PREFIX)):
+            selector.register(pipe, selectors.EVENT_READ, [prefix, decoder(errors="replace"), ""])
+        while selector.get_map():
+            for key, _ in selector.select():
+                prefix, decode, partial = key.data
+                chunk = os.read(key.fd, READ_BYTES)
+                text = partial + decode.decode(chunk, final=not chunk)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    if text:
+                        yield prefix + text.rstrip("\r\n")
+                    continue
+                # Universal newlines, as text-mode pipes had; a '\r' at the end may be half of '\r\n'
+                hold = "\r" if text.endswith("\r") else ""
+                *lines, rest = text[:len(text) - len(hold)].replace("\r\n", "\n").replace("\r", "\n").split("\n")
+                key.data[2] = rest + hold
+                for line in lines:
+                    yield prefix + line
+
+
+def _read_lines_threaded(process):
+    lines = queue.Queue()
+
+    def pump(pipe, prefix):
+        try:
+            for line in io.TextIOWrapper(pipe, encoding=ENCODING, errors="replace"):
+                lines.put(prefix + line.rstrip("\n"))
+        finally:
+            lines.put(None)
+
+    for pipe, prefix in ((process.stdout, ""), (process.stderr, STDERR_PREFIX)):
+        threading.Thread(target=pump, args=(pipe, prefix), daemon=True).start()
+    open_pipes = 2
+    while open_pipes:
+        line = lines.get()
+        if line is None:
+            open_pipes -= 1
+        else:
+            yield line
+
+
+class CommandRunner:
+    """Bounded, prioritised execution of external commands and blocking backend calls.
+
+    submit() queues work for a fixed set of worker threads (the highest priority,
+    then the oldest, goes first) and returns a Command straight away. run() and
+    start() execute an argv list on the calling thread but keep the same
+    record. Every child gets its own process group, so a timeout or a cancel
+    takes down whatever the command spawned too (SIGTERM, then SIGKILL after
+    KILL_GRACE). Finished commands stay in `history` with their queue wait,
+    run time and exit code.
+    """
+
+    def __init__(self, workers=WORKERS, history=HISTORY):
+        self.workers = max(1, workers)
+        self.history = collections.deque(maxlen=history)
+        self.active = {}
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._queue = []
+        self._deadlines = {}
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._timers = threading.Condition(self._lock)
+        self._threads = []
+        self._busy = 0
+        self._watchdog = None
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """callback(Command) runs on the finishing thread once a command is done, failed or cancelled"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    # --- SUBMISSION ---
+    def submit(self, target, label=None, priority=NORMAL, timeout=None, on_line=None, cwd=None, env=None):
+        """Queues an argv list or a callable and returns its Command without waiting.
+
+        on_line(line) receives process output as it arrives, and so does every line
+        of a call that returns a generator. timeout and cancel() apply to processes
+        and to such streamed calls; a plain Python call runs to its end.
+        """
+        command = Command(self, target, label, priority, timeout, on_line, cwd, env)
+        with self._lock:
+            self.active[command.id] = command
+            heapq.heappush(self._queue, (priority, next(self._seq), command))
+            # Threads are started on demand, never more than `workers`
+            if len(self._threads) < self.workers and len(self._queue) > len(self._threads) - self._busy:
+                thread = threading.Thread(target=self._worker, name=f"command-{len(self._threads) + 1}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._work.notify()
+        return command
+
+    def start(self, argv, label=None, timeout=None, cwd=None, env=None):
+        """Spawns an argv list on the calling thread; iterate Command.lines() to read it to the end"""
+        command = Command(self, argv, label, NORMAL, timeout, None, cwd, env)
+        with self._lock:
+            self.active[command.id] = command
+        self._spawn(command)
+        return command
+
+    def run(self, argv, label=None, timeout=None, cwd=None, env=None, check=False):
+        """Runs an argv list to completion on the calling thread; check=True raises CommandError on failure"""
+        command = self.start(argv, label, timeout, cwd, env)
+        for _ in command.lines():
+            pass
+        if check and not command.ok:
+            raise CommandError(describe_failure(command))
+        return command
+
+    # --- CONTROL ---
+    def cancel(self, command):
+        """Drops a queued command, kills a running process group or stops a streamed call at its next line.
+
+        A plain Python call cannot be interrupted once it started; that returns False.
+        """
+        if isinstance(command, int):
+            command = self.active.get(command)
+        if command is None:
+            return False
+        with self._lock:
+            if command.finished_at is not None or command.state == RUNNING and command.call is not None \
+                    and not command.streaming:
+                return False
+            queued = command.state == QUEUED
+            command.state = CANCELLED if queued else command.state  # a queued one is skipped by the worker
+            command._stop_reason = CANCELLED
+        if queued:
+            self._finish(command, CANCELLED)
+        elif command.process is not None:
+            self._terminate(command)
+        return True  # picked up but not spawned yet: _spawn sees the stop reason
+
+    def cancel_all(self, label=None):
+        """Cancels every queued or running command, or only those whose label starts with `label`"""
+        return sum(self.cancel(c) for c in list(self.active.values()) if label is None or c.label.startswith(label))
+
+    # --- STATUS ---
+    def list(self, limit=50):
+        """Queued and running commands, then the most recent finished ones"""
+        with self._lock:
+            active = sorted(self.active.values(), key=lambda c: (c.state != RUNNING, c.priority, c.id))
+            recent = list(self.history)[-limit:][::-1]
+        return [c.as_dict() for c in active + recent]
+
+    def summary(self):
+        """Per-label counts, failures and run times of the finished commands"""
+        with self._lock:
+            finished = list(self.history)
+        groups = {}
+        for c in finished:
+            groups.setdefault(c.label, []).append(c)
+        result = {}
+        for label, commands in groups.items():
+            times = sorted(c.seconds() for c in commands if c.started_at is not None)
+            result[label] = {
+                "count": len(commands),
+                "failed": sum(1 for c in commands if c.state in (FAILED, TIMED_OUT)),
+                "cancelled": sum(1 for c in commands if c.state == CANCELLED),
+                "p50_seconds": round(times[len(times) // 2], 3) if times else None,
+                "max_seconds": round(times[-1], 3) if times else None,
+                "avg_queued_seconds": round(sum(c.waited() for c in commands) / len(commands), 3),
+            }
+        return result
+
+    # --- WORKERS ---
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._work.wait()
+                _, _, command = heapq.heappop(self._queue)
+                if command.state != QUEUED:
+                    continue
+                command.state = RUNNING
+                command.started_at = time.time()
+                self._busy += 1
+            try:
+                self._execute(command)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+
+    def _execute(self, command):
+        if command.call is not None:
+            try:
+                command.result = command.call()
+                if hasattr(command.result, "__next__"):
+                    self._stream(command, command.result)
+                state = command._stop_reason or DONE
+            except Exception as e:
+                command.error, state = str(e) or type(e).__name__, FAILED
+            self._finish(command, state)
+            return
+        try:
+            for line in command.lines():
+                if command.on_line is not None:
+                    command.on_line(line)
+        except OSError:
+            pass  # recorded by _spawn
+
+    def _stream(self, command, lines):
+        """A call that returned a line generator: lines go to on_line, and cancel or timeout stop it
+        at the next line (closing the generator releases whatever it holds, sockets or children)"""
+        command.streaming = True
+        if command.timeout:
+            self._schedule(command, time.monotonic() + command.timeout)
+        try:
+            for line in lines:
+                if command._stop_reason is not None:
+                    break
+                command.output.append(str(line))
+                if command.on_line is not None:
+                    command.on_line(str(line))
+        finally:
+            lines.close()
+
+    def _spawn(self, command):
+        """Starts the child in its own process group; False when the command was cancelled first"""
+        if command._stop_reason is not None:
+            self._finish(command, command._stop_reason)
+            return False
+        command.state = RUNNING
+        command.started_at = command.started_at or time.time()
+        isolate = {"start_new_session": True} if os.name != "nt" else \
+            {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        try:
+            command.process = subprocess.Popen(command.argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                               stderr=subprocess.PIPE,
+                                               cwd=command.cwd, env=command.env, **isolate)
+        except OSError as e:
+            command.error = f"Could not run {command.argv[0]}: {e.strerror or e}"
+            self._finish(command, FAILED)
+            raise
+        if command._stop_reason is not None:
+            self._terminate(command)  # cancelled while it was being spawned
+        elif command.timeout:
+            self._schedule(command, time.monotonic() + command.timeout)
+        return True
+
+    def _finish(self, command, state):
+        with self._lock:
+            if command.finished_at is not None:
+                return
+            command.state = state
+            command.finished_at = time.time()
+            if state == TIMED_OUT:
+                command.error = command.error or f"timed out after {command.timeout}s"
+            elif state == FAILED and command.error is None and command.returncode is not None:
+                command.error = f"exited with code {command.returncode}"
+            self.active.pop(command.id, None)
+            self._deadlines.pop(command, None)
+            self.history.append(command)
+        command._done.set()
+        for callback in list(self._subscribers):
+            try:
+                callback(command)
+            except Exception:
+                pass
+
+    # --- TIMEOUTS AND KILLING ---
+    def _schedule(self, command, when):
+        with self._lock:
+            self._deadlines[command] = when
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch, name="command-watchdog", daemon=True)
+                self._watchdog.start()
+            self._timers.notify()
+
+    def _watch(self):
+        """One thread for every deadline: timeouts first send SIGTERM, the grace period then SIGKILL"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                due = [c for c, when in self._deadlines.items() if when <= now]
+                for c in due:
+                    del self._deadlines[c]
+                if not due:
+                    self._timers.wait(min(self._deadlines.values(), default=now + 60) - now)
+                    continue
+            for command in due:
+                if command.finished_at is not None:
+                    continue
+                if command.process is None:
+                    command._stop_reason = command._stop_reason or TIMED_OUT  # a streamed call
+                    continue
+                if command._stop_reason is None:
+                    command._stop_reason = TIMED_OUT
+                    self._terminate(command)
+                else:
+                    self._signal(command, signal.SIGKILL if os.name != "nt" else None)
+
+    def _terminate(self, command):
+        self._signal(command, signal.SIGTERM if os.name != "nt" else None)
+        self._schedule(command, time.monotonic() + KILL_GRACE)
+
+    @staticmethod
+    def _signal(command, sig):
+        """Signals the command's whole process group (plain terminate/kill on Windows)"""
+        if command.process is None or command.process.poll() is not None:
+            return
+        try:
+            if os.name == "nt":
+                command.process.kill()
+            else:
+                os.killpg(command.process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def describe_failure(command):
+    detail = command.tail()
+    return f"{' '.join(command.argv or [command.label])} {command.error or command.state}" + \
+        (f": {detail}" if detail else "")
+
+
+# Shared by the CLI, the GUI and the API server
+runner = CommandRunner()
@@ -0,0 +1,312 @@
+import asyncio
+import collections
+import os
+import re
+import shutil
+import threading
+from urllib.parse import quote, urlencode
+
+# --- LOG CONFIGURATION ---
+# Same socket as docker_engine; read here so following logs does not load the blocking HTTP client
+DOCKER_SOCKET = os.environ.get("DOCKER_SOCKET", "/var/run/docker.sock")
+# Lines kept per container; older ones are dropped as new ones arrive
+BUFFER_LINES = 2000
+TAIL_LINES = 100
+READ_LIMIT = 1 << 20
+
+# Multiplexed stream frames: 1 byte stream type, 3 padding bytes, 4 bytes big-endian payload length
+FRAME_HEADER = 8
+STREAMS = {0: "stdin", 1: "stdout", 2: "stderr"}
+
+
+class LogStreamError(Exception):
+    pass
+
+
+class LogLine(collections.namedtuple("LogLine", "container stream time text")):
+    __slots__ = ()
+
+    def format(self, width=0):
+        return f"{self.container:<{width}} | {self.text}" if self.stream == "stdout" else \
+            f"{self.container:<{width}} ! {self.text}"
+
+
+def split_timestamp(line):
+    """'2024-01-01T10:00:00.123456789Z text' -> (timestamp, text); timestamps sort as strings"""
+    stamp, sep, text = line.partition(" ")
+    if sep and len(stamp) >= 20 and stamp[4:5] == "-" and stamp[10:11] == "T":
+        return stamp, text
+    return "", line
+
+
+# --- ENGINE STREAM (one asyncio connection per container, no threads) ---
+async def _read_headers(reader):
+    status = await reader.readline()
+    parts = status.split(None, 2)
+    if len(parts) < 2 or not parts[1].isdigit():
+        raise LogStreamError(f"Unexpected response: {status[:80]!r}")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    return int(parts[1]), headers
+
+
+async def _body(reader, headers):
+    """Yields raw body pieces, undoing chunked transfer encoding"""
+    if headers.get("transfer-encoding", "").lower() != "chunked":
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            yield data
+    while True:
+        size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            return
+        yield await reader.readexactly(size)
+        await reader.readexactly(2)
+
+
+async def engine_frames(socket_path, container, params):
+    """(stream, bytes) pieces of a container's logs; TTY containers have no frames, everything is stdout"""
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=READ_LIMIT)
+    try:
+        writer.write(f"GET /containers/{quote(container)}/logs?{urlencode(params)} HTTP/1.1\r\n"
+                     f"Host: docker\r\nAccept: application/vnd.docker.multiplexed-stream\r\n\r\n".encode())
+        await writer.drain()
+        status, headers = await _read_headers(reader)
+        body = _body(reader, headers)
+        if status >= 400:
+            message = b"".join([piece async for piece in body]).decode(errors="replace").strip()
+            raise LogStreamError(f"[{status}] {message}")
+        pending = b""
+        multiplexed = None if "multiplexed" not in headers.get("content-type", "") else True
+        async for piece in body:
+            pending += piece
+            if multiplexed is None:
+                # Older engines do not say which format they send; a frame header starts with 0/1/2 and three zeros
+                if len(pending) < FRAME_HEADER:
+                    continue
+                multiplexed = pending[0] in STREAMS and pending[1:4] == b"\x00\x00\x00"
+            if not multiplexed:
+                yield "stdout", pending
+                pending = b""
+                continue
+            while len(pending) >= FRAME_HEADER:
+                size = int.from_bytes(pending[4:8], "big")
+                if len(pending) < FRAME_HEADER + size:
+                    break
+                yield STREAMS.get(pending[0], "stdout"), pending[FRAME_HEADER:FRAME_HEADER + size]
+                pending = pending[FRAME_HEADER + size:]
+        if pending and not multiplexed:
+            yield "stdout", pending
+    finally:
+        writer.close()
+
+
+# --- FOLLOWER ---
+class Follow:
+    """One followed container: its filters, its bounded buffer and the task that feeds it"""
+
+    def __init__(self, container, pattern=None, streams=("stdout", "stderr"), buffer_lines=BUFFER_LINES):
+        self.container = container
+        self.pattern = re.compile(pattern) if pattern else None
+        self.streams = tuple(streams)
+        self.buffer = collections.deque(maxlen=buffer_lines)
+        self.state = "starting"
+        self.error = None
+        self.received = 0
+        self.task = None
+
+
+class LogFollower:
+    """Follows the logs of many containers at once on a single asyncio loop.
+
+    The loop runs on one background thread whatever the number of containers:
+    with the engine socket every container is one non-blocking connection to
+    /containers/<id>/logs (stdout and stderr arrive multiplexed on it);
+    without it, one `docker logs -f` child per container is read with asyncio
+    pipes. Filters and regex matching run in the stream, so only matching
+    lines are buffered and passed to subscribers.
+    """
+
+    def __init__(self, socket_path=None, buffer_lines=BUFFER_LINES):
+        self.socket_path = socket_path or DOCKER_SOCKET
+        self.buffer_lines = buffer_lines
+        self.follows = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def subscribe(self, callback):
+        """callback(LogLine) runs on the log thread for every line that passes its container's filters"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    # --- LOOP ---
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="container-logs", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        for name in list(self.follows):
+            self.unfollow(name)
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = self._thread = None
+
+    # --- CONTROL (thread-safe) ---
+    def follow(self, container, pattern=None, streams=("stdout", "stderr"), tail=TAIL_LINES, follow=True):
+        """Starts streaming one container; an existing follow of the same container is replaced"""
+        self.start()
+        entry = Follow(container, pattern, streams, self.buffer_lines)  # compiles the pattern (re.error) here
+        with self._lock:
+            previous = self.follows.get(container)
+            self.follows[container] = entry
+
+        def spawn():
+            if previous and previous.task:
+                previous.task.cancel()
+            entry.task = self._loop.create_task(self._run(entry, tail, follow))
+        self._loop.call_soon_threadsafe(spawn)
+        return entry
+
+    def unfollow(self, container):
+        with self._lock:
+            entry = self.follows.pop(container, None)
+        if entry and self._loop is not None:
+            self._loop.call_soon_threadsafe(lambda: entry.task and entry.task.cancel())
+        return entry is not None
+
+    def wait(self, timeout=None):
+        """Blocks until every non-following stream has ended (tail-only reads)"""
+        async def gather():
+            tasks = [e.task for e in list(self.follows.values()) if e.task]
+            if tasks:
+                await asyncio.wait(tasks)
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), self._loop).result(timeout)  # let pending spawns run
+        asyncio.run_coroutine_threadsafe(gather(), self._loop).result(timeout)
+
+    # --- READS (buffers only, never the daemon) ---
+    def lines(self, container=None, pattern=None, limit=None):
+        """Buffered lines of one container, or of all of them merged by timestamp"""
+        with self._lock:
+            entries = [self.follows[container]] if container in self.follows else \
+                ([] if container else list(self.follows.values()))
+            lines = [line for e in entries for line in list(e.buffer)]
+        if container is None:
+            lines.sort(key=lambda line: line.time)
+        if pattern:
+            regex = re.compile(pattern)
+            lines = [line for line in lines if regex.search(line.text)]
+        return lines[-limit:] if limit else lines
+
+    def status(self):
+        with self._lock:
+            return [{"container": e.container, "state": e.state, "buffered": len(e.buffer), "received": e.received,
+                     "pattern": e.pattern.pattern if e.pattern else None, "error": e.error}
+                    for e in self.follows.values()]
+
+    # --- STREAMING ---
+    async def _run(self, entry, tail, follow):
+        params = {"follow": int(follow), "stdout": int("stdout" in entry.streams),
+                  "stderr": int("stderr" in entry.streams), "timestamps": 1, "tail": tail if tail is not None else "all"}
+        entry.state = "following" if follow else "reading"
+        try:
+            if os.path.exists(self.socket_path):
+                await self._pump(entry, engine_frames(self.socket_path, entry.container, params))
+            else:
+                await self._pump(entry, self._cli_frames(entry, params))
+            entry.state = "ended"
+        except asyncio.CancelledError:
+            entry.state = "stopped"
+            raise
+        except (LogStreamError, OSError, asyncio.IncompleteReadError, ValueError) as e:
+            entry.state, entry.error = "failed", str(e) or type(e).__name__
+
+    async def _pump(self, entry, frames):
+        partial = {"stdout": "", "stderr": ""}
+        try:
+            async for stream, data in frames:
+                text = partial.get(stream, "") + data.decode(errors="replace")
+                *complete, partial[stream] = text.split("\n")
+                for raw in complete:
+                    self._deliver(entry, stream, raw)
+        finally:
+            await frames.aclose()  # closes the socket or kills the child right away, also on cancel
+        for stream, rest in partial.items():
+            if rest:
+                self._deliver(entry, stream, rest)
+
+    def _deliver(self, entry, stream, raw):
+        entry.received += 1
+        if stream not in entry.streams:
+            return
+        stamp, text = split_timestamp(raw.rstrip("\r"))
+        if entry.pattern is not None and not entry.pattern.search(text):
+            return
+        line = LogLine(entry.container, stream, stamp, text)
+        entry.buffer.append(line)
+        for callback in list(self._subscribers):
+            try:
+                callback(line)
+            except Exception:
+                pass
+
+    async def _cli_frames(self, entry, params):
+        """Fallback: `docker logs` child process, both pipes read on the loop"""
+        docker = shutil.which("docker")
+        if docker is None:
+            raise LogStreamError("docker CLI not found and the engine socket is not reachable")
+        argv = [docker, "logs", "--timestamps", "--tail", str(params["tail"])]
+        if params["follow"]:
+            argv.append("--follow")
+        process = await asyncio.create_subprocess_exec(
+            *argv, entry.container, limit=READ_LIMIT, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if params["stdout"] else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE if params["stderr"] else asyncio.subprocess.DEVNULL)
+        queue = asyncio.Queue()
+
+        async def read(pipe, stream):
+            while True:
+                data = await pipe.read(65536)
+                if not data:
+                    break
+                await queue.put((stream, data))
+            await queue.put(None)
+
+        readers = [asyncio.ensure_future(read(pipe, stream))
+                   for pipe, stream in ((process.stdout, "stdout"), (process.stderr, "stderr")) if pipe]
+        try:
+            open_pipes = len(readers)
+            while open_pipes:
+                item = await queue.get()
+                if item is None:
+                    open_pipes -= 1
+                    continue
+                yield item
+            if await process.wait() != 0:
+                raise LogStreamError(f"docker logs exited with code {process.returncode}")
+        finally:
+            for reader in readers:
+                reader.cancel()
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+
+# Shared by the CLI menu and the GUI terminal pane
+follower = LogFollower()
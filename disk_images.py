@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from command_runner import runner
+
+# --- CONFIGURATION PATHS ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DISK_DIR = os.path.join(BASE_DIR, "data", "disks")
+INDEX_FILE = os.path.join(DISK_DIR, "index.json")
+QEMU_IMG = os.environ.get("QEMU_IMG", "qemu-img")
+IMAGE_EXTENSIONS = (".img", ".qcow2", ".raw")
+COMPACT_WORKERS = min(4, os.cpu_count() or 1)
+# Unallocated runs at least this long are left as holes when an image is rewritten
+SPARSE_SIZE = "64k"
+
+QCOW2_MAGIC = b"QFI\xfb"
+# magic, version, backing_file_offset, backing_file_size, cluster_bits, size, crypt_method,
+# l1_size, l1_table_offset, refcount_table_offset, refcount_table_clusters, nb_snapshots, snapshots_offset
+QCOW2_HEADER = struct.Struct(">4sIQIIQIIQQIIQ")
+QCOW2_V3_HEADER = struct.Struct(">QQQII")  # incompatible/compatible/autoclear features, refcount_order, header_length
+QCOW2_DIRTY = 1
+# l1_table_offset, l1_size, id_str_size, name_size, date_sec, date_nsec, vm_clock_nsec, vm_state_size, extra_data_size
+QCOW2_SNAPSHOT = struct.Struct(">QIHHIIQII")
+
+
+class DiskImageError(Exception):
+    pass
+
+
+# --- INSPECTION (pure Python, no qemu-img) ---
+def read_qcow2_header(path):
+    """Parses the fixed qcow2 header; returns None for anything that is not qcow2"""
+    with open(path, "rb") as f:
+        head = f.read(QCOW2_HEADER.size + QCOW2_V3_HEADER.size)
+        if len(head) < QCOW2_HEADER.size or not head.startswith(QCOW2_MAGIC):
+            return None
+        (_, version, backing_offset, backing_size, cluster_bits, size, crypt_method,
+         _, _, _, _, nb_snapshots, _) = QCOW2_HEADER.unpack_from(head)
+        header = {"version": version, "virtual_size": size, "cluster_size": 1 << cluster_bits,
+                  "encrypted": crypt_method != 0, "snapshots": nb_snapshots, "dirty": False, "backing_file": None}
+        if version >= 3 and len(head) >= QCOW2_HEADER.size + QCOW2_V3_HEADER.size:
+            incompatible = QCOW2_V3_HEADER.unpack_from(head, QCOW2_HEADER.size)[0]
+            header["dirty"] = bool(incompatible & QCOW2_DIRTY)
+        if backing_offset and backing_size:
+            f.seek(backing_offset)
+            header["backing_file"] = f.read(backing_size).decode("utf-8", "replace")
+    return header
+
+
+def read_qcow2_snapshots(path):
+    """Internal snapshots from the qcow2 snapshot table: [{id, tag, created, vm_state_size, vm_clock}]"""
+    with open(path, "rb") as f:
+        head = f.read(QCOW2_HEADER.size)
+        if len(head) < QCOW2_HEADER.size or not head.startswith(QCOW2_MAGIC):
+            return []
+        fields = QCOW2_HEADER.unpack(head)
+        count, offset = fields[11], fields[12]
+        snapshots = []
+        f.seek(offset)
+        for _ in range(count):
+            entry = f.read(QCOW2_SNAPSHOT.size)
+            if len(entry) < QCOW2_SNAPSHOT.size:
+                break
+            (_, _, id_size, name_size, date_sec, _, vm_clock, vm_state_size,
+             extra_size) = QCOW2_SNAPSHOT.unpack(entry)
+            extra = f.read(extra_size)
+            if extra_size >= 8:
+                vm_state_size = struct.unpack_from(">Q", extra)[0]  # the 32-bit field overflows past 4 GB
+            snapshot_id = f.read(id_size).decode("utf-8", "replace")
+            tag = f.read(name_size).decode("utf-8", "replace")
+            used = QCOW2_SNAPSHOT.size + extra_size + id_size + name_size
+            f.seek(-used % 8, os.SEEK_CUR)  # entries are padded to 8 bytes
+            snapshots.append({"id": snapshot_id, "tag": tag, "created": date_sec,
+                              "vm_state_size": vm_state_size, "vm_clock": vm_clock / 1e9})
+    return snapshots
+
+
+def image_info(path):
+    """Virtual size vs what the image really occupies on the host (st_blocks, so holes are not counted)"""
+    st = os.stat(path)
+    info = {"path": os.path.abspath(path), "format": "raw", "virtual_size": st.st_size,
+            "allocated": getattr(st, "st_blocks", 0) * 512 or st.st_size, "file_size": st.st_size,
+            "mtime_ns": st.st_mtime_ns, "backing_file": None, "snapshots": 0, "dirty": False}
+    header = read_qcow2_header(path)
+    if header:
+        info.update(header, format="qcow2")
+    return info
+
+
+def human_size(value):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(value) < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}TB"
+
+
+# --- INDEX ---
+class DiskIndex:
+    """Cached usage figures for every image under data/disks.
+
+    Stored in index.json and refreshed incrementally: a file is only re-read
+    when its mtime or size changed since the last scan.
+    """
+
+    def __init__(self, index_file=INDEX_FILE, disk_dir=DISK_DIR):
+        self.index_file = index_file
+        self.disk_dir = disk_dir
+        self.entries = {}
+        self.scanned_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_file, "r") as f:
+                self.entries = json.load(f).get("images", {})
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmp = self.index_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"images": self.entries}, f, indent=4)
+        os.replace(tmp, self.index_file)
+
+    def scan_paths(self):
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(IMAGE_EXTENSIONS):
+                    yield os.path.abspath(os.path.join(root, name))
+
+    def refresh(self):
+        """Re-reads changed images, drops deleted ones; returns the number of entries that changed"""
+        changed = 0
+        with self._lock:
+            seen = set()
+            for path in self.scan_paths():
+                seen.add(path)
+                try:
+                    st = os.stat(path)
+                    entry = self.entries.get(path)
+                    if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["file_size"] == st.st_size:
+                        continue
+                    self.entries[path] = image_info(path)
+                    changed += 1
+                except OSError:
+                    continue
+            for path in [p for p in self.entries if p not in seen]:
+                del self.entries[path]
+                changed += 1
+            if changed:
+                self.save()
+            self.scanned_at = time.time()
+        return changed
+
+    def refresh_async(self):
+        """Starts a background refresh unless one is already running (used by the GUI timer)"""
+        if self._refresh_thread is None or not self._refresh_thread.is_alive():
+            self._refresh_thread = threading.Thread(target=self.refresh, name="disk-index", daemon=True)
+            self._refresh_thread.start()
+
+    def list(self):
+        with self._lock:
+            return sorted(self.entries.values(), key=lambda e: -e["allocated"])
+
+    def summary(self):
+        with self._lock:
+            entries = list(self.entries.values())
+        return {"images": len(entries), "allocated": sum(e["allocated"] for e in entries),
+                "virtual_size": sum(e["virtual_size"] for e in entries),
+                "dirty": sum(1 for e in entries if e.get("dirty"))}
+
+
+# --- COMPACTION ---
+def rewrite_argv(info, target, compress):
+    """qemu-img convert that drops zeroed/discarded clusters and keeps the backing chain of overlays"""
+    argv = [QEMU_IMG, "convert", "-O", info["format"], "-S", SPARSE_SIZE]
+    if compress and info["format"] == "qcow2":
+        argv.append("-c")
+    if info.get("backing_file"):
+        backing = info["backing_file"]
+        resolved = os.path.join(os.path.dirname(info["path"]), backing)  # relative names are relative to the overlay
+        backing_format = "raw" if os.path.exists(resolved) and not read_qcow2_header(resolved) else "qcow2"
+        argv += ["-B", backing, "-F", backing_format]
+    return argv + [info["path"], target]
+
+
+def rewrite_image(path, compress=True):
+    """Rewrites one image in place.
+
+    compress=True is the compaction pass (qcow2 compressed clusters); False is
+    the trim pass, which only drops zeroed and guest-discarded clusters. QEMU's
+    image lock makes qemu-img fail on images a running VM holds.
+    Returns bytes saved on the host.
+    """
+    info = image_info(path)
+    if info["dirty"]:
+        raise DiskImageError(f"{path} was not closed cleanly; run 'qemu-img check -r all' first")
+    if info["snapshots"] and info["format"] == "qcow2":
+        raise DiskImageError(f"{path} has internal snapshots, which convert would drop")
+    target = path + ".rewrite.tmp"
+    command = runner.run(rewrite_argv(info, target, compress), label="qemu-img convert")
+    if not command.ok or not os.path.exists(target):
+        if os.path.exists(target):
+            os.remove(target)
+        raise DiskImageError(f"qemu-img failed on {path}: {command.tail()}")
+    shutil.copymode(path, target)
+    saved = info["allocated"] - image_info(target)["allocated"]
+    if saved <= 0:
+        os.remove(target)  # nothing to gain, keep the original untouched
+        return 0
+    os.replace(target, path)
+    return saved
+
+
+def rewrite_images(paths, compress=True, in_use=(), workers=COMPACT_WORKERS):
+    """Rewrites many images in a worker pool; returns {path: (ok, bytes saved or error message)}"""
+    busy = {os.path.abspath(p) for p in in_use}
+    results = {}
+
+    def task(path):
+        if path in busy:
+            return path, (False, "in use by a running VM")
+        try:
+            return path, (True, rewrite_image(path, compress))
+        except (DiskImageError, OSError) as e:
+            return path, (False, str(e))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, outcome in pool.map(task, [os.path.abspath(p) for p in paths]):
+            results[path] = outcome
+    return results
+
+
+# Shared by the GUI card, the API and the CLI below
+index = DiskIndex()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report and compact the VM disk images in data/disks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="allocated vs virtual size of every image")
+    for name, text in (("compact", "rewrite with compressed clusters"), ("trim", "rewrite dropping zeroed clusters")):
+        cmd = sub.add_parser(name, help=text)
+        cmd.add_argument("paths", nargs="*", help="images to process (default: every image except templates)")
+        cmd.add_argument("-j", "--jobs", type=int, default=COMPACT_WORKERS)
+    args = parser.parse_args()
+
+    index.refresh()
+    if args.command == "list":
+        for e in index.list():
+            flags = " dirty" if e.get("dirty") else ""
+            backing = f"  <- {os.path.basename(e['backing_file'])}" if e.get("backing_file") else ""
+            print(f"{os.path.relpath(e['path'], DISK_DIR):<40} {e['format']:<6} {human_size(e['allocated']):>10} "
+                  f"/ {human_size(e['virtual_size']):>10}{flags}{backing}")
+        s = index.summary()
+        print(f"{s['images']} images, {human_size(s['allocated'])} allocated of {human_size(s['virtual_size'])} virtual")
+    else:
+        template_dir = os.path.join(DISK_DIR, "templates")
+        # Templates back live overlays; they are only rewritten when named explicitly
+        paths = args.paths or [e["path"] for e in index.list() if not e["path"].startswith(template_dir + os.sep)]
+        started = time.time()
+        results = rewrite_images(paths, compress=args.command == "compact", workers=args.jobs)
+        for path, (ok, detail) in results.items():
+            print(f"{path}: saved {human_size(detail)}" if ok else f"[ERROR] {path}: {detail}")
+        total = sum(d for ok, d in results.values() if ok)
+        print(f"{args.command}: {len(results)} images, {human_size(total)} reclaimed in {time.time() - started:.1f}s")
+        index.refresh()
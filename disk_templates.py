@@ -0,0 +1,210 @@
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from command_runner import runner
+from disk_images import read_qcow2_header
+from state_store import store
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+# --- CONFIGURATION PATHS ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DISK_DIR = os.path.join(BASE_DIR, "data", "disks")
+TEMPLATE_DIR = os.path.join(DISK_DIR, "templates")
+CATALOG_FILE = os.path.join(DISK_DIR, "templates.json")
+QEMU_IMG = os.environ.get("QEMU_IMG", "qemu-img")
+# gc() leaves overlays younger than this alone: a launch may have created one and not recorded its VM yet
+GC_GRACE = 600
+
+
+class TemplateError(Exception):
+    pass
+
+
+class TemplateCatalog:
+    """Golden base images plus the thin qcow2 overlays created on top of them.
+
+    A template's reference count is the number of overlays that point at it;
+    a template cannot be removed while anything still references it. The GUI,
+    the API server and the CLI share templates.json, so every change re-reads
+    it under an exclusive file lock before writing it back.
+    """
+
+    def __init__(self, catalog_file=CATALOG_FILE, template_dir=TEMPLATE_DIR):
+        self.catalog_file = catalog_file
+        self.template_dir = template_dir
+        self._lock = threading.Lock()
+        self.templates = {}
+        self.overlays = {}
+        self.load()
+
+    # --- PERSISTENCE ---
+    def load(self):
+        try:
+            with open(self.catalog_file, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        self.templates = data.get("templates", {})
+        self.overlays = data.get("overlays", {})
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.catalog_file), exist_ok=True)
+            with open(self.catalog_file + ".lock", "a") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file is closed
+                self.load()
+                yield
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.catalog_file), exist_ok=True)
+        tmp = self.catalog_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"templates": self.templates, "overlays": self.overlays}, f, indent=4)
+        os.replace(tmp, self.catalog_file)
+
+    # --- TEMPLATES ---
+    def add(self, name, image_path, copy=False):
+        """Registers a base image, moving it into the templates folder (or copying it, reflinked when the
+        filesystem can). Never a hard link: the original name would stay a writable path to the base."""
+        if not os.path.exists(image_path):
+            raise TemplateError(f"Base image not found: {image_path}")
+        os.makedirs(self.template_dir, exist_ok=True)
+        # Overlays name the backing format explicitly, so a raw base must be registered as raw
+        try:
+            image_format = "qcow2" if read_qcow2_header(image_path) else "raw"
+        except OSError as e:
+            raise TemplateError(f"Cannot read base image {image_path}: {e}")
+        target = os.path.join(self.template_dir, f"{name}.{image_format}")
+        with self._locked():
+            if name in self.templates:
+                raise TemplateError(f"Template '{name}' already exists")
+            if os.path.abspath(image_path) != os.path.abspath(target):
+                if copy:
+                    self._copy(image_path, target)
+                else:
+                    shutil.move(image_path, target)  # a copy and delete across filesystems
+            # Overlays only stay valid while the base never changes
+            os.chmod(target, 0o444)
+            self.templates[name] = {"path": target, "format": image_format, "created": time.time()}
+            self.save()
+        return target
+
+    @staticmethod
+    def _copy(source, target):
+        # cp shares the blocks on btrfs/XFS (instant, no extra space) and copies everywhere else
+        if shutil.which("cp") and runner.run(["cp", "--reflink=auto", source, target], label="cp").ok:
+            return
+        shutil.copyfile(source, target)
+
+    def remove(self, name):
+        with self._locked():
+            template = self._template(name)
+            if self.refcount(name):
+                raise TemplateError(f"Template '{name}' is still used by {self.refcount(name)} overlay(s)")
+            os.chmod(template["path"], 0o644)
+            os.remove(template["path"])
+            del self.templates[name]
+            self.save()
+
+    def _template(self, name):
+        if name not in self.templates:
+            raise TemplateError(f"No template named '{name}'")
+        return self.templates[name]
+
+    def refcount(self, name):
+        return sum(1 for t in self.overlays.values() if t == name)
+
+    def list(self):
+        self.load()
+        return [{"name": n, "path": t["path"], "refs": self.refcount(n)} for n, t in self.templates.items()]
+
+    # --- OVERLAYS ---
+    def create_overlay(self, name, overlay_path, size=None):
+        """Creates a copy-on-write qcow2 overlay backed by a template (takes milliseconds)"""
+        with self._locked():
+            template = self._template(name)
+            if os.path.exists(overlay_path):
+                raise TemplateError(f"Disk already exists: {overlay_path}")
+            os.makedirs(os.path.dirname(overlay_path), exist_ok=True)
+            argv = [QEMU_IMG, "create", "-f", "qcow2", "-b", template["path"], "-F", template["format"], overlay_path]
+            if size:
+                argv.append(size)
+            command = runner.run(argv, label="qemu-img create")
+            if not command.ok:
+                raise TemplateError(f"Error creating overlay: {command.tail()}")
+            self.overlays[os.path.abspath(overlay_path)] = name
+            self.save()
+        return overlay_path
+
+    def release(self, overlay_path, delete=True):
+        """Drops one reference, deleting the overlay file"""
+        with self._locked():
+            overlay_path = os.path.abspath(overlay_path)
+            self.overlays.pop(overlay_path, None)
+            if delete and os.path.exists(overlay_path):
+                os.remove(overlay_path)
+            self.save()
+
+    def gc(self, in_use=(), grace=GC_GRACE):
+        """Deletes overlays no VM uses any more and forgets ones already gone from disk.
+
+        An overlay is in use while any VM recorded in the state store points at it, whatever its state
+        (a stopped VM keeps its disk) and whichever process manages it; in_use adds disks of VMs that
+        are defined but not recorded yet.
+        """
+        used = {os.path.abspath(w["settings"]["disk_path"]) for w in store.workloads("vm")
+                if w["settings"].get("disk_path")}
+        used |= {os.path.abspath(p) for p in in_use}
+        removed = []
+        with self._locked():
+            for path in list(self.overlays):
+                if os.path.exists(path):
+                    if path in used or time.time() - os.path.getmtime(path) < grace:
+                        continue
+                    os.remove(path)
+                del self.overlays[path]
+                removed.append(path)
+            self.save()
+        return removed
+
+
+# Shared by the registry, the CLI menu and the GUI
+catalog = TemplateCatalog()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage qcow2 base-image templates")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    add = sub.add_parser("add")
+    add.add_argument("name")
+    add.add_argument("image")
+    add.add_argument("--copy", action="store_true", help="keep the image where it is and store a (reflink) copy")
+    rm = sub.add_parser("remove")
+    rm.add_argument("name")
+    sub.add_parser("gc", help="delete overlays that no recorded VM uses and forget ones already deleted")
+    args = parser.parse_args()
+    try:
+        if args.command == "list":
+            for t in catalog.list():
+                print(f"{t['name']:<20} refs={t['refs']:<4} {t['path']}")
+        elif args.command == "add":
+            print(f"Template stored at {catalog.add(args.name, args.image, copy=args.copy)}")
+        elif args.command == "remove":
+            catalog.remove(args.name)
+        elif args.command == "gc":
+            for path in catalog.gc():
+                print(f"Removed {path}")
+    except TemplateError as e:
+        print(f"[ERROR] {e}")
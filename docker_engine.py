@@ -0,0 +1,418 @@
+import http.client
+import json
+import os
+import queue
+import socket
+import threading
+from urllib.parse import urlencode, quote
+
+from command_runner import runner
+from profiling import profiled
+
+# --- ENGINE CONFIGURATION ---
+# The socket can be pointed somewhere else (e.g. a fake server) with DOCKER_SOCKET
+DOCKER_SOCKET = os.environ.get("DOCKER_SOCKET", "/var/run/docker.sock")
+POOL_SIZE = 4
+TIMEOUT = 30
+IDEMPOTENT = ("GET", "HEAD")
+
+
+class DockerEngineError(Exception):
+    """Raised when the engine answers with an error status"""
+    def __init__(self, status, message):
+        super().__init__(f"[{status}] {message}")
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that talks to a Unix domain socket instead of TCP"""
+    def __init__(self, socket_path, timeout=TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerEngine:
+    """Small Docker Engine API client with a pool of keep-alive connections"""
+
+    def __init__(self, socket_path=DOCKER_SOCKET, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    # --- CONNECTION POOL ---
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _send(self, method, path, params=None, body=None, headers=None):
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        conn = self._acquire()
+        sent = False
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            sent = True
+            resp = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # A pooled connection may have been closed by the daemon; retry once on a fresh one.
+            # A POST/DELETE that went out may already have run (a container created or stopped), so only
+            # reads, or requests that never got fully written, are sent again
+            conn.close()
+            if sent and method not in IDEMPOTENT:
+                raise
+            if hasattr(body, "seek"):
+                body.seek(0)
+            conn = UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except Exception:
+                conn.close()
+                raise
+        return conn, resp
+
+    def _finish(self, conn, resp):
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+    @staticmethod
+    def _raise_for(resp, data):
+        if resp.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode(errors="replace").strip()
+            raise DockerEngineError(resp.status, message or resp.reason)
+
+    def request(self, method, path, params=None, body=None, headers=None):
+        """Sends a request and returns the decoded JSON body (or None when empty)"""
+        conn, resp = self._send(method, path, params, body, headers)
+        try:
+            data = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        self._finish(conn, resp)
+        self._raise_for(resp, data)
+        if not data:
+            return None
+        if resp.getheader("Content-Type", "").startswith("application/json"):
+            return json.loads(data)
+        return data.decode(errors="replace")
+
+    def stream(self, method, path, params=None, body=None, headers=None):
+        """Sends a request and yields each JSON message of a streaming response"""
+        conn, resp = self._send(method, path, params, body, headers)
+        if resp.status >= 400:
+            data = resp.read()
+            self._finish(conn, resp)
+            self._raise_for(resp, data)
+        completed = False
+        try:
+            while True:
+                line = resp.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+            completed = True
+        finally:
+            # A half-read stream cannot be reused, so only finished ones go back to the pool
+            if completed:
+                self._finish(conn, resp)
+            else:
+                conn.close()
+
+    def events(self, since=None, filters=None):
+        """Yields engine events as they happen.
+
+        The stream can stay idle for a long time, so it uses its own connection without a read timeout.
+        """
+        params = {}
+        if since is not None:
+            params["since"] = str(since)
+        if filters:
+            params["filters"] = json.dumps(filters)
+        conn = UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            conn.request("GET", f"/events?{urlencode(params)}" if params else "/events")
+            resp = conn.getresponse()
+            if resp.status >= 400:
+                self._raise_for(resp, resp.read())
+            while True:
+                line = resp.readline()
+                if not line:
+                    break
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+    # --- API CALLS ---
+    def ping(self):
+        try:
+            return self.request("GET", "/_ping") == "OK"
+        except (OSError, http.client.HTTPException, DockerEngineError):
+            return False
+
+    def version(self):
+        return self.request("GET", "/version")
+
+    def images(self):
+        return self.request("GET", "/images/json")
+
+    def ps(self, all=True):
+        return self.request("GET", "/containers/json", {"all": "1" if all else "0"})
+
+    def stop(self, container_id):
+        try:
+            self.request("POST", f"/containers/{quote(container_id)}/stop")
+        except DockerEngineError as e:
+            if e.status != 304:  # 304 means it was already stopped
+                raise
+
+    def search(self, term):
+        return self.request("GET", "/images/search", {"term": term})
+
+    def pull(self, image):
+        name, tag = split_image(image)
+        return self.stream("POST", "/images/create", {"fromImage": name, "tag": tag})
+
+    def build(self, path, tag, files=None, cache_from=None):
+        """Streams a classic-builder build; `files` limits the context to those relative paths"""
+        context = tar_context(path, files)
+        headers = {"Content-Type": "application/x-tar",
+                   "Content-Length": str(os.fstat(context.fileno()).st_size)}
+        params = {"t": tag, "rm": "1"}
+        if cache_from:
+            params["cachefrom"] = json.dumps(list(cache_from))
+        try:
+            yield from self.stream("POST", "/build", params, body=context, headers=headers)
+        finally:
+            context.close()
+
+    def create(self, image, name=None):
+        params = {"name": name} if name else None
+        return self.request("POST", "/containers/create", params, body={"Image": image})
+
+    def start(self, container_id):
+        self.request("POST", f"/containers/{quote(container_id)}/start")
+
+    def run(self, image, name=None):
+        """Same as `docker run -d`: pulls the image if missing, creates and starts it"""
+        try:
+            created = self.create(image, name)
+        except DockerEngineError as e:
+            if e.status != 404:
+                raise
+            for message in self.pull(image):
+                # The engine reports a failed pull inside a 200 stream, not with the status code
+                if "error" in message:
+                    raise DockerEngineError((message.get("errorDetail") or {}).get("code") or 500, message["error"])
+            created = self.create(image, name)
+        self.start(created["Id"])
+        return created["Id"]
+
+
+# --- HELPERS ---
+def split_image(image):
+    """Splits 'repo:tag' into (repo, tag) without breaking on registry ports"""
+    if "@" in image:
+        return image, ""
+    name, _, tag = image.rpartition(":")
+    if not name or "/" in tag:
+        return image, "latest"
+    return name, tag
+
+
+def tar_context(path, files=None):
+    """Packs a build context (everything, or only the given relative paths) into a temporary tar file"""
+    import tarfile
+    import tempfile
+    context = tempfile.TemporaryFile()
+    with tarfile.open(fileobj=context, mode="w") as tar:
+        if files is None:
+            tar.add(path, arcname=".")
+        else:
+            for rel in files:
+                tar.add(os.path.join(path, rel), arcname=rel, recursive=False)
+    context.seek(0)
+    return context
+
+
+def format_images(images):
+    lines = [f"{'REPOSITORY':<30} {'TAG':<15} {'IMAGE ID':<14} {'SIZE':>10}"]
+    for img in images:
+        image_id = img["Id"].split(":")[-1][:12]
+        size = f"{img.get('Size', 0) / 1e6:.1f}MB"
+        for ref in img.get("RepoTags") or ["<none>:<none>"]:
+            repo, _, tag = ref.rpartition(":")
+            lines.append(f"{repo:<30} {tag:<15} {image_id:<14} {size:>10}")
+    return lines
+
+
+def format_containers(containers):
+    lines = [f"{'CONTAINER ID':<14} {'IMAGE':<25} {'STATUS':<25} NAMES"]
+    for c in containers:
+        names = ",".join(n.lstrip("/") for n in c.get("Names", []))
+        lines.append(f"{c['Id'][:12]:<14} {c.get('Image', ''):<25} {c.get('Status', ''):<25} {names}")
+    return lines
+
+
+def format_progress(message):
+    """Turns one pull/build stream message into a printable line (or None)"""
+    if "error" in message:
+        return f"ERR: {message['error']}"
+    if "stream" in message:
+        return message["stream"].rstrip("\n") or None
+    status = message.get("status")
+    if not status:
+        return None
+    prefix = f"{message['id']}: " if message.get("id") else ""
+    return prefix + " ".join(p for p in (status, message.get("progress")) if p)
+
+
+# --- SHARED ENGINE + CLI FALLBACK ---
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Returns the shared engine client, or None when the socket is not reachable.
+
+    The socket is checked on every call, so callers fall back to the CLI once the daemon goes away.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is not None and not os.path.exists(_engine.socket_path):
+            _engine.close()
+            _engine = None
+        if _engine is None:
+            engine = DockerEngine()
+            if not os.path.exists(engine.socket_path) or not engine.ping():
+                return None
+            _engine = engine
+        return _engine
+
+
+def drop_engine(engine):
+    """Forgets the shared client after its connection failed; the next get_engine() pings again"""
+    global _engine
+    with _engine_lock:
+        if _engine is engine:
+            _engine.close()
+            _engine = None
+
+
+def cli_command(action, **kwargs):
+    """The equivalent `docker` CLI invocation for an action"""
+    if action == "version":
+        return ["docker", "--version"]
+    if action == "ps":
+        return ["docker", "ps", "-a"]
+    if action == "images":
+        return ["docker", "images"]
+    if action == "stop":
+        return ["docker", "stop", kwargs["container"]]
+    if action == "search":
+        return ["docker", "search", kwargs["term"]]
+    if action == "pull":
+        return ["docker", "pull", kwargs["image"]]
+    if action == "build":
+        return ["docker", "build", "-t", kwargs["tag"], kwargs.get("path", ".")]
+    if action == "run":
+        name = kwargs.get("name")
+        return ["docker", "run", "-d"] + (["--name", name] if name else []) + [kwargs["image"]]
+    raise ValueError(f"Unknown docker action: {action}")
+
+
+def _engine_lines(engine, action, **kwargs):
+    if action == "version":
+        v = engine.version()
+        yield f"Docker version {v.get('Version')}, API {v.get('ApiVersion')} (engine socket)"
+    elif action == "ps":
+        yield from format_containers(engine.ps())
+    elif action == "images":
+        yield from format_images(engine.images())
+    elif action == "stop":
+        engine.stop(kwargs["container"])
+        yield kwargs["container"]
+    elif action == "search":
+        yield f"{'NAME':<40} {'STARS':>6}  DESCRIPTION"
+        for r in engine.search(kwargs["term"]):
+            yield f"{r.get('name', ''):<40} {r.get('star_count', 0):>6}  {(r.get('description') or '')[:60]}"
+    elif action in ("pull", "build"):
+        messages = engine.pull(kwargs["image"]) if action == "pull" else engine.build(kwargs.get("path", "."), kwargs["tag"])
+        for message in messages:
+            line = format_progress(message)
+            if line:
+                yield line
+            if "error" in message:
+                return False
+    elif action == "run":
+        yield engine.run(kwargs["image"], kwargs.get("name"))
+    else:
+        raise ValueError(f"Unknown docker action: {action}")
+    return True
+
+
+def _cli_lines(action, **kwargs):
+    try:
+        command = runner.start(cli_command(action, **kwargs), label=f"docker {action}")
+    except FileNotFoundError:
+        yield "ERR: docker CLI not found and the engine socket is not reachable."
+        return False
+    yield from command.lines()
+    if not command.ok:
+        # 'exited with code N', or the state when it was cancelled or timed out before exiting on its own
+        yield f"ERR: docker {action} {command.error or command.state}"
+    return command.ok
+
+
+@profiled("docker_lines")
+def docker_lines(action, **kwargs):
+    """Runs a docker action and yields its output line by line; returns True when it succeeded.
+
+    Uses the engine socket when it is reachable and falls back to the `docker` CLI otherwise.
+    """
+    engine = get_engine()
+    if engine is None:
+        return (yield from _cli_lines(action, **kwargs))
+    try:
+        return (yield from _engine_lines(engine, action, **kwargs))
+    except DockerEngineError as e:
+        yield f"ERR: {e.message}"
+    except (OSError, http.client.HTTPException) as e:
+        # The daemon went away (restart, socket closed) in the middle of a call or a stream
+        drop_engine(engine)
+        yield f"ERR: lost the engine connection: {str(e) or type(e).__name__}"
+    return False
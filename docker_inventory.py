@@ -0,0 +1,202 @@
+import json
+import subprocess
+import threading
+import time
+
+import docker_engine
+from docker_engine import DockerEngineError
+
+# --- INVENTORY CONFIGURATION ---
+POLL_INTERVAL = 5
+RECONNECT_DELAY = 2
+
+# Container event -> state it leaves the container in
+CONTAINER_STATES = {
+    "create": "created", "start": "running", "restart": "running", "unpause": "running",
+    "pause": "paused", "die": "exited", "stop": "exited", "kill": "exited", "oom": "exited",
+}
+
+
+class Inventory:
+    """In-memory model of containers and images, keyed by ID.
+
+    It is built once with a full listing, then kept current from the engine's
+    /events stream. Without the engine socket it falls back to polling the CLI
+    and diffing. Every change is pushed to subscribers as (kind, action, id).
+    """
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.containers = {}
+        self.images = {}
+        self.ready = False
+        self.source = None
+        self.poll_interval = poll_interval
+        self._images_stale = False
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- READS (never touch the daemon) ---
+    def container_list(self):
+        with self._lock:
+            return sorted(self.containers.values(), key=lambda c: -c.get("Created", 0))
+
+    def image_list(self):
+        with self._lock:
+            return sorted(self.images.values(), key=lambda i: -i.get("Created", 0))
+
+    def counts(self):
+        with self._lock:
+            running = sum(1 for c in self.containers.values() if c.get("State") == "running")
+            return {"running": running, "containers": len(self.containers), "images": len(self.images)}
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def _emit(self, kind, action, object_id):
+        for callback in list(self._subscribers):
+            try:
+                callback(kind, action, object_id)
+            except Exception:
+                pass
+
+    # --- FULL SNAPSHOT ---
+    def load(self, containers, images):
+        with self._lock:
+            self.containers = {c["Id"]: c for c in containers}
+            self.images = {i["Id"]: i for i in images}
+            self._images_stale = False
+            self.ready = True
+        self._emit("inventory", "load", None)
+
+    def _refresh_images(self, engine):
+        # Runs on the sync thread, outside the lock: reads keep serving the previous list meanwhile
+        with self._lock:
+            self._images_stale = False  # an event arriving during the call marks it again
+        images = engine.images()
+        with self._lock:
+            self.images = {i["Id"]: i for i in images}
+
+    # --- EVENTS ---
+    def apply_event(self, event):
+        """Updates the model from one engine event (also used to replay recorded fixtures)"""
+        kind, action = event.get("Type"), event.get("Action", "")
+        actor = event.get("Actor", {})
+        object_id = actor.get("ID") or event.get("id")
+        attrs = actor.get("Attributes", {})
+        # Exec/health events look like 'exec_start: sh' or 'health_status: healthy'
+        action = action.split(":", 1)[0]
+        with self._lock:
+            if kind == "container":
+                if action == "destroy":
+                    if self.containers.pop(object_id, None) is None:
+                        return False
+                elif action == "rename":
+                    self.containers.setdefault(object_id, {"Id": object_id})["Names"] = ["/" + attrs.get("name", "")]
+                elif action in CONTAINER_STATES:
+                    container = self.containers.setdefault(object_id, {
+                        "Id": object_id, "Image": attrs.get("image", event.get("from", "")),
+                        "Names": ["/" + attrs.get("name", object_id[:12])], "Created": event.get("time", 0),
+                    })
+                    container["State"] = CONTAINER_STATES[action]
+                    if action in ("die", "stop", "kill", "oom"):
+                        container["Status"] = f"Exited ({attrs.get('exitCode', '?')})"
+                    elif container["State"] == "running":
+                        container["Status"] = "Up"
+                    else:
+                        container["Status"] = container["State"].capitalize()
+                else:
+                    return False
+            elif kind == "image":
+                if action == "delete":
+                    self.images.pop(object_id, None)
+                elif action in ("pull", "tag", "untag", "import", "load", "build"):
+                    # Image events carry a reference rather than the full record; the sync thread reloads the list
+                    self._images_stale = True
+                else:
+                    return False
+            else:
+                return False
+        self._emit(kind, action, object_id)
+        return True
+
+    def replay(self, path):
+        """Applies a recorded events file (one JSON event per line); returns how many changed the model"""
+        changed = 0
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    changed += self.apply_event(json.loads(line))
+        return changed
+
+    # --- BACKGROUND SYNC ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="docker-inventory", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            engine = docker_engine.get_engine()
+            try:
+                if engine is not None:
+                    self._follow_events(engine)
+                else:
+                    self._poll_once()
+            except (DockerEngineError, OSError, subprocess.SubprocessError, ValueError):
+                self.ready = False
+            self._stop.wait(RECONNECT_DELAY if engine is not None else self.poll_interval)
+
+    def _follow_events(self, engine):
+        self.source = "events"
+        since = int(time.time())
+        self.load(engine.ps(), engine.images())
+        for event in engine.events(since=since):
+            if self._stop.is_set():
+                return
+            self.apply_event(event)
+            if self._images_stale:
+                self._refresh_images(engine)
+
+    def _poll_once(self):
+        """Delta polling through the CLI when the engine socket is not reachable"""
+        self.source = "poll"
+        containers = {c["Id"]: c for c in cli_containers()}
+        images = {i["Id"]: i for i in cli_images()}
+        with self._lock:
+            changes = [("container", "destroy", cid) for cid in self.containers.keys() - containers.keys()]
+            changes += [("container", "update", cid) for cid, c in containers.items() if self.containers.get(cid) != c]
+            changes += [("image", "delete", iid) for iid in self.images.keys() - images.keys()]
+            changes += [("image", "update", iid) for iid, i in images.items() if self.images.get(iid) != i]
+            self.containers, self.images, self.ready = containers, images, True
+        for change in changes:
+            self._emit(*change)
+
+
+# --- CLI FALLBACK (normalised to the engine's JSON shape) ---
+def _cli_json(argv):
+    out = subprocess.run(argv, capture_output=True, text=True, check=True).stdout
+    return [json.loads(line) for line in out.splitlines() if line.strip()]
+
+
+def cli_containers():
+    return [{"Id": c["ID"], "Image": c.get("Image", ""), "Names": ["/" + n for n in c.get("Names", "").split(",")],
+             "State": c.get("State", ""), "Status": c.get("Status", "")}
+            for c in _cli_json(["docker", "ps", "-a", "--no-trunc", "--format", "{{json .}}"])]
+
+
+def cli_images():
+    images = {}
+    for i in _cli_json(["docker", "images", "--no-trunc", "--format", "{{json .}}"]):
+        image = images.setdefault(i["ID"], {"Id": i["ID"], "RepoTags": [], "Size": 0})
+        image["RepoTags"].append(f"{i.get('Repository')}:{i.get('Tag')}")
+    return list(images.values())
+
+
+# Shared by the CLI menu and the GUI
+inventory = Inventory()
@@ -1,16 +1,85 @@
-import subprocess
 import os
+import re
 import sys
+import time
 
-def run_docker_command(command):
-    """Runs a docker command and shows output in real-time"""
+from docker_engine import docker_lines, format_containers, format_images
+
+def print_lines(lines):
+    """Prints a line generator to the end and returns its result (True on success)"""
+    while True:
+        try:
+            print(next(lines))
+        except StopIteration as done:
+            return bool(done.value)
+
+def run_docker_action(action, **kwargs):
+    """Runs a docker action and shows output in real-time"""
     try:
-        # subprocess.run allows progress bars and real-time output in the terminal
-        subprocess.run(command, shell=True, check=True, text=True)
-    except subprocess.CalledProcessError:
-        print(f"\n[ERROR] Command failed. Make sure Docker Desktop is running.")
+        # Talks to the engine socket directly and only forks the docker CLI as a fallback;
+        # the result comes from the exit code, not from ERR: lines (the CLI's stderr carries warnings too)
+        return print_lines(docker_lines(action, **kwargs))
+    except Exception as e:
+        print(f"\n[ERROR] Command failed ({e}). Make sure Docker Desktop is running.")
+        return False
+
+def pull_images(images):
+    """Pulls several images in parallel with a combined progress line; True when all succeeded"""
+    from pull_scheduler import scheduler
+    print(f"Downloading {len(images)} image(s) in parallel... (This might take time)")
+    futures = scheduler.submit(images)
+    while not all(f.done() for f in futures.values()):
+        p = scheduler.overall()
+        print(f"\r  {p['done']}/{p['images']} done, {p['active']} active - {p['percent']}%   ", end="", flush=True)
+        time.sleep(0.5)
+    print()
+    ok = True
+    for image, future in futures.items():
+        error = scheduler.error(image)
+        ok = ok and not error
+        print(f"  {image}: {future.result()}" + (f" ({error})" if error else ""))
+    return ok
+
+def build_image(path, tag):
+    """Reports the context size first, then builds with the layer cache and records the timing; True on success"""
+    from build_context import build_lines
+    return print_lines(build_lines(path or ".", tag))
+
+def follow_logs(containers, pattern=None, tail=None, follow=True, streams=("stdout", "stderr")):
+    """Prints the logs of several containers interleaved until Ctrl-C (or until they end); True on success"""
+    from container_logs import follower, TAIL_LINES
+    try:
+        re.compile(pattern or "")
+    except re.error as e:
+        print(f"[ERROR] Invalid pattern: {e}")
+        return False
+    width = max(len(c) for c in containers)
+    printer = lambda line: print(line.format(width), flush=True)
+    follower.subscribe(printer)
+    try:
+        for container in containers:
+            follower.follow(container, pattern, streams, TAIL_LINES if tail is None else tail, follow)
+        if follow:
+            while any(s["state"] in ("starting", "following") for s in follower.status()):
+                time.sleep(0.5)
+        else:
+            follower.wait()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        follower.unsubscribe(printer)
+        failed = [s for s in follower.status() if s["container"] in containers and s["error"]]
+        for container in containers:
+            follower.unfollow(container)
+    for s in failed:
+        print(f"[ERROR] {s['container']}: {s['error']}")
+    return not failed
 
 def docker_menu():
+    # Imported here so one-shot CLI calls (main.py docker ...) never start the event watcher
+    from docker_inventory import inventory
+    # Keeps a live container/image cache in the background so listings are instant
+    inventory.start()
     while True:
         print("\n" + "="*40)
         print("      DOCKER CONTAINER MANAGEMENT       ")
@@ -23,10 +92,11 @@ def docker_menu():
         print("6. Search Image (DockerHub)")
         print("7. Download/Pull Image")
         print("8. Run Container (Launch)")  # <-- Added Feature
-        print("9. Back to Main Menu")        # <-- Updated Number
+        print("9. Follow Container Logs")
+        print("10. Back to Main Menu")
         print("="*40)
         
-        choice = input(">> Enter your choice (1-9): ")
+        choice = input(">> Enter your choice (1-10): ")
 
         if choice == '1':
             print("\n--- Create Dockerfile ---")
@@ -53,26 +123,31 @@ def docker_menu():
         elif choice == '2':
             path = input("Enter directory of Dockerfile (usually .): ")
             tag = input("Enter image name:tag (e.g., myapp:v1): ")
-            run_docker_command(f"docker build -t {tag} {path}")
+            build_image(path, tag)
 
         elif choice == '3':
-            run_docker_command("docker images")
+            if inventory.ready:
+                print("\n".join(format_images(inventory.image_list())))
+            else:
+                run_docker_action("images")
 
         elif choice == '4':
-            run_docker_command("docker ps -a")
+            if inventory.ready:
+                print("\n".join(format_containers(inventory.container_list())))
+            else:
+                run_docker_action("ps")
 
         elif choice == '5':
             cid = input("Enter Container ID to stop: ")
-            run_docker_command(f"docker stop {cid}")
+            run_docker_action("stop", container=cid)
 
         elif choice == '6':
             term = input("Enter image name to search: ")
-            run_docker_command(f"docker search {term}")
+            run_docker_action("search", term=term)
 
         elif choice == '7':
-            img = input("Enter image name to download (e.g., nginx): ")
-            print(f"Downloading {img}... (This might take time)")
-            run_docker_command(f"docker pull {img}")
+            images = input("Enter image name(s) to download, separated by spaces (e.g., nginx redis): ").split()
+            pull_images(images)
 
         elif choice == '8':
             print("\n--- Run Container ---")
@@ -80,13 +155,22 @@ def docker_menu():
             name = input("Enter a name for this container (optional): ")
             
             # -d runs it in the background so the CLI doesn't hang
-            if name:
-                run_docker_command(f"docker run -d --name {name} {img}")
-            else:
-                run_docker_command(f"docker run -d {img}")
+            run_docker_action("run", image=img, name=name or None)
             print(f"[INFO] Container launch command sent for {img}")
 
         elif choice == '9':
+            names = input("Enter container name(s)/ID(s) separated by spaces (press Enter for all running): ").split()
+            if not names and inventory.ready:
+                names = [(c.get("Names") or [c["Id"][:12]])[0].lstrip("/")
+                         for c in inventory.container_list() if c.get("State") == "running"]
+            if not names:
+                print("No containers to follow.")
+                continue
+            pattern = input("Only show lines matching (regex, optional): ").strip() or None
+            print(f"Following {len(names)} container(s); press Ctrl-C to stop.")
+            follow_logs(names, pattern)
+
+        elif choice == '10':
             break
         else:
             print("Invalid choice. Please try again.")
@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import docker_engine
+from docker_engine import DockerEngineError
+from qemu_profile import qmp_socket_path
+from qmp_client import collect_stats, qmp_call, QMPError
+from vm_registry import registry, VMError, DISK_DIR
+
+# --- CONFIGURATION PATHS ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_DIR = os.path.join(BASE_DIR, "config")
+ISO_DIR = os.path.join(BASE_DIR, "data", "iso")
+DEFAULT_CONCURRENCY = 8
+
+RUNNING = "running"
+STOPPED = "stopped"
+
+
+class ManifestError(Exception):
+    pass
+
+
+# --- MANIFEST ---
+def load_manifest(path):
+    """Reads a fleet manifest and returns {name: item} with 'kind' set to 'vm' or 'container'"""
+    if not os.path.exists(path):
+        path = os.path.join(CONFIG_DIR, path)
+    with open(path, "r") as f:
+        data = json.load(f)
+    items = {}
+    for kind, key in (("vm", "vms"), ("container", "containers")):
+        for entry in data.get(key, []):
+            name = entry.get("name")
+            if not name:
+                raise ManifestError(f"Every entry in '{key}' needs a name")
+            if name in items:
+                raise ManifestError(f"Duplicate name in manifest: {name}")
+            if kind == "container" and not entry.get("image"):
+                raise ManifestError(f"Container '{name}' needs an image")
+            if kind == "vm" and not (entry.get("template") or entry.get("iso_path")):
+                raise ManifestError(f"VM '{name}' needs a template or an iso_path")
+            item = dict(entry, kind=kind)
+            item.setdefault("state", RUNNING)
+            item["depends_on"] = list(item.get("depends_on", []))
+            items[name] = item
+    for item in items.values():
+        for dep in item["depends_on"]:
+            if dep not in items:
+                raise ManifestError(f"'{item['name']}' depends on unknown entry '{dep}'")
+    topo_order(items)  # rejects cycles early
+    return data.get("concurrency", DEFAULT_CONCURRENCY), items
+
+
+def topo_order(items):
+    order, state = [], {}
+
+    def visit(name, trail):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ManifestError(f"Dependency cycle: {' -> '.join(trail + [name])}")
+        state[name] = "visiting"
+        for dep in items[name]["depends_on"]:
+            visit(dep, trail + [name])
+        state[name] = "done"
+        order.append(name)
+
+    for name in items:
+        visit(name, [])
+    return order
+
+
+# --- CURRENT STATE ---
+def current_vm_states(names):
+    """A VM counts as running when its QMP socket answers"""
+    paths = {n: qmp_socket_path(n) for n in names}
+    paths = {n: p for n, p in paths.items() if os.path.exists(p)}
+    stats = asyncio.run(collect_stats(paths)) if paths else {}
+    return {n: RUNNING if stats.get(n) else None for n in names}
+
+
+def current_container_states():
+    """{name: 'running' | 'stopped'} for every container the daemon knows"""
+    engine = docker_engine.get_engine()
+    if engine:
+        containers = [(n.lstrip("/"), c.get("State")) for c in engine.ps() for n in c.get("Names", [])]
+    else:
+        out = subprocess.run(["docker", "ps", "-a", "--format", "{{.Names}}\t{{.State}}"],
+                             capture_output=True, text=True, check=True).stdout
+        containers = [tuple(line.split("\t", 1)) for line in out.splitlines() if "\t" in line]
+    return {name: RUNNING if state == "running" else STOPPED for name, state in containers}
+
+
+def plan(items):
+    """Diffs the manifest against what is running; returns {name: action or None}"""
+    vm_states = current_vm_states([n for n, i in items.items() if i["kind"] == "vm"])
+    container_states = current_container_states() if any(i["kind"] == "container" for i in items.values()) else {}
+    actions = {}
+    for name, item in items.items():
+        current = vm_states.get(name) if item["kind"] == "vm" else container_states.get(name)
+        if item["state"] == RUNNING:
+            actions[name] = None if current == RUNNING else ("start" if current == STOPPED else "create")
+        elif item["state"] == STOPPED:
+            actions[name] = "stop" if current == RUNNING else None
+        else:
+            raise ManifestError(f"'{name}': state must be '{RUNNING}' or '{STOPPED}'")
+    return actions
+
+
+# --- ACTIONS ---
+def apply_vm(item, action):
+    name = item["name"]
+    if action == "stop":
+        try:
+            qmp_call(qmp_socket_path(name), "system_powerdown")
+        except (QMPError, OSError, TimeoutError) as e:
+            raise VMError(f"Could not stop '{name}': {e}")
+        return
+    iso_path = item.get("iso_path", "")
+    if iso_path and not os.path.exists(iso_path):
+        iso_path = os.path.join(ISO_DIR, iso_path)
+    settings = {k: item[k] for k in ("ram", "cpu", "disk_size", "template", "accel", "disk_bus") if k in item}
+    if item.get("disk_name"):
+        settings["disk_path"] = os.path.join(DISK_DIR, item["disk_name"])
+    registry.define(name, iso_path=iso_path, **settings)
+    registry.launch(name)
+
+
+def apply_container(item, action):
+    name = item["name"]
+    engine = docker_engine.get_engine()
+    if engine is None:
+        argv = {"create": docker_engine.cli_command("run", image=item["image"], name=name),
+                "start": ["docker", "start", name],
+                "stop": ["docker", "stop", name]}[action]
+        subprocess.run(argv, check=True, stdout=subprocess.DEVNULL)
+    elif action == "create":
+        engine.run(item["image"], name)
+    elif action == "start":
+        engine.start(name)
+    else:
+        engine.stop(name)
+
+
+def apply(items, actions, concurrency=DEFAULT_CONCURRENCY, log=print):
+    """Runs the planned actions in parallel, never starting an item before its dependencies.
+
+    Returns {name: (ok, message)} for every item that needed an action.
+    """
+    pending = {name for name, action in actions.items() if action}
+    done, failed, results = set(), set(), {}
+    # Items that need no action are already satisfied
+    done.update(name for name, action in actions.items() if not action)
+
+    def run(name):
+        item, action = items[name], actions[name]
+        started = time.monotonic()
+        (apply_vm if item["kind"] == "vm" else apply_container)(item, action)
+        return time.monotonic() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        running = {}
+        while pending or running:
+            for name in sorted(pending):
+                deps = items[name]["depends_on"]
+                if any(d in failed for d in deps):
+                    pending.discard(name)
+                    failed.add(name)
+                    results[name] = (False, "skipped, a dependency failed")
+                    log(f"[SKIP] {name}: a dependency failed")
+                elif all(d in done for d in deps):
+                    pending.discard(name)
+                    log(f"[....] {actions[name]} {items[name]['kind']} {name}")
+                    running[pool.submit(run, name)] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    elapsed = future.result()
+                    done.add(name)
+                    results[name] = (True, f"{actions[name]} ok ({elapsed:.2f}s)")
+                    log(f"[ OK ] {name}: {results[name][1]}")
+                except Exception as e:
+                    # One bad item (e.g. a ValueError from its ram/cpu values) fails alone; the rest keep going
+                    if not isinstance(e, (VMError, DockerEngineError, subprocess.CalledProcessError, OSError)):
+                        e = f"{type(e).__name__}: {e}"
+                    failed.add(name)
+                    results[name] = (False, f"failed: {e}")
+                    log(f"[FAIL] {name}: {e}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bring VMs and containers to the state described in a manifest")
+    parser.add_argument("command", choices=["plan", "apply"])
+    parser.add_argument("manifest")
+    parser.add_argument("-j", "--concurrency", type=int, help="parallel operations (overrides the manifest)")
+    args = parser.parse_args(argv)
+
+    try:
+        concurrency, items = load_manifest(args.manifest)
+        actions = plan(items)
+    except (OSError, ValueError, ManifestError, DockerEngineError, subprocess.CalledProcessError) as e:
+        print(f"[ERROR] {e}")
+        return 1
+
+    for name in topo_order(items):
+        print(f"  {actions[name] or 'unchanged':<10} {items[name]['kind']:<10} {name}")
+    if args.command == "plan":
+        return 0
+
+    results = apply(items, actions, args.concurrency or concurrency)
+    failures = [name for name, (ok, _) in results.items() if not ok]
+    print(f"\n{len(results) - len(failures)} succeeded, {len(failures)} failed/skipped.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,15 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
-import subprocess
 import threading
+import queue
+import collections
+import re
 import sys
 import os
+import shutil
+
+from command_runner import runner as command_runner, HIGH, NORMAL, LOW, DONE
+from terminal_log import RingLog
 
 # --- PATH CONFIGURATION ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -11,8 +17,9 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 ISO_DIR = os.path.join(DATA_DIR, "iso")
 DISK_DIR = os.path.join(DATA_DIR, "disks")
 
-os.makedirs(DISK_DIR, exist_ok=True)
-os.makedirs(ISO_DIR, exist_ok=True)
+VM_REFRESH_MS = 1000
+# Home page sparklines redraw at the sampler's pace (METRICS_INTERVAL) once the backends are loaded
+METRICS_REFRESH_MS = 1000
 
 # --- COLORS & FONTS ---
 COLOR_BG_MAIN = "#121212"
@@ -55,29 +62,105 @@ class RoundedButton(tk.Canvas):
         self.itemconfig(self.rect, fill=self.bg_color)
 
 # --- BACKEND LOGIC ---
-def log_output(message):
+# Worker threads never touch Tk: they queue lines and the main loop flushes them in batches.
+# The queue is bounded, so a fast producer blocks until the UI has caught up.
+LOG_QUEUE_MAX = 5000
+LOG_FLUSH_MS = 50
+LOG_BATCH_LINES = 500
+log_queue = queue.Queue(maxsize=LOG_QUEUE_MAX)
+main_thread_lines = []
+# Followed container logs arrive on the follower's event loop, which must never wait for Tk (one blocked
+# put would stall every container): they go to a bounded deque that drops its oldest lines instead
+container_lines = collections.deque(maxlen=LOG_QUEUE_MAX)
+container_lines_dropped = 0
+
+# The terminal pane only ever holds what the ring buffer holds; full history goes to logs/terminal.log
+terminal_log = RingLog(max_lines=5000, max_bytes=2 * 1024 * 1024)
+
+def write_log(lines):
+    lines = "\n".join(lines).split("\n")
+    terminal_log.append(lines)
     if 'log_area' in globals() and log_area.winfo_exists():
         log_area.config(state='normal')
-        log_area.insert(tk.END, message + "\n")
+        log_area.insert(tk.END, "\n".join(lines) + "\n")
+        # Old lines are dropped in chunks so the widget is not re-laid out on every insert
+        drop = terminal_log.take_evicted()
+        if drop:
+            log_area.delete("1.0", f"{drop + 1}.0")
         log_area.see(tk.END)
         log_area.config(state='disabled')
 
-def run_command_threaded(command):
-    def task():
-        try:
-            log_output(f"> {command}")
-            shell_cmd = command
-            if os.name == 'nt' and 'wsl' in command:
-                 shell_cmd = f'C:\\Windows\\System32\\wsl.exe {command.replace("wsl ", "")}'
-            
-            process = subprocess.Popen(shell_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            stdout, stderr = process.communicate()
-            if stdout: log_output(stdout)
-            if stderr: log_output(f"ERR: {stderr}")
-            log_output("--- Done ---")
-        except Exception as e:
-            log_output(f"Error: {e}")
-    threading.Thread(target=task, daemon=True).start()
+def log_output(message):
+    if threading.current_thread() is threading.main_thread():
+        main_thread_lines.append(message)
+    else:
+        log_queue.put(message)
+
+def log_container_line(line):
+    # Runs on the follower's loop thread; deque appends never block
+    global container_lines_dropped
+    if len(container_lines) == container_lines.maxlen:
+        container_lines_dropped += 1
+    container_lines.append(line.format())
+
+def flush_log_queue():
+    global container_lines_dropped
+    lines = main_thread_lines[:]
+    main_thread_lines.clear()
+    try:
+        while len(lines) < LOG_BATCH_LINES:
+            lines.append(log_queue.get_nowait())
+    except queue.Empty:
+        pass
+    if container_lines_dropped:
+        dropped, container_lines_dropped = container_lines_dropped, 0
+        lines.append(f"[LOGS] {dropped} container log line(s) dropped, the terminal fell behind")
+    while container_lines and len(lines) < 2 * LOG_BATCH_LINES:
+        lines.append(container_lines.popleft())
+    if lines:
+        write_log(lines)
+    root.after(LOG_FLUSH_MS, flush_log_queue)
+
+def submit_task(target, label, priority=NORMAL, timeout=None):
+    # Clicks queue on the shared bounded pool instead of starting a thread (or a shell) each;
+    # process output and generator lines stream into the terminal pane
+    return command_runner.submit(target, label=label, priority=priority, timeout=timeout, on_line=log_output)
+
+def on_command_done(command):
+    if command.on_line is not log_output:
+        return  # CLI/API work sharing the pool
+    if command.state == DONE:
+        log_output(f"--- Done: {command.label} ({command.seconds():.1f}s) ---")
+    else:
+        log_output(f"--- {command.label}: {command.state}" + (f" ({command.error})" if command.error else "") + " ---")
+
+def cancel_tasks():
+    # Only what this window started; the API, the CLI and the pull scheduler share the pool
+    cancelled = sum(command_runner.cancel(c) for c in list(command_runner.active.values()) if c.on_line is log_output)
+    log_output(f"[TASKS] Cancelled {cancelled} queued or running task(s)")
+
+def run_command_threaded(argv, label=None, priority=NORMAL, timeout=None):
+    # argv list, never a shell string: names typed into the GUI cannot inject commands
+    if os.name == 'nt' and argv[0] == "wsl":
+        argv = [r"C:\Windows\System32\wsl.exe"] + list(argv[1:])
+    log_output(f"> {' '.join(argv)}")
+    return submit_task(list(argv), label or " ".join(argv[:2]), priority, timeout)
+
+# Stops jump the queue; pulls and builds are bulk work that waits behind everything else
+DOCKER_PRIORITY = {"stop": HIGH, "pull": LOW, "build": LOW}
+
+def run_docker_action_threaded(action, **kwargs):
+    # Docker actions go through the shared engine client instead of forking a shell
+    log_output(f"> docker {action} {' '.join(str(v) for v in kwargs.values() if v)}".rstrip())
+
+    def lines():
+        if action == "build":
+            from build_context import build_lines
+            return build_lines(kwargs["path"], kwargs["tag"])
+        from docker_engine import docker_lines
+        return docker_lines(action, **kwargs)
+
+    submit_task(lines, f"docker {action}", DOCKER_PRIORITY.get(action, NORMAL))
 
 def create_dockerfile_ui():
     df_win = tk.Toplevel(root)
@@ -107,71 +190,271 @@ def create_dockerfile_ui():
 
     RoundedButton(df_win, text="SAVE FILE", command=save_file, width=150).pack(pady=20)
 
-def start_vm():
+def define_vm_from_form():
+    """Registers the VM described by the form; returns its name, or None after showing why not"""
+    if not backends_ready(): return None
+    from iso_catalog import catalog as iso_catalog, ISOError
+    from vm_registry import VMError
     iso_input = iso_entry.get()
+    template = template_entry.get().strip() or None
     final_iso_path = ""
-    if os.path.exists(iso_input):
-        final_iso_path = iso_input
-    elif os.path.exists(os.path.join(ISO_DIR, iso_input)):
-        final_iso_path = os.path.join(ISO_DIR, iso_input)
+    if template:
+        pass  # the overlay disk already holds an installed OS
     else:
-        messagebox.showerror("Error", f"ISO not found!")
+        try:
+            final_iso_path = iso_catalog.resolve(iso_input)
+        except ISOError:
+            messagebox.showerror("Error", f"ISO not found!")
+            return None
+
+    name = vm_name_entry.get().strip()
+    if not name: messagebox.showwarning("Input", "Enter a VM name"); return None
+    try:
+        vm_registry.define(name, ram=ram_entry.get(), cpu=cpu_entry.get(), disk_size=disk_entry.get(),
+                           iso_path=final_iso_path, template=template)
+    except VMError as e:
+        messagebox.showerror("Error", str(e))
         return
+    return name
 
-    disk_path = os.path.join(DISK_DIR, "vm_disk.img")
-    vm_status_var.set("1 (Running)")
-    
-    if not os.path.exists(disk_path):
-        cmd_disk = f'qemu-img create -f qcow2 "{disk_path}" {disk_entry.get()}'
-        subprocess.run(cmd_disk, shell=True)
-    
-    def run_vm_and_watch():
-        cmd_boot = (
-            f'qemu-system-x86_64 -accel whpx,kernel-irqchip=off '
-            f'-m {ram_entry.get()} -smp {cpu_entry.get()} '
-            f'-hda "{disk_path}" -boot d -cdrom "{final_iso_path}"'
-        )
-        process = subprocess.Popen(cmd_boot, shell=True)
-        process.wait() 
-        vm_status_var.set("0 (Stopped)")
-
-    threading.Thread(target=run_vm_and_watch, daemon=True).start()
+def start_vm():
+    name = define_vm_from_form()
+    if not name: return
+
+    # Disk creation and process start happen off the Tk thread; the registry's reaper tracks exits
+    def launch():
+        vm = vm_registry.launch(name)
+        log_output(f"> {' '.join(vm.boot_argv())}")
+
+    submit_task(launch, f"vm launch {name}")
+
+def open_iso_picker():
+    from iso_catalog import catalog as iso_catalog, describe as describe_iso
+    # Filters the cached catalog on every keystroke; nothing is read from the ISOs themselves
+    picker = tk.Toplevel(root)
+    picker.title("Choose ISO")
+    picker.geometry("600x400")
+    picker.configure(bg=COLOR_BG_MAIN)
+    search = tk.Entry(picker, font=FONT_BODY, bg="#2C2C2C", fg="white", insertbackground="white", relief="flat", bd=5)
+    search.pack(fill="x", padx=10, pady=10)
+    results = tk.Listbox(picker, bg="#2C2C2C", fg="white", font=("Consolas", 10), relief="flat",
+                         selectbackground=COLOR_ACCENT, highlightthickness=0)
+    results.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+    matches = []
+
+    def update(*_):
+        matches[:] = iso_catalog.search(search.get())
+        results.delete(0, tk.END)
+        for entry in matches:
+            results.insert(tk.END, describe_iso(entry))
+
+    def choose(*_):
+        selection = results.curselection()
+        if selection:
+            iso_entry.delete(0, tk.END)
+            iso_entry.insert(0, matches[selection[0]]["name"])
+            picker.destroy()
+
+    search.bind("<KeyRelease>", update)
+    results.bind("<Double-Button-1>", choose)
+    results.bind("<Return>", choose)
+    update()
+    search.focus_set()
+
+def stop_selected_vm():
+    selection = vm_listbox.curselection()
+    if not selection: messagebox.showwarning("Input", "Select a VM to stop"); return
+    name = vm_listbox.get(selection[0]).split()[0]
+    # Graceful ACPI shutdown over QMP; the registry falls back to SIGTERM
+    submit_task(lambda: vm_registry.powerdown(name), f"vm stop {name}", HIGH)
+
+def suspend_selected_vm():
+    selection = vm_listbox.curselection()
+    if not selection: messagebox.showwarning("Input", "Select a VM to save"); return
+    name = vm_listbox.get(selection[0]).split()[0]
+
+    # RAM goes to data/snapshots/<vm>/ and QEMU exits; RESUME continues from there instead of booting
+    def save():
+        from vm_snapshots import snapshots, FILE
+        log_output(f"[VM] {name}: saving state...")
+        entry = snapshots.save(name, kind=FILE, stop=True)
+        log_output(f"[VM] {name}: saved as '{entry['tag']}' in {entry['save_seconds']}s")
+
+    submit_task(save, f"vm save {name}")
+
+def resume_vm():
+    selection = vm_listbox.curselection()
+    name = vm_listbox.get(selection[0]).split()[0] if selection else define_vm_from_form()
+    if not name: return
+
+    def resume():
+        from vm_snapshots import snapshots
+        _, seconds = snapshots.resume(name)
+        log_output(f"[VM] {name}: resumed in {seconds}s")
+
+    submit_task(resume, f"vm resume {name}")
+
+def on_vm_change(vm):
+    log_output(f"[VM] {vm.name}: {vm.state}" + (f" (exit code {vm.returncode})" if vm.returncode is not None else ""))
+
+def refresh_vm_status():
+    if vm_registry is None:  # backends still loading
+        root.after(VM_REFRESH_MS, refresh_vm_status)
+        return
+    from vm_registry import RUNNING, STOPPING
+    vms = vm_registry.list()
+    running = sum(1 for vm in vms if vm["state"] in (RUNNING, STOPPING))
+    vm_status_var.set(f"{running} Running / {len(vms)}")
+    if docker_inventory.ready:
+        counts = docker_inventory.counts()
+        container_status_var.set(f"{counts['running']} Running / {counts['containers']}")
+    # The pull scheduler only exists once something was pulled
+    pull = sys.modules.get("pull_scheduler")
+    pulls = pull.scheduler.overall() if pull else {"images": 0}
+    if pulls["images"]:
+        pull_status_var.set(f"Pulls: {pulls['done']}/{pulls['images']} done, {pulls['active']} active, "
+                            f"{pulls['failed']} failed - {pulls['percent']}% "
+                            f"({pulls['bytes'] >> 20}/{pulls['total_bytes'] >> 20} MB)")
+    rows = []
+    for vm in vms:
+        row = f"{vm['name']:<20} {vm['state']:<10} pid={vm['pid'] or '-':<8} {vm['ram']} RAM, {vm['cpu']} CPU"
+        live = qmp_poller.stats.get(vm['name']) if qmp_poller and vm["state"] == RUNNING else None
+        if live:
+            row += f"  [{live['status']}] vCPUs={live['vcpus']} rd={live['rd_bytes'] >> 20}MB wr={live['wr_bytes'] >> 20}MB"
+        rows.append(row)
+    if "vm" in pages and list(vm_listbox.get(0, tk.END)) != rows:
+        selected = vm_listbox.curselection()
+        vm_listbox.delete(0, tk.END)
+        for row in rows:
+            vm_listbox.insert(tk.END, row)
+        if selected and selected[0] < len(rows):
+            vm_listbox.selection_set(selected[0])
+    root.after(VM_REFRESH_MS, refresh_vm_status)
+
+def draw_sparkline(canvas, values):
+    canvas.delete("all")
+    width, height = int(canvas.winfo_width()), int(canvas.winfo_height())
+    if len(values) < 2 or width < 2:
+        return
+    top = max(values) or 1.0
+    step = width / (len(values) - 1)
+    points = []
+    for i, v in enumerate(values):
+        points += [i * step, height - 2 - (v / top) * (height - 4)]
+    canvas.create_line(*points, fill=COLOR_ACCENT, width=2)
+
+def refresh_metrics():
+    if metrics_collector is None:  # backends still loading
+        root.after(METRICS_REFRESH_MS, refresh_metrics)
+        return
+    from disk_images import human_size
+    from metrics import human_bytes
+    # Image sizes come from the mtime-keyed index; the rescan itself runs off the Tk thread
+    disk_index.refresh_async()
+    images = disk_index.summary()
+    usage = shutil.disk_usage(DATA_DIR if os.path.isdir(DATA_DIR) else BASE_DIR)
+    disk_io = [a + b for a, b in zip(metrics_collector.series("vm", "disk"), metrics_collector.series("container", "disk"))]
+    disk_status_var.set(f"{human_size(images['allocated'])} / {human_size(images['virtual_size'])}")
+    disk_metrics_var.set(f"{images['images']} images, host {usage.used * 100 // usage.total}% full, "
+                         f"{human_bytes(disk_io[-1] if disk_io else 0)}/s")
+    vm_cpu = metrics_collector.series("vm", "cpu")
+    container_cpu = metrics_collector.series("container", "cpu")
+    draw_sparkline(vm_spark, vm_cpu)
+    draw_sparkline(container_spark, container_cpu)
+    draw_sparkline(disk_spark, disk_io)
+    vm_metrics_var.set(f"CPU {vm_cpu[-1]:.0f}%" if vm_cpu else "")
+    container_metrics_var.set(f"CPU {container_cpu[-1]:.0f}%" if container_cpu else "")
+    root.after(int(metrics_collector.interval * 1000), refresh_metrics)
 
 def docker_action(action_type):
+    # Cached reads ("logs", "ps", "images", "history") need the inventory and the state store
+    if action_type in ("logs", "ps", "images", "history") and not backends_ready(): return
     if action_type == "pull":
-        if not docker_input.get(): messagebox.showwarning("Input", "Type an image name"); return
-        run_command_threaded(f"docker pull {docker_input.get()}")
+        images = docker_input.get().replace(",", " ").split()
+        if not images: messagebox.showwarning("Input", "Type an image name"); return
+        # Several images can be given at once; they are pulled in parallel, skipping ones already present
+        from pull_scheduler import scheduler as pull_scheduler
+        for image, future in pull_scheduler.submit(images).items():
+            log_output(f"> docker pull {image}")
+            future.add_done_callback(lambda f, image=image: log_output(
+                f"[PULL] {image}: {f.result()}" + (f" ({pull_scheduler.error(image)})" if f.result() == "failed" else "")))
     elif action_type == "stop":
         if not docker_stop_input.get(): messagebox.showwarning("Input", "Type Container ID"); return
-        run_command_threaded(f"docker stop {docker_stop_input.get()}")
+        run_docker_action_threaded("stop", container=docker_stop_input.get())
     elif action_type == "search":
         if not docker_search_input.get(): messagebox.showwarning("Input", "Type search term"); return
-        run_command_threaded(f"docker search {docker_search_input.get()}")
+        run_docker_action_threaded("search", term=docker_search_input.get())
     elif action_type == "build":
         tag = docker_build_tag.get()
         if not tag: messagebox.showwarning("Input", "Enter an image tag"); return
-        run_command_threaded(f"docker build -t {tag} .")
+        run_docker_action_threaded("build", tag=tag, path=".")
     elif action_type == "run":
         img = docker_run_img.get()
         name = docker_run_name.get()
         if not img: messagebox.showwarning("Input", "Enter an image name to run"); return
-        cmd = f"docker run -d --name {name} {img}" if name else f"docker run -d {img}"
-        run_command_threaded(cmd)
-    else:
-        cmds = {"version": "docker --version", "ps": "docker ps -a", "images": "docker images"}
-        if action_type in cmds: run_command_threaded(cmds[action_type])
+        run_docker_action_threaded("run", image=img, name=name or None)
+    elif action_type == "logs":
+        names = docker_logs_input.get().replace(",", " ").split()
+        if not names and docker_inventory.ready:
+            # Nothing typed: every running container
+            names = [(c.get("Names") or [c["Id"][:12]])[0].lstrip("/")
+                     for c in docker_inventory.container_list() if c.get("State") == "running"]
+        if not names: messagebox.showwarning("Input", "Type container name(s)"); return
+        follow_container_logs(names, docker_logs_filter.get().strip() or None)
+    elif action_type == "stop_logs":
+        stop_container_logs()
+    elif action_type == "ps" and docker_inventory.ready:
+        # Served from the event-fed cache, no round trip to the daemon
+        from docker_engine import format_containers
+        for line in format_containers(docker_inventory.container_list()): log_output(line)
+    elif action_type == "images" and docker_inventory.ready:
+        from docker_engine import format_images
+        for line in format_images(docker_inventory.image_list()): log_output(line)
+    elif action_type in ("version", "ps", "images"):
+        run_docker_action_threaded(action_type)
+    elif action_type == "history":
+        # Straight from the indexes of the state store
+        from state_store import describe as describe_operation, parse_since
+        slowest = state_store.slowest("pull", since=parse_since("7d"))
+        log_output(f"> slowest pulls, last 7 days ({len(slowest)})")
+        for operation in slowest: log_output(describe_operation(operation))
+
+def follow_container_logs(names, pattern):
+    # Every container is streamed on the follower's single event loop; lines reach the pane through container_lines
+    from container_logs import follower
+    global logs_subscribed
+    if not logs_subscribed:
+        follower.subscribe(log_container_line)
+        logs_subscribed = True
+    try:
+        for name in names:
+            follower.follow(name, pattern)
+    except re.error as e:
+        messagebox.showerror("Error", f"Invalid filter: {e}")
+        return
+    log_output(f"> docker logs -f {' '.join(names)}" + (f" (matching {pattern})" if pattern else ""))
+
+def stop_container_logs():
+    from container_logs import follower
+    stopped = [name for name in list(follower.follows) if follower.unfollow(name)]
+    log_output(f"[LOGS] Stopped following {len(stopped)} container(s)")
 
 # --- GUI HELPERS ---
 def switch_frame(frame_to_show, btn_reference):
-    frame_home.pack_forget()
-    frame_vm.pack_forget()
-    frame_docker.pack_forget()
+    for frame in pages.values():
+        frame.pack_forget()
     frame_to_show.pack(fill="both", expand=True, padx=20, pady=20)
     for btn in sidebar_buttons:
         btn.config(bg=COLOR_BG_SIDEBAR, fg=COLOR_TEXT_DIM)
     if btn_reference:
         btn_reference.config(fg=COLOR_ACCENT)
 
+def open_page(name, btn_reference):
+    # Pages other than Home are built the first time they are opened
+    if name not in pages:
+        pages[name] = page_builders[name]()
+    switch_frame(pages[name], btn_reference)
+
 def create_nav_btn(parent, text, command):
     btn = tk.Button(parent, text=text, command=command, font=("Segoe UI", 12, "bold"),
                     bg=COLOR_BG_SIDEBAR, fg=COLOR_TEXT_DIM, activebackground=COLOR_BTN_HOVER, 
@@ -203,8 +486,57 @@ root = tk.Tk()
 root.title("Cloud Manager Dashboard")
 root.geometry("1000x800")
 root.configure(bg=COLOR_BG_MAIN)
-vm_status_var = tk.StringVar(value="0 (Stopped)")
+vm_status_var = tk.StringVar(value="0 Running / 0")
+container_status_var = tk.StringVar(value="Ready")
+disk_status_var = tk.StringVar(value="-")
+vm_metrics_var = tk.StringVar(value="")
+container_metrics_var = tk.StringVar(value="")
+disk_metrics_var = tk.StringVar(value="")
+pull_status_var = tk.StringVar(value="")
+logs_subscribed = False
+# Backends are imported by start_backends, after the first paint
+vm_registry = docker_inventory = disk_index = metrics_collector = state_store = None
+qmp_poller = None
 sidebar_buttons = []
+pages = {}
+
+def start_backends():
+    # Runs once the window is on screen; the imports, re-attaching and the first inventory fetch run
+    # off the Tk thread so none of it delays the first paint or blocks clicks
+    command_runner.subscribe(on_command_done)
+    threading.Thread(target=load_backends, name="gui-backends", daemon=True).start()
+
+def load_backends():
+    global qmp_poller, vm_registry, docker_inventory, disk_index, metrics_collector, state_store
+    try:
+        from vm_registry import registry
+        from docker_inventory import inventory
+        from disk_images import index
+        from metrics import collector
+        from state_store import store
+        registry.on_change = on_vm_change
+        # VMs left running by an earlier session are adopted; history recording starts here
+        adopted, lost = store.attach(registry=registry, inventory=inventory, runner=command_runner)
+        for name in adopted: log_output(f"[VM] Re-attached to running VM '{name}'")
+        for name in lost: log_output(f"[VM] '{name}' stopped while the dashboard was closed")
+        inventory.start()
+        poller = registry.poller().start()
+        collector.start()
+    except Exception as e:
+        log_output(f"[ERROR] Could not start the backends: {e}")
+        return
+    # Published last: the refresh loops and buttons treat vm_registry/metrics_collector as "loaded"
+    qmp_poller, disk_index, docker_inventory, state_store = poller, index, inventory, store
+    metrics_collector, vm_registry = collector, registry
+    # New ISOs are indexed, hashed and de-duplicated in the background; the picker reads the cached catalog
+    from iso_catalog import catalog as iso_catalog
+    iso_catalog.scan_async()
+
+def backends_ready():
+    if vm_registry is None:
+        messagebox.showinfo("Loading", "Still starting up, try again in a moment")
+        return False
+    return True
 
 # 1. Sidebar
 sidebar = tk.Frame(root, bg=COLOR_BG_SIDEBAR, width=220)
@@ -215,7 +547,11 @@ sidebar.pack_propagate(False)
 log_frame = tk.Frame(root, bg="#000000", height=180)
 log_frame.pack(side="bottom", fill="x")
 log_frame.pack_propagate(False)
-tk.Label(log_frame, text="TERMINAL OUTPUT", bg="#000000", fg="#444444", font=("Consolas", 8)).pack(anchor="w", padx=5)
+log_header = tk.Frame(log_frame, bg="#000000")
+log_header.pack(fill="x")
+tk.Label(log_header, text="TERMINAL OUTPUT", bg="#000000", fg="#444444", font=("Consolas", 8)).pack(side="left", padx=5)
+tk.Button(log_header, text="CANCEL TASKS", command=cancel_tasks, font=("Consolas", 8), bg="#000000", fg="#CF6679",
+          activebackground=COLOR_BTN_HOVER, bd=0, relief="flat", cursor="hand2").pack(side="right", padx=5)
 log_area = scrolledtext.ScrolledText(log_frame, bg="#000000", fg="#00FF00", font=("Consolas", 10), relief="flat")
 log_area.pack(fill="both", expand=True)
 
@@ -228,18 +564,19 @@ lbl_brand = tk.Label(sidebar, text="☁ CLOUD\nMANAGER", font=("Segoe UI", 18, "
 lbl_brand.pack()
 
 # Main Nav
-btn_nav_home = create_nav_btn(sidebar, "  Home", lambda: switch_frame(frame_home, btn_nav_home))
-btn_nav_vm = create_nav_btn(sidebar, "  Virtual Machines", lambda: switch_frame(frame_vm, btn_nav_vm))
-btn_nav_docker = create_nav_btn(sidebar, "  Docker", lambda: switch_frame(frame_docker, btn_nav_docker))
+btn_nav_home = create_nav_btn(sidebar, "  Home", lambda: open_page("home", btn_nav_home))
+btn_nav_vm = create_nav_btn(sidebar, "  Virtual Machines", lambda: open_page("vm", btn_nav_vm))
+btn_nav_docker = create_nav_btn(sidebar, "  Docker", lambda: open_page("docker", btn_nav_docker))
 
 # Spacer/Divider
 tk.Label(sidebar, text="SYSTEM TOOLS", font=("Segoe UI", 8, "bold"), bg=COLOR_BG_SIDEBAR, fg="#444444", pady=15).pack(anchor="w", padx=20)
 
-# The 4 Sidebar Tools (Vertically stacked)
+# The Sidebar Tools (Vertically stacked)
 create_sidebar_tool(sidebar, "⚙ Check Version", "version")
 create_sidebar_tool(sidebar, "📦 List Containers", "ps")
 create_sidebar_tool(sidebar, "🖼 List Images", "images")
 create_sidebar_tool(sidebar, "📝 Create Dockerfile", "create_df")
+create_sidebar_tool(sidebar, "⏱ Slowest Pulls", "history")
 
 # Exit at very bottom
 tk.Frame(sidebar, bg="#333333", height=1).pack(fill="x", pady=10, padx=10)
@@ -252,49 +589,94 @@ tk.Label(frame_home, text="Welcome Back!", font=FONT_HEADER, bg=COLOR_BG_MAIN, f
 tk.Label(frame_home, text="System Status: ONLINE", font=FONT_SUBHEADER, bg=COLOR_BG_MAIN, fg=COLOR_ACCENT).pack(anchor="w", pady=5)
 stats_frame = tk.Frame(frame_home, bg=COLOR_BG_MAIN)
 stats_frame.pack(fill="x", pady=30)
-def create_card(parent, title, var_value):
+def create_card(parent, title, var_value, detail_var=None):
     card = tk.Frame(parent, bg="#2C2C2C", padx=20, pady=20)
     card.pack(side="left", padx=10, fill="both", expand=True)
     tk.Label(card, text=title, font=FONT_BODY, bg="#2C2C2C", fg=COLOR_TEXT_DIM).pack(anchor="w")
     tk.Label(card, textvariable=var_value, font=("Segoe UI", 20, "bold"), bg="#2C2C2C", fg=COLOR_TEXT_MAIN).pack(anchor="w")
-create_card(stats_frame, "Active VMs", vm_status_var)
-create_card(stats_frame, "Containers", tk.StringVar(value="Ready"))
-create_card(stats_frame, "Disk Usage", tk.StringVar(value="Healthy"))
+    if detail_var is not None:
+        tk.Label(card, textvariable=detail_var, font=FONT_BODY, bg="#2C2C2C", fg=COLOR_TEXT_DIM).pack(anchor="w")
+    # Sparkline of the last few minutes, fed by the metrics sampler
+    spark = tk.Canvas(card, height=40, bg="#2C2C2C", highlightthickness=0)
+    spark.pack(fill="x", pady=(10, 0))
+    return spark
+vm_spark = create_card(stats_frame, "Active VMs", vm_status_var, vm_metrics_var)
+container_spark = create_card(stats_frame, "Containers", container_status_var, container_metrics_var)
+disk_spark = create_card(stats_frame, "Disk Usage", disk_status_var, disk_metrics_var)
+pages["home"] = frame_home
 
 # VM Page
-frame_vm = tk.Frame(main_area, bg=COLOR_BG_MAIN)
-tk.Label(frame_vm, text="Virtual Machine Manager", font=FONT_HEADER, bg=COLOR_BG_MAIN, fg=COLOR_TEXT_MAIN).pack(anchor="w", pady=(0, 20))
-ram_entry = create_input_row(frame_vm, "RAM Size:", "4G")
-cpu_entry = create_input_row(frame_vm, "CPU Cores:", "2")
-disk_entry = create_input_row(frame_vm, "Disk Size:", "5G")
-iso_entry = create_input_row(frame_vm, "ISO Filename:", "ubuntu-20.04.6-desktop-amd64.iso")
-btn_launch_vm = RoundedButton(frame_vm, text="LAUNCH VM", command=start_vm, width=250, height=45, bg_color=COLOR_ACCENT)
-btn_launch_vm.pack(pady=20, anchor="e", padx=20)
+def build_vm_page():
+    global vm_name_entry, ram_entry, cpu_entry, disk_entry, iso_entry, template_entry, vm_listbox
+    frame_vm = tk.Frame(main_area, bg=COLOR_BG_MAIN)
+    tk.Label(frame_vm, text="Virtual Machine Manager", font=FONT_HEADER, bg=COLOR_BG_MAIN, fg=COLOR_TEXT_MAIN).pack(anchor="w", pady=(0, 20))
+    vm_name_entry = create_input_row(frame_vm, "VM Name:", "vm1")
+    ram_entry = create_input_row(frame_vm, "RAM Size:", "4G")
+    cpu_entry = create_input_row(frame_vm, "CPU Cores:", "2")
+    disk_entry = create_input_row(frame_vm, "Disk Size:", "5G")
+    iso_entry = create_input_row(frame_vm, "ISO Filename:", "ubuntu-20.04.6-desktop-amd64.iso")
+    tk.Button(iso_entry.master, text="Browse…", command=open_iso_picker, font=FONT_BODY, bg="#2C2C2C", fg=COLOR_TEXT_DIM,
+              activebackground=COLOR_BTN_HOVER, bd=0, relief="flat", padx=10, cursor="hand2").pack(side="left", padx=(5, 0))
+    template_entry = create_input_row(frame_vm, "Template (optional):", "")
+    btn_launch_vm = RoundedButton(frame_vm, text="LAUNCH VM", command=start_vm, width=250, height=45, bg_color=COLOR_ACCENT)
+    btn_launch_vm.pack(pady=20, anchor="e", padx=20)
+    vm_listbox = tk.Listbox(frame_vm, height=8, bg="#2C2C2C", fg="white", font=("Consolas", 10), relief="flat",
+                            selectbackground=COLOR_ACCENT, highlightthickness=0)
+    vm_listbox.pack(fill="x", pady=5)
+    vm_buttons = tk.Frame(frame_vm, bg=COLOR_BG_MAIN)
+    vm_buttons.pack(fill="x")
+    RoundedButton(vm_buttons, text="STOP VM", command=stop_selected_vm, width=120, height=35,
+                  bg_color="#CF6679").pack(side="right", padx=(5, 20), pady=5)
+    RoundedButton(vm_buttons, text="SAVE STATE", command=suspend_selected_vm, width=120, height=35,
+                  bg_color="#BB86FC").pack(side="right", padx=5, pady=5)
+    RoundedButton(vm_buttons, text="RESUME", command=resume_vm, width=120, height=35,
+                  bg_color="#03DAC6").pack(side="right", pady=5)
+    return frame_vm
 
 # Docker Page (COMPACT VERSION)
-frame_docker = tk.Frame(main_area, bg=COLOR_BG_MAIN)
-tk.Label(frame_docker, text="Docker Management", font=FONT_HEADER, bg=COLOR_BG_MAIN, fg=COLOR_TEXT_MAIN).pack(anchor="w", pady=(0, 10))
-
-docker_input = create_input_row(frame_docker, "Pull Image Name:", "")
-btn_pull = RoundedButton(frame_docker, text="PULL IMAGE", command=lambda: docker_action("pull"), width=250, height=35, bg_color=COLOR_ACCENT)
-btn_pull.pack(pady=2, anchor="e", padx=20)
-
-docker_build_tag = create_input_row(frame_docker, "Build Image Tag:", "")
-btn_build = RoundedButton(frame_docker, text="BUILD IMAGE", command=lambda: docker_action("build"), width=250, height=35, bg_color="#BB86FC")
-btn_build.pack(pady=2, anchor="e", padx=20)
-
-docker_run_img = create_input_row(frame_docker, "Run Image Name:", "")
-docker_run_name = create_input_row(frame_docker, "Container Name:", "")
-btn_run = RoundedButton(frame_docker, text="RUN CONTAINER", command=lambda: docker_action("run"), width=250, height=35, bg_color="#03DAC6")
-btn_run.pack(pady=2, anchor="e", padx=20)
-
-docker_stop_input = create_input_row(frame_docker, "Stop Container ID:", "")
-btn_stop = RoundedButton(frame_docker, text="STOP CONTAINER", command=lambda: docker_action("stop"), width=250, height=35, bg_color="#CF6679")
-btn_stop.pack(pady=2, anchor="e", padx=20)
-
-docker_search_input = create_input_row(frame_docker, "Search Image:", "")
-btn_search = RoundedButton(frame_docker, text="SEARCH IMAGE", command=lambda: docker_action("search"), width=250, height=35, bg_color="#03DAC6")
-btn_search.pack(pady=2, anchor="e", padx=20)
-
-switch_frame(frame_home, btn_nav_home)
+def build_docker_page():
+    global docker_input, docker_build_tag, docker_run_img, docker_run_name, docker_stop_input, docker_search_input
+    global docker_logs_input, docker_logs_filter
+    frame_docker = tk.Frame(main_area, bg=COLOR_BG_MAIN)
+    tk.Label(frame_docker, text="Docker Management", font=FONT_HEADER, bg=COLOR_BG_MAIN, fg=COLOR_TEXT_MAIN).pack(anchor="w", pady=(0, 10))
+
+    docker_input = create_input_row(frame_docker, "Pull Image Name(s):", "")
+    tk.Label(frame_docker, textvariable=pull_status_var, font=FONT_BODY, bg=COLOR_BG_MAIN, fg=COLOR_TEXT_DIM).pack(anchor="w")
+    btn_pull = RoundedButton(frame_docker, text="PULL IMAGE", command=lambda: docker_action("pull"), width=250, height=35, bg_color=COLOR_ACCENT)
+    btn_pull.pack(pady=2, anchor="e", padx=20)
+
+    docker_build_tag = create_input_row(frame_docker, "Build Image Tag:", "")
+    btn_build = RoundedButton(frame_docker, text="BUILD IMAGE", command=lambda: docker_action("build"), width=250, height=35, bg_color="#BB86FC")
+    btn_build.pack(pady=2, anchor="e", padx=20)
+
+    docker_run_img = create_input_row(frame_docker, "Run Image Name:", "")
+    docker_run_name = create_input_row(frame_docker, "Container Name:", "")
+    btn_run = RoundedButton(frame_docker, text="RUN CONTAINER", command=lambda: docker_action("run"), width=250, height=35, bg_color="#03DAC6")
+    btn_run.pack(pady=2, anchor="e", padx=20)
+
+    docker_stop_input = create_input_row(frame_docker, "Stop Container ID:", "")
+    btn_stop = RoundedButton(frame_docker, text="STOP CONTAINER", command=lambda: docker_action("stop"), width=250, height=35, bg_color="#CF6679")
+    btn_stop.pack(pady=2, anchor="e", padx=20)
+
+    docker_search_input = create_input_row(frame_docker, "Search Image:", "")
+    btn_search = RoundedButton(frame_docker, text="SEARCH IMAGE", command=lambda: docker_action("search"), width=250, height=35, bg_color="#03DAC6")
+    btn_search.pack(pady=2, anchor="e", padx=20)
+
+    docker_logs_input = create_input_row(frame_docker, "Follow Logs (names):", "")
+    docker_logs_filter = create_input_row(frame_docker, "Log Filter (regex):", "")
+    logs_buttons = tk.Frame(frame_docker, bg=COLOR_BG_MAIN)
+    logs_buttons.pack(fill="x")
+    RoundedButton(logs_buttons, text="STOP LOGS", command=lambda: docker_action("stop_logs"), width=120, height=35,
+                  bg_color="#CF6679").pack(side="right", padx=(5, 20), pady=2)
+    RoundedButton(logs_buttons, text="FOLLOW LOGS", command=lambda: docker_action("logs"), width=125, height=35,
+                  bg_color=COLOR_ACCENT).pack(side="right", pady=2)
+    return frame_docker
+
+page_builders = {"vm": build_vm_page, "docker": build_docker_page}
+
+open_page("home", btn_nav_home)
+root.after_idle(start_backends)
+flush_log_queue()
+refresh_vm_status()
+refresh_metrics()
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,268 @@
+import glob
+import os
+import shutil
+import threading
+
+from qemu_profile import parse_size
+
+# --- SCHEDULER CONFIGURATION ---
+NODE_DIR = "/sys/devices/system/node"
+# Memory kept back for the host itself (page cache, QEMU overhead, the dashboard)
+HOST_RESERVED_BYTES = 1 << 30
+# vCPUs allowed per physical CPU; 1.0 means no CPU over-subscription
+CPU_OVERCOMMIT = float(os.environ.get("CPU_OVERCOMMIT", "1.0"))
+REJECT = "reject"
+QUEUE = "queue"
+
+
+class AdmissionError(Exception):
+    """Raised when a VM does not fit on the host and the policy is to reject"""
+    pass
+
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def read_meminfo(path="/proc/meminfo"):
+    """Returns {field: bytes} from a meminfo file (host-wide or per NUMA node)"""
+    info = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                fields = rest.split()
+                if not fields:
+                    continue
+                # Per-node files prefix every line with 'Node N'
+                key = key.split()[-1]
+                value = int(fields[0])
+                info[key] = value * 1024 if len(fields) > 1 and fields[1] == "kB" else value
+    except OSError:
+        pass
+    return info
+
+
+def resident_bytes(pid):
+    """Resident memory of a process (VmRSS), 0 when it is unknown or gone"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+class NumaNode:
+    def __init__(self, node_id, cpus, mem_total):
+        self.id = node_id
+        self.cpus = cpus
+        self.mem_total = mem_total
+        self.mem_reserved = 0
+        self.cpu_load = {cpu: 0 for cpu in cpus}
+
+
+def read_topology():
+    """NUMA nodes with their CPUs and memory; one node covering everything when sysfs has none"""
+    allowed = set(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else set(range(os.cpu_count() or 1))
+    nodes = []
+    for node_path in sorted(glob.glob(os.path.join(NODE_DIR, "node[0-9]*"))):
+        try:
+            with open(os.path.join(node_path, "cpulist")) as f:
+                cpus = [c for c in parse_cpulist(f.read()) if c in allowed]
+        except OSError:
+            continue
+        mem = read_meminfo(os.path.join(node_path, "meminfo")).get("MemTotal", 0)
+        if cpus:
+            nodes.append(NumaNode(int(os.path.basename(node_path)[4:]), cpus, mem))
+    if not nodes:
+        nodes = [NumaNode(0, sorted(allowed), read_meminfo().get("MemTotal", 0))]
+    return nodes
+
+
+class Reservation:
+    def __init__(self, name, ram_bytes, vcpus, node, cpus, spilled=False):
+        self.name = name
+        self.ram_bytes = ram_bytes
+        self.vcpus = vcpus
+        self.node = node
+        self.cpus = cpus
+        # True when no single node could hold the VM; its memory may then come from other nodes
+        self.spilled = spilled
+        self.pid = None  # set once QEMU runs, so the resident part of the reservation can be measured
+
+    def info(self):
+        return {"name": self.name, "ram_bytes": self.ram_bytes, "vcpus": self.vcpus,
+                "node": self.node.id, "cpus": self.cpus, "spilled": self.spilled}
+
+
+class HostScheduler:
+    """Admission control and NUMA-aware bin-packing for VM launches.
+
+    Every launch reserves RAM and vCPUs. A launch that does not fit is
+    rejected (AdmissionError) or queued until a running VM releases its share.
+    Admitted VMs are packed best-fit onto one NUMA node and their vCPUs are
+    spread over that node's least-loaded cores.
+    """
+
+    def __init__(self, policy=REJECT, reserved_bytes=HOST_RESERVED_BYTES, overcommit=CPU_OVERCOMMIT, nodes=None):
+        self.policy = policy
+        self.reserved_bytes = reserved_bytes
+        self.overcommit = overcommit
+        self.nodes = nodes or read_topology()
+        self.reservations = {}
+        self.queue = []
+        self._lock = threading.RLock()
+
+    # --- CAPACITY ---
+    def memory_budget(self):
+        """RAM that VMs may reserve: what is available now plus what our own VMs already have resident.
+
+        A guest faults its memory in lazily, so right after launch its reservation is still counted in
+        MemAvailable; only the resident part is added back, and free() subtracts every reservation at
+        full size.
+        """
+        info = read_meminfo()
+        available = info.get("MemAvailable", info.get("MemTotal", 0))
+        resident = sum(min(r.ram_bytes, resident_bytes(r.pid)) for r in self.reservations.values() if r.pid)
+        total = sum(n.mem_total for n in self.nodes) or info.get("MemTotal", 0)
+        return min(total, available + resident) - self.reserved_bytes
+
+    def free(self):
+        with self._lock:
+            held = sum(r.ram_bytes for r in self.reservations.values())
+            vcpus = sum(r.vcpus for r in self.reservations.values())
+            cpu_capacity = int(sum(len(n.cpus) for n in self.nodes) * self.overcommit)
+            return {"ram_bytes": max(0, self.memory_budget() - held), "vcpus": cpu_capacity - vcpus}
+
+    def _pick_node(self, ram_bytes, vcpus):
+        """Best fit: the node with the least room left that still holds the whole VM.
+        Returns (node, spilled); spilled is True when no node holds it."""
+        candidates = []
+        for node in self.nodes:
+            mem_free = (node.mem_total or self.memory_budget()) - node.mem_reserved
+            cpu_free = len(node.cpus) * self.overcommit - sum(node.cpu_load.values())
+            if ram_bytes <= mem_free and vcpus <= cpu_free:
+                candidates.append((mem_free - ram_bytes, cpu_free - vcpus, node.id, node))
+        if candidates:
+            return min(candidates)[3], False
+        # No single node fits: spill over the node with the most free memory (cross-node, but admitted)
+        return max(self.nodes, key=lambda n: (n.mem_total or 0) - n.mem_reserved), True
+
+    # --- RESERVATIONS ---
+    def admit(self, name, ram, vcpus, on_admit=None):
+        """Reserves resources for a VM.
+
+        Returns a Reservation, or None when the launch was queued (on_admit(reservation)
+        is then called later from whichever thread releases capacity).
+        """
+        ram_bytes, vcpus = parse_size(ram), int(vcpus)
+        with self._lock:
+            if name in self.reservations:
+                return self.reservations[name]
+            free = self.free()
+            if ram_bytes > free["ram_bytes"] or vcpus > free["vcpus"]:
+                message = (f"VM '{name}' needs {ram_bytes >> 20} MB / {vcpus} vCPU but only "
+                           f"{free['ram_bytes'] >> 20} MB / {max(free['vcpus'], 0)} vCPU are free")
+                if self.policy == QUEUE and on_admit is not None:
+                    self.queue.append((name, ram_bytes, vcpus, on_admit))
+                    return None
+                raise AdmissionError(message)
+            return self._reserve(name, ram_bytes, vcpus)
+
+    def _reserve(self, name, ram_bytes, vcpus):
+        node, spilled = self._pick_node(ram_bytes, vcpus)
+        cpus = sorted(node.cpus, key=lambda c: (node.cpu_load[c], c))[:vcpus]
+        if len(cpus) < vcpus:
+            cpus = [node.cpus[i % len(node.cpus)] for i in range(vcpus)]
+        for cpu in cpus:
+            node.cpu_load[cpu] += 1
+        node.mem_reserved += ram_bytes
+        reservation = Reservation(name, ram_bytes, vcpus, node, cpus, spilled)
+        self.reservations[name] = reservation
+        return reservation
+
+    def adopt(self, name, ram, vcpus):
+        """Accounts a VM that is already running (found at startup), whether or not it fits"""
+        with self._lock:
+            if name in self.reservations:
+                return self.reservations[name]
+            return self._reserve(name, parse_size(ram), int(vcpus))
+
+    def release(self, name):
+        """Frees a VM's share and admits queued launches that now fit (in FIFO order)"""
+        admitted = []
+        with self._lock:
+            reservation = self.reservations.pop(name, None)
+            if reservation:
+                reservation.node.mem_reserved -= reservation.ram_bytes
+                for cpu in reservation.cpus:
+                    reservation.node.cpu_load[cpu] -= 1
+            self.queue = [q for q in self.queue if q[0] != name]
+            while self.queue:
+                q_name, ram_bytes, vcpus, on_admit = self.queue[0]
+                free = self.free()
+                if ram_bytes > free["ram_bytes"] or vcpus > free["vcpus"]:
+                    break
+                self.queue.pop(0)
+                admitted.append((on_admit, self._reserve(q_name, ram_bytes, vcpus)))
+        for on_admit, reservation in admitted:
+            on_admit(reservation)
+
+    def cancel(self, name):
+        with self._lock:
+            self.queue = [q for q in self.queue if q[0] != name]
+
+    def status(self):
+        with self._lock:
+            return {"free": self.free(), "queued": [q[0] for q in self.queue],
+                    "reservations": [r.info() for r in self.reservations.values()],
+                    "nodes": [{"id": n.id, "cpus": n.cpus, "mem_total": n.mem_total, "mem_reserved": n.mem_reserved}
+                              for n in self.nodes]}
+
+
+# --- PINNING ---
+def numactl_prefix(reservation):
+    """Binds the whole QEMU process to the reserved cores and node memory from the first instruction.
+    A spilled VM only prefers its node: a strict bind to a node that cannot hold it would swap or OOM."""
+    if not shutil.which("numactl"):
+        return []
+    memory = f"--preferred={reservation.node.id}" if reservation.spilled else f"--membind={reservation.node.id}"
+    return ["numactl", f"--physcpubind={','.join(map(str, sorted(set(reservation.cpus))))}", memory]
+
+
+def pin_process(pid, cpus):
+    """Pins every thread of a running process to the given cores (Linux only; best effort)"""
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            os.sched_setaffinity(int(task), set(cpus))
+    except OSError:
+        return False
+    return True
+
+
+def pin_vcpus(vcpu_threads, cpus):
+    """Pins each vCPU thread (thread ids from QMP query-cpus-fast) to its own reserved core"""
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        for thread_id, cpu in zip(vcpu_threads, cpus):
+            os.sched_setaffinity(int(thread_id), {cpu})
+    except OSError:
+        return False
+    return True
+
+
+# Shared by the registry (and through it, the CLI menu and the GUI)
+scheduler = HostScheduler(policy=os.environ.get("VM_ADMISSION", REJECT))
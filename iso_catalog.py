@@ -0,0 +1,315 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CONFIGURATION PATHS ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ISO_DIR = os.path.join(BASE_DIR, "data", "iso")
+CATALOG_FILE = os.path.join(ISO_DIR, "catalog.json")
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+# Every chunk is hashed on its own, so hashing runs in parallel and resumes at the first missing chunk
+CHUNK_SIZE = 64 << 20
+READ_SIZE = 1 << 20
+SAVE_INTERVAL = 2.0
+
+# ISO9660: volume descriptors start at sector 16, one 2048-byte sector each
+SECTOR = 2048
+DESCRIPTOR_START = 16 * SECTOR
+MAX_DESCRIPTORS = 32
+TYPE_BOOT, TYPE_PRIMARY, TYPE_TERMINATOR = 0, 1, 255
+
+
+class ISOError(Exception):
+    pass
+
+
+# --- METADATA (mmap: only the few descriptor pages are ever read from disk) ---
+def _text(raw):
+    return raw.decode("ascii", "replace").strip(" \x00")
+
+
+def read_volume_info(path):
+    """Label, size and boot flag from the ISO9660 volume descriptors; None for files that are not ISO9660"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < DESCRIPTOR_START + SECTOR:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            info = None
+            bootable = False
+            for i in range(MAX_DESCRIPTORS):
+                offset = DESCRIPTOR_START + i * SECTOR
+                if offset + SECTOR > len(m) or m[offset + 1:offset + 6] != b"CD001":
+                    break
+                kind = m[offset]
+                if kind == TYPE_PRIMARY and info is None:
+                    block_size = int.from_bytes(m[offset + 128:offset + 130], "little")
+                    blocks = int.from_bytes(m[offset + 80:offset + 84], "little")
+                    created = _text(m[offset + 813:offset + 829])
+                    info = {"label": _text(m[offset + 40:offset + 72]), "system_id": _text(m[offset + 8:offset + 40]),
+                            "volume_size": blocks * block_size,
+                            "created": f"{created[:4]}-{created[4:6]}-{created[6:8]}" if created.isdigit() else ""}
+                elif kind == TYPE_BOOT and m[offset + 7:offset + 30] == b"EL TORITO SPECIFICATION":
+                    bootable = True
+                elif kind == TYPE_TERMINATOR:
+                    break
+            if info is not None:
+                info["bootable"] = bootable
+            return info
+
+
+def hash_chunk(path, index, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        offset, end = index * chunk_size, (index + 1) * chunk_size
+        while offset < end:
+            data = os.pread(fd, min(READ_SIZE, end - offset), offset)
+            if not data:
+                break
+            digest.update(data)  # hashlib releases the GIL on large buffers, so chunks hash in parallel
+            offset += len(data)
+    finally:
+        os.close(fd)
+    return digest.hexdigest()
+
+
+def combine(chunks):
+    """Content id of a whole image: sha256 over its chunk digests (not the distro's published sha256sum)"""
+    return hashlib.sha256(b"".join(bytes.fromhex(c) for c in chunks)).hexdigest()
+
+
+# --- CATALOG ---
+class ISOCatalog:
+    """Persistent index of the images in data/iso.
+
+    Listing and search only read catalog.json, so they stay instant however
+    many images there are. refresh() picks up new or changed files (a stat plus
+    a descriptor read each). hash_pending() fills in content hashes in the
+    background, and dedup() hard-links identical images under different names.
+    """
+
+    def __init__(self, catalog_file=CATALOG_FILE, iso_dir=ISO_DIR, chunk_size=CHUNK_SIZE):
+        self.catalog_file = catalog_file
+        self.iso_dir = iso_dir
+        self.chunk_size = chunk_size
+        self.entries = {}
+        self._lock = threading.RLock()
+        self._saved_at = 0.0
+        self._thread = None
+        self.load()
+
+    # --- PERSISTENCE ---
+    def load(self):
+        try:
+            with open(self.catalog_file, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("chunk_size") == self.chunk_size:
+            self.entries = data.get("isos", {})
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.catalog_file), exist_ok=True)
+            tmp = self.catalog_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"chunk_size": self.chunk_size, "isos": self.entries}, f, indent=1)
+            os.replace(tmp, self.catalog_file)
+            self._saved_at = time.monotonic()
+
+    # --- SCANNING ---
+    def refresh(self):
+        """Adds new images, re-reads changed ones and forgets deleted ones; no hashing"""
+        changed = False
+        with self._lock:
+            seen = set()
+            try:
+                files = [e for e in os.scandir(self.iso_dir) if e.name.lower().endswith(".iso") and e.is_file()]
+            except FileNotFoundError:
+                files = []
+            for e in files:
+                seen.add(e.name)
+                st = e.stat()
+                entry = self.entries.get(e.name)
+                if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                    entry["inode"] = st.st_ino  # a hard link from dedup() keeps size/mtime but changes the inode
+                    continue
+                try:
+                    volume = read_volume_info(e.path) or {}
+                except (OSError, ValueError):
+                    volume = {}
+                chunks = -(-st.st_size // self.chunk_size)
+                self.entries[e.name] = dict({"label": "", "system_id": "", "volume_size": 0, "created": "",
+                                             "bootable": False}, **volume,
+                                            size=st.st_size, mtime_ns=st.st_mtime_ns, inode=st.st_ino,
+                                            chunks=[None] * chunks, sha256=None if chunks else combine([]))
+                changed = True
+            for name in [n for n in self.entries if n not in seen]:
+                del self.entries[name]
+                changed = True
+            if changed:
+                self.save()
+        return changed
+
+    def pending(self):
+        with self._lock:
+            return [name for name, e in self.entries.items() if e["sha256"] is None]
+
+    def hash_pending(self, workers=HASH_WORKERS, progress=None):
+        """Hashes every missing chunk in a thread pool; progress(name, done, total) per finished chunk"""
+        jobs = []
+        with self._lock:
+            for name in self.pending():
+                entry = self.entries[name]
+                jobs += [(name, i) for i, c in enumerate(entry["chunks"]) if c is None]
+
+        def task(job):
+            name, i = job
+            return name, i, hash_chunk(os.path.join(self.iso_dir, name), i, self.chunk_size)
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for name, i, digest in pool.map(task, jobs):
+                with self._lock:
+                    entry = self.entries.get(name)
+                    if entry is None or i >= len(entry["chunks"]):
+                        continue  # the file changed or vanished while it was being hashed
+                    entry["chunks"][i] = digest
+                    done = sum(1 for c in entry["chunks"] if c)
+                    if done == len(entry["chunks"]):
+                        entry["sha256"] = combine(entry["chunks"])
+                    if time.monotonic() - self._saved_at > SAVE_INTERVAL:
+                        self.save()
+                if progress:
+                    progress(name, done, len(entry["chunks"]))
+        finally:
+            # On interrupt, queued chunks are dropped and finished ones are kept for the next run
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.save()
+
+    def scan_async(self, dedup=True):
+        """refresh + hash_pending (+ dedup) on a background thread; returns immediately"""
+        def run():
+            try:
+                self.refresh()
+                self.hash_pending()
+                if dedup:
+                    self.dedup()
+            except OSError as e:
+                print(f"[ERROR] ISO scan failed: {e}")
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=run, name="iso-catalog", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    # --- DEDUPLICATION ---
+    def duplicates(self):
+        """{sha256: [names]} for content present under more than one name"""
+        groups = {}
+        with self._lock:
+            for name, e in self.entries.items():
+                if e["sha256"]:
+                    groups.setdefault((e["sha256"], e["size"]), []).append(name)
+        return {digest: sorted(names) for (digest, _), names in groups.items() if len(names) > 1}
+
+    def dedup(self, dry_run=False):
+        """Hard-links duplicates to one copy; returns [(kept, linked, bytes freed)]"""
+        linked = []
+        for names in self.duplicates().values():
+            with self._lock:
+                keep = min(names, key=lambda n: self.entries[n]["mtime_ns"])
+                source = os.path.join(self.iso_dir, keep)
+                for name in names:
+                    entry = self.entries[name]
+                    if name == keep or entry["inode"] == self.entries[keep]["inode"]:
+                        continue
+                    target = os.path.join(self.iso_dir, name)
+                    if not dry_run:
+                        tmp = target + ".link.tmp"
+                        try:
+                            os.link(source, tmp)
+                            os.replace(tmp, target)
+                        except OSError as e:
+                            print(f"[ERROR] Could not link {name} to {keep}: {e}")
+                            continue
+                        st = os.stat(target)
+                        entry.update(inode=st.st_ino, mtime_ns=st.st_mtime_ns)
+                    linked.append((keep, name, entry["size"]))
+        if linked and not dry_run:
+            self.save()
+        return linked
+
+    # --- LOOKUP ---
+    def list(self):
+        with self._lock:
+            return [dict(e, name=n, chunks=None) for n, e in sorted(self.entries.items())]
+
+    def search(self, query=""):
+        """Every word of the query must appear in the file name or the volume label"""
+        words = query.lower().split()
+        results = []
+        for entry in self.list():
+            haystack = f"{entry['name']} {entry['label']}".lower()
+            if all(w in haystack for w in words):
+                results.append(entry)
+        return results
+
+    def resolve(self, name):
+        """Path of an image given by path, file name or volume label"""
+        if os.path.exists(name):
+            return name
+        if os.path.exists(os.path.join(self.iso_dir, name)):
+            return os.path.join(self.iso_dir, name)
+        with self._lock:
+            for file_name, e in self.entries.items():
+                if e["label"] and e["label"].lower() == name.lower():
+                    return os.path.join(self.iso_dir, file_name)
+        raise ISOError(f"ISO not found: {name}")
+
+
+def describe(entry):
+    label = f" [{entry['label']}]" if entry["label"] else ""
+    boot = "" if entry["bootable"] else " (not bootable)"
+    return f"{entry['name']}{label} {entry['size'] / 1e9:.1f} GB{boot}"
+
+
+# Shared by the CLI menu and the GUI picker
+catalog = ISOCatalog()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index, hash and deduplicate the ISOs in data/iso")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    find = sub.add_parser("search")
+    find.add_argument("query", nargs="+")
+    hash_cmd = sub.add_parser("hash", help="hash new images (resumes where a previous run stopped)")
+    hash_cmd.add_argument("-j", "--jobs", type=int, default=HASH_WORKERS)
+    dd = sub.add_parser("dedup", help="hard-link images with identical content")
+    dd.add_argument("-n", "--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    catalog.refresh()
+    if args.command == "list":
+        for e in catalog.list():
+            print(f"{describe(e)}  {(e['sha256'] or 'not hashed yet')[:16]}")
+    elif args.command == "search":
+        for e in catalog.search(" ".join(args.query)):
+            print(describe(e))
+    elif args.command == "hash":
+        started = time.time()
+        try:
+            catalog.hash_pending(args.jobs, progress=lambda n, done, total: print(f"\r{n}: {done}/{total} chunks", end=""))
+        except KeyboardInterrupt:
+            catalog.save()
+            print("\nInterrupted; the next run continues from here.")
+        print(f"\nHashed in {time.time() - started:.1f}s")
+    elif args.command == "dedup":
+        for keep, name, size in catalog.dedup(args.dry_run):
+            print(f"{name} -> {keep} ({size / 1e9:.1f} GB freed)")
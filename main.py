@@ -1,21 +1,28 @@
 import sys
 import os
 
-# Import the two parts we created earlier
+# The backends are imported when a menu entry or subcommand needs them, so `main.py --help`
+# and one-shot calls like `main.py docker ps` never pay for the VM side (or the other way round).
 # NOTE: The files must be named 'vm_manager.py' and 'docker_manager.py' for this to work!
-try:
-    import vm_manager
-    import docker_manager
-except ImportError as e:
-    print("CRITICAL ERROR: Could not import your modules.")
-    print(f"Details: {e}")
-    print("Make sure 'vm_manager.py' and 'docker_manager.py' are in the same folder as this file.")
-    sys.exit(1)
+def load_backend(name):
+    try:
+        return __import__(name)
+    except ImportError as e:
+        print("CRITICAL ERROR: Could not import your modules.")
+        print(f"Details: {e}")
+        print("Make sure 'vm_manager.py' and 'docker_manager.py' are in the same folder as this file.")
+        sys.exit(1)
+
+def clear_screen():
+    # ANSI home + erase on POSIX terminals instead of forking `clear` on every menu iteration
+    if os.name == 'nt':
+        os.system('cls')
+    elif sys.stdout.isatty():
+        print("\033[H\033[2J", end="", flush=True)
 
 def main_menu():
     while True:
-        # clear the console
-        os.system('cls' if os.name == 'nt' else 'clear')
+        clear_screen()
 
         print("========================================")
         print("      CLOUD MANAGEMENT SYSTEM           ")
@@ -24,13 +31,13 @@ def main_menu():
         print("2. Docker Management")
         print("3. Exit System")
         print("========================================")
-        
+
         choice = input(">> Enter your choice (1-3): ")
 
         if choice == '1':
             # Redirect to the VM Manager script
             try:
-                vm_manager.create_vm()
+                load_backend("vm_manager").create_vm()
             except Exception as e:
                 print(f"An error occurred in VM Manager: {e}")
             input("\nPress Enter to return to Main Menu...")
@@ -38,8 +45,7 @@ def main_menu():
         elif choice == '2':
             # Redirect to the Docker Manager script
             try:
-                docker_manager.docker_menu()
-                # pass  # Placeholder lehad ma abo hemed yebny el goz' betaa docker
+                load_backend("docker_manager").docker_menu()
             except Exception as e:
                 print(f"An error occurred in Docker Manager: {e}")
             # We don't need input() here because docker_menu has its own loop
@@ -52,5 +58,167 @@ def main_menu():
             print("\n[!] Invalid selection. Please try again.")
             input("Press Enter to continue...")
 
+# --- COMMAND LINE (no menu, no Tk) ---
+def reattach(registry):
+    # A VM still running from another session is adopted, so it is not booted (or snapshotted) twice
+    from state_store import store
+    store.attach(registry=registry)
+
+def vm_start(args):
+    vm_manager = load_backend("vm_manager")
+    if args.config:
+        file_path = args.config if os.path.exists(args.config) else os.path.join(vm_manager.CONFIG_DIR, args.config)
+        if not os.path.exists(file_path):
+            print(f"[ERROR] Config file not found at: {file_path}")
+            return 1
+        try:
+            name, ram, cpu, disk_size, disk_name, iso_path, template = vm_manager.load_config(file_path)
+        except (OSError, ValueError) as e:
+            print(f"Error reading config: {e}")
+            return 1
+    else:
+        name, ram, cpu, disk_size, template = args.name, args.ram, args.cpu, args.disk_size, args.template
+        disk_name = os.path.join(vm_manager.DISK_DIR, f"{name}.img")
+        iso_path = ""
+        if args.iso:
+            try:
+                iso_path = vm_manager.iso_catalog.resolve(args.iso)
+            except vm_manager.ISOError:
+                iso_path = os.path.join(vm_manager.ISO_DIR, args.iso)
+    reattach(vm_manager.registry)
+    ok = vm_manager.boot_vm(name, ram, cpu, disk_size, iso_path, disk_name, template,
+                            resume=args.resume, suspend=args.suspend)
+    return 0 if ok else 1
+
+def vm_snapshot(args):
+    vm_manager = load_backend("vm_manager")
+    from vm_snapshots import snapshots, describe, SnapshotError
+    disk_name = args.disk or os.path.join(vm_manager.DISK_DIR, f"{args.name}.img")
+    reattach(vm_manager.registry)
+    try:
+        vm_manager.registry.define(args.name, disk_path=disk_name)
+        if args.action == "snapshots":
+            entries = snapshots.list(args.name)
+            for entry in entries:
+                print(describe(entry))
+            if not entries:
+                print(f"VM '{args.name}' has no snapshots.")
+        elif args.action == "snapshot":
+            print(describe(snapshots.save(args.name, args.tag)))
+        else:
+            snapshots.delete(args.name, args.tag)
+            print(f"Deleted snapshot '{args.tag}' of '{args.name}'.")
+    except (SnapshotError, vm_manager.VMError) as e:
+        print(f"[ERROR] {e}")
+        return 1
+    return 0
+
+def docker_command(args):
+    docker_manager = load_backend("docker_manager")
+    if args.action == "pull":
+        ok = docker_manager.pull_images(args.images)
+    elif args.action == "build":
+        ok = docker_manager.build_image(args.path, args.tag)
+    elif args.action == "stop":
+        ok = docker_manager.run_docker_action("stop", container=args.container)
+    elif args.action == "search":
+        ok = docker_manager.run_docker_action("search", term=args.term)
+    elif args.action == "logs":
+        streams = ("stdout",) if args.stdout_only else ("stderr",) if args.stderr_only else ("stdout", "stderr")
+        ok = docker_manager.follow_logs(args.containers, args.grep, args.tail, args.follow, streams)
+    elif args.action == "run":
+        ok = docker_manager.run_docker_action("run", image=args.image, name=args.name)
+    else:
+        ok = docker_manager.run_docker_action(args.action)
+    return 0 if ok else 1
+
+def history(args):
+    from state_store import store, describe, parse_since
+    try:
+        since = parse_since(args.since) if args.since else None
+    except ValueError:
+        print(f"[ERROR] Invalid --since '{args.since}' (use e.g. 7d, 24h, 30m)")
+        return 1
+    if args.summary:
+        for row in store.summary(since):
+            print(f"{row['kind']:<16} {row['count']:>7} ops {row['failed']:>5} failed  "
+                  f"avg {row['avg_seconds'] or 0:8.2f}s  max {row['max_seconds'] or 0:8.2f}s")
+        return 0
+    if args.slowest:
+        if not args.kind:
+            print("[ERROR] --slowest needs --kind (e.g. pull, build, vm, command)")
+            return 1
+        operations = store.slowest(args.kind, since, args.limit)
+    else:
+        operations = store.operations(args.kind, args.target, since, args.limit)
+    for operation in operations:
+        print(describe(operation))
+    if not operations:
+        print("No recorded operations.")
+    return 0
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser(description="Cloud Management System (run without arguments for the menu)")
+    sub = parser.add_subparsers(dest="area")
+
+    vm = sub.add_parser("vm", help="virtual machines (QEMU)").add_subparsers(dest="action", required=True)
+    start = vm.add_parser("start", help="create the disk if needed and boot a VM")
+    start.add_argument("--config", help="VM config file (path, or a name in config/)")
+    start.add_argument("--name", default="vm")
+    start.add_argument("--ram", default="4G")
+    start.add_argument("--cpu", default="2")
+    start.add_argument("--disk-size", default="5G")
+    start.add_argument("--iso", help="ISO path, file name in data/iso or volume label")
+    start.add_argument("--template", help="boot an overlay of this disk template instead of an ISO")
+    start.add_argument("--resume", nargs="?", const="", metavar="TAG",
+                       help="continue from a saved RAM state (default: the newest) instead of booting")
+    start.add_argument("--suspend", action="store_true", help="Ctrl-C saves the RAM state before stopping")
+    start.set_defaults(handler=vm_start)
+    for action, text in (("snapshots", "list the snapshots of a stopped VM"),
+                         ("snapshot", "take a disk snapshot of a stopped VM"),
+                         ("delete-snapshot", "delete a snapshot of a stopped VM")):
+        snap = vm.add_parser(action, help=text)
+        snap.add_argument("name")
+        if action != "snapshots":
+            snap.add_argument("tag", nargs=None if action == "delete-snapshot" else "?")
+        snap.add_argument("--disk", help="disk image (default data/disks/<name>.img)")
+        snap.set_defaults(handler=vm_snapshot)
+
+    docker = sub.add_parser("docker", help="containers and images").add_subparsers(dest="action", required=True)
+    for action, text in (("ps", "list containers"), ("images", "list images"), ("version", "engine version")):
+        docker.add_parser(action, help=text)
+    docker.add_parser("stop", help="stop a container").add_argument("container")
+    docker.add_parser("search", help="search Docker Hub").add_argument("term")
+    docker.add_parser("pull", help="pull images in parallel").add_argument("images", nargs="+")
+    build = docker.add_parser("build", help="build an image")
+    build.add_argument("path", nargs="?", default=".")
+    build.add_argument("-t", "--tag", required=True)
+    run = docker.add_parser("run", help="run a container in the background")
+    run.add_argument("image")
+    run.add_argument("--name")
+    logs = docker.add_parser("logs", help="logs of one or more containers, interleaved")
+    logs.add_argument("containers", nargs="+")
+    logs.add_argument("-f", "--follow", action="store_true", help="keep streaming until Ctrl-C")
+    logs.add_argument("-n", "--tail", type=int, help="lines of history per container (default 100)")
+    logs.add_argument("--grep", help="only lines matching this regex")
+    which = logs.add_mutually_exclusive_group()
+    which.add_argument("--stdout-only", action="store_true")
+    which.add_argument("--stderr-only", action="store_true")
+    sub.choices["docker"].set_defaults(handler=docker_command)
+
+    past = sub.add_parser("history", help="recorded pulls, builds, VM runs and commands")
+    past.add_argument("--kind", help="pull, build, vm, command, snapshot.save, snapshot.restore")
+    past.add_argument("--target", help="one image, tag or VM name")
+    past.add_argument("--since", help="only the last 7d, 24h, 30m...")
+    past.add_argument("--slowest", action="store_true", help="longest first instead of newest first")
+    past.add_argument("--summary", action="store_true", help="counts and timings per kind")
+    past.add_argument("-n", "--limit", type=int, default=20)
+    past.set_defaults(handler=history)
+    return parser
+
 if __name__ == "__main__":
-    main_menu()
\ No newline at end of file
+    args = build_parser().parse_args()
+    if args.area is None:
+        main_menu()
+    sys.exit(args.handler(args))
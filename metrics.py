@@ -0,0 +1,345 @@
+import os
+import sys
+import threading
+import time
+from array import array
+
+from docker_inventory import inventory
+from vm_registry import registry
+
+# --- METRICS CONFIGURATION ---
+CGROUP_ROOT = "/sys/fs/cgroup"
+# Seconds between samples; tune with METRICS_INTERVAL (the GUI redraws at the same pace)
+SAMPLE_INTERVAL = float(os.environ.get("METRICS_INTERVAL", "2"))
+# Points kept per series (60 x 2s = the last two minutes)
+SERIES_POINTS = 60
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+FIELDS = ("cpu", "mem", "disk", "net")
+
+
+class Series:
+    """Fixed-size ring of floats in an array; appending never allocates"""
+
+    def __init__(self, size=SERIES_POINTS):
+        self.data = array("d", bytes(8 * size))
+        self.size = size
+        self.count = 0
+        self.pos = 0
+
+    def append(self, value):
+        self.data[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def values(self):
+        """Oldest first"""
+        if self.count < self.size:
+            return self.data[:self.count].tolist()
+        return (self.data[self.pos:] + self.data[:self.pos]).tolist()
+
+    def last(self):
+        return self.data[self.pos - 1] if self.count else 0.0
+
+
+def sparkline(values, width=None):
+    """Text sparkline for terminals: one block character per point"""
+    if width:
+        values = values[-width:]
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = (high - low) or 1.0
+    return "".join(SPARK_CHARS[int((v - low) / span * (len(SPARK_CHARS) - 1))] for v in values)
+
+
+# --- RAW READERS (counters are cumulative; the collector turns them into rates) ---
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _read_int(path):
+    try:
+        return int(_read(path).split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def net_bytes(pid):
+    """rx + tx of every non-loopback interface in the network namespace of a process"""
+    try:
+        lines = _read(f"/proc/{pid}/net/dev").splitlines()[2:]
+    except OSError:
+        return None
+    total = 0
+    for line in lines:
+        iface, _, counters = line.partition(b":")
+        if iface.strip() == b"lo":
+            continue
+        fields = counters.split()
+        total += int(fields[0]) + int(fields[8])
+    return total
+
+
+def process_counters(pid):
+    """(cpu seconds, resident bytes, disk bytes) of a process from /proc, or None once it is gone"""
+    try:
+        stat = _read(f"/proc/{pid}/stat")
+        rss_pages = int(_read(f"/proc/{pid}/statm").split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    # The command name may contain spaces, so fields are counted from the closing parenthesis
+    fields = stat[stat.rfind(b")") + 2:].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK
+    disk = 0
+    try:
+        for line in _read(f"/proc/{pid}/io").splitlines():
+            if line.startswith((b"read_bytes:", b"write_bytes:")):
+                disk += int(line.split()[1])
+    except OSError:
+        disk = None  # /proc/<pid>/io is not readable for other users' processes
+    return cpu, rss_pages * PAGE_SIZE, disk
+
+
+class ContainerCgroup:
+    """Reads a container's counters straight from its cgroup (v2 unified or v1 per-controller)"""
+
+    UNIFIED = os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers"))
+
+    def __init__(self, container_id):
+        self.id = container_id
+        self.paths = self._resolve()
+
+    def _resolve(self):
+        scopes = [f"system.slice/docker-{self.id}.scope", f"docker/{self.id}"]
+        controllers = [""] if self.UNIFIED else ["cpuacct", "memory", "blkio"]
+        paths = {}
+        for controller in controllers:
+            for scope in scopes:
+                path = os.path.join(CGROUP_ROOT, controller, scope)
+                if os.path.isdir(path):
+                    paths[controller] = path
+                    break
+        return paths
+
+    @property
+    def found(self):
+        return bool(self.paths)
+
+    def _file(self, controller, name):
+        base = self.paths.get("" if self.UNIFIED else controller)
+        return os.path.join(base, name) if base else None
+
+    def counters(self):
+        """(cpu seconds, memory bytes, disk bytes, net bytes); missing values are None"""
+        if self.UNIFIED:
+            cpu = mem = disk = None
+            try:
+                for line in _read(self._file("", "cpu.stat")).splitlines():
+                    if line.startswith(b"usage_usec"):
+                        cpu = int(line.split()[1]) / 1e6
+                        break
+                mem = _read_int(self._file("", "memory.current"))
+                disk = 0
+                for line in _read(self._file("", "io.stat")).splitlines():
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition(b"=")
+                        if key in (b"rbytes", b"wbytes"):
+                            disk += int(value)
+            except (OSError, TypeError):
+                pass
+            procs = self._file("", "cgroup.procs")
+        else:
+            usage = _read_int(self._file("cpuacct", "cpuacct.usage") or "")
+            cpu = usage / 1e9 if usage is not None else None
+            memory = self._file("memory", "memory.usage_in_bytes")
+            mem = _read_int(memory) if memory else None
+            disk = None
+            blkio = self._file("blkio", "blkio.throttle.io_service_bytes")
+            try:
+                for line in _read(blkio).splitlines() if blkio else ():
+                    if line.startswith(b"Total"):
+                        disk = int(line.split()[1])
+            except OSError:
+                pass
+            procs = self._file("cpuacct", "cgroup.procs") or self._file("memory", "cgroup.procs")
+        net = None
+        try:
+            # Any process of the container sees the container's network namespace
+            pid = _read(procs).split(None, 1)[0].decode() if procs else None
+            net = net_bytes(pid) if pid else None
+        except (OSError, IndexError):
+            pass
+        return cpu, mem, disk, net
+
+
+# --- COLLECTOR ---
+class Workload:
+    def __init__(self, kind, name, points):
+        self.kind = kind
+        self.name = name
+        self.series = {field: Series(points) for field in FIELDS}
+        self.previous = None
+        self.seen = 0.0
+
+    def latest(self):
+        return {field: self.series[field].last() for field in FIELDS}
+
+
+class MetricsCollector:
+    """Background sampler for every running VM and container.
+
+    VMs are read from /proc/<pid> of their QEMU process and containers from
+    their cgroup files, so a sample never goes through QMP or the Docker
+    daemon. Each workload keeps a fixed-size series per metric: cpu (% of one
+    core), mem (bytes), disk and net (bytes/s). QEMU's user-mode network has
+    no per-guest counter on the host, so VM net stays at 0.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, points=SERIES_POINTS):
+        self.interval = interval
+        self.points = points
+        self.workloads = {}
+        self.totals = {kind: {field: Series(points) for field in FIELDS} for kind in ("vm", "container")}
+        self.sample_cpu = Series(points)
+        self._cgroups = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """callback() runs on the sampler thread after every sample"""
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            for callback in list(self._listeners):
+                callback()
+            self._stop.wait(self.interval)
+
+    # --- SAMPLING ---
+    def targets(self):
+        """(kind, name, reader) for every workload that should be sampled now"""
+        for vm in registry.running():
+            if vm.pid:
+                yield "vm", vm.name, lambda pid=vm.pid: _vm_counters(pid)
+        if inventory.ready:
+            for c in inventory.container_list():
+                if c.get("State") != "running":
+                    continue
+                cgroup = self._cgroups.get(c["Id"])
+                if cgroup is None or not cgroup.found:
+                    cgroup = self._cgroups[c["Id"]] = ContainerCgroup(c["Id"])
+                if cgroup.found:
+                    name = (c.get("Names") or [c["Id"][:12]])[0].lstrip("/")
+                    yield "container", name, cgroup.counters
+
+    def sample(self):
+        started_cpu, now = time.process_time(), time.monotonic()
+        totals = {kind: dict.fromkeys(FIELDS, 0.0) for kind in self.totals}
+        with self._lock:
+            for kind, name, reader in list(self.targets()):
+                counters = reader()
+                if counters is None:
+                    continue
+                workload = self.workloads.get((kind, name))
+                if workload is None:
+                    workload = self.workloads[(kind, name)] = Workload(kind, name, self.points)
+                rates = self._rates(workload, counters, now)
+                workload.previous, workload.seen = (now, counters), now
+                if rates is None:
+                    continue  # first sample only sets the baseline
+                for field, value in zip(FIELDS, rates):
+                    workload.series[field].append(value)
+                    totals[kind][field] += value
+            # Workloads that were not seen this round have stopped
+            for key in [k for k, w in self.workloads.items() if w.seen != now]:
+                del self.workloads[key]
+            live_ids = {c["Id"] for c in inventory.container_list()} if inventory.ready else set()
+            for cid in [cid for cid in self._cgroups if cid not in live_ids]:
+                del self._cgroups[cid]
+            for kind, values in totals.items():
+                for field, value in values.items():
+                    self.totals[kind][field].append(value)
+            self.sample_cpu.append(time.process_time() - started_cpu)
+
+    @staticmethod
+    def _rates(workload, counters, now):
+        if workload.previous is None:
+            return None
+        then, previous = workload.previous
+        elapsed = max(now - then, 1e-6)
+
+        def rate(current, before):
+            if current is None or before is None:
+                return 0.0
+            return max(current - before, 0) / elapsed
+
+        cpu, mem, disk, net = counters
+        return rate(cpu, previous[0]) * 100, float(mem or 0), rate(disk, previous[2]), rate(net, previous[3])
+
+    # --- READS ---
+    def series(self, kind, field, name=None):
+        """Points for one workload, or the sum over all workloads of that kind when name is None"""
+        with self._lock:
+            if name is None:
+                return self.totals[kind][field].values()
+            workload = self.workloads.get((kind, name))
+            return workload.series[field].values() if workload else []
+
+    def snapshot(self):
+        with self._lock:
+            return [dict(w.latest(), kind=w.kind, name=w.name) for w in self.workloads.values()]
+
+    def overhead(self):
+        """Share of one CPU the sampler itself used, averaged over the kept samples"""
+        samples = self.sample_cpu.values()
+        return sum(samples) / (len(samples) * self.interval) * 100 if samples else 0.0
+
+
+def _vm_counters(pid):
+    counters = process_counters(pid)
+    return None if counters is None else counters + (None,)
+
+
+def human_bytes(value):
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.0f}{unit}"
+        value /= 1024
+    return f"{value:.1f}TB"
+
+
+# Shared by the GUI cards and the CLI
+collector = MetricsCollector()
+
+
+if __name__ == "__main__":
+    # python metrics.py [seconds]  -> prints a live table (the inventory is started for container data)
+    inventory.start()
+    collector.start()
+    try:
+        deadline = time.monotonic() + float(sys.argv[1]) if len(sys.argv) > 1 else None
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(collector.interval)
+            print(f"\n{'KIND':<10} {'NAME':<24} {'CPU%':>6} {'MEM':>8} {'DISK/s':>8} {'NET/s':>8}  CPU")
+            for row in sorted(collector.snapshot(), key=lambda r: (r["kind"], r["name"])):
+                trend = sparkline(collector.series(row["kind"], "cpu", row["name"]), 20)
+                print(f"{row['kind']:<10} {row['name']:<24} {row['cpu']:>6.1f} {human_bytes(row['mem']):>8} "
+                      f"{human_bytes(row['disk']):>8} {human_bytes(row['net']):>8}  {trend}")
+            print(f"sampler overhead: {collector.overhead():.3f}% of one CPU")
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,140 @@
+import functools
+import os
+import threading
+import time
+
+# --- PROFILING CONFIGURATION ---
+# Opt-in: PROFILE_ACTIONS=cprofile or PROFILE_ACTIONS=tracemalloc. Unset means the decorator is a no-op.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.path.join(BASE_DIR, "logs", "profiles")
+MODE = os.environ.get("PROFILE_ACTIONS", "").strip().lower()
+TOP_ALLOCATIONS = 10
+
+if MODE:
+    # Only loaded when profiling is on; the decorator is on the cold-start path of every backend
+    import atexit
+    import cProfile
+    import inspect
+    import json
+    import pstats
+    import tracemalloc
+
+_lock = threading.Lock()
+# Only one cProfile session can be active per process (sys.monitoring is global since 3.12)
+_profiler_busy = threading.Lock()
+_local = threading.local()
+_records = {}
+
+
+class _Record:
+    def __init__(self):
+        self.calls = 0
+        self.profiled = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.peak_bytes = 0
+        self.stats = None
+        self.top = []
+
+    def as_dict(self):
+        return {"calls": self.calls, "profiled_calls": self.profiled, "total_seconds": round(self.seconds, 6),
+                "max_seconds": round(self.max_seconds, 6), "peak_bytes": self.peak_bytes, "top_allocations": self.top}
+
+
+class _Session:
+    """One measured call; nested profiled calls inside it are only timed"""
+
+    def __init__(self, name):
+        self.name = name
+        self.profile = None
+        self.nested = getattr(_local, "active", False)
+        self.measured = False
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.nested:
+            return self
+        _local.active = True
+        if MODE == "cprofile" and _profiler_busy.acquire(blocking=False):
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            self.measured = True
+        elif MODE == "tracemalloc":
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(5)
+            tracemalloc.reset_peak()  # process-wide, so concurrent actions share one peak
+            self.measured = True
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        if self.profile is not None:
+            self.profile.disable()
+            _profiler_busy.release()
+        peak = tracemalloc.get_traced_memory()[1] if MODE == "tracemalloc" and self.measured else 0
+        top = []
+        if peak:
+            top = [f"{s.traceback[0].filename}:{s.traceback[0].lineno} {s.size}"
+                   for s in tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]]
+        if not self.nested:
+            _local.active = False
+        with _lock:
+            record = _records.setdefault(self.name, _Record())
+            record.calls += 1
+            record.seconds += elapsed
+            record.max_seconds = max(record.max_seconds, elapsed)
+            record.profiled += self.measured
+            if self.profile is not None:
+                if record.stats is None:
+                    record.stats = pstats.Stats(self.profile)
+                else:
+                    record.stats.add(self.profile)
+            if peak > record.peak_bytes:
+                record.peak_bytes, record.top = peak, top
+        return False
+
+
+def profiled(name=None):
+    """Decorator for backend actions; wraps plain functions and generators (timed until exhausted)"""
+    def decorate(fn):
+        if not MODE:
+            return fn
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                with _Session(label):
+                    return (yield from fn(*args, **kwargs))
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Session(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summary():
+    with _lock:
+        return {name: record.as_dict() for name, record in _records.items()}
+
+
+def dump(directory=PROFILE_DIR):
+    """Writes summary.json plus one .prof per action (open with `python -m pstats` or snakeviz)"""
+    if not _records:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    with _lock:
+        for name, record in _records.items():
+            if record.stats is not None:
+                record.stats.dump_stats(os.path.join(directory, f"{name}-{stamp}.prof"))
+    path = os.path.join(directory, f"summary-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump({"mode": MODE, "actions": summary()}, f, indent=4)
+    return path
+
+
+if MODE:
+    atexit.register(dump)
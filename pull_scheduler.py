@@ -0,0 +1,201 @@
+import http.client
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker_engine
+from docker_engine import DockerEngineError, split_image
+from command_runner import runner, STDERR_PREFIX
+from docker_inventory import inventory
+from profiling import profiled
+from state_store import store
+
+# --- SCHEDULER CONFIGURATION ---
+DEFAULT_CONCURRENCY = 4
+
+QUEUED = "queued"
+PULLING = "pulling"
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+LAYER_DONE = ("Pull complete", "Already exists")
+
+
+def normalize(image):
+    """'nginx' -> 'nginx:latest' so the same image is never pulled twice under two spellings"""
+    name, tag = split_image(image.strip())
+    return name if not tag else f"{name}:{tag}"
+
+
+class PullProgress:
+    """Per-layer progress of one image, rolled up into a single figure.
+
+    The pull thread updates it while the GUI and the API read summaries, so both go through the lock.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.state = QUEUED
+        self.layers = {}
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update(self, message):
+        layer = message.get("id")
+        status = message.get("status", "")
+        with self._lock:
+            if "error" in message:
+                self.error = message["error"]
+            if not layer or layer == self.image.rpartition(":")[2]:
+                return
+            entry = self.layers.setdefault(layer, {"current": 0, "total": 0, "done": False})
+            detail = message.get("progressDetail") or {}
+            if status == "Downloading" and detail.get("total"):
+                entry["current"], entry["total"] = detail.get("current", 0), detail["total"]
+            if status in LAYER_DONE:
+                entry["done"] = True
+                entry["current"] = entry["total"]
+
+    def summary(self):
+        with self._lock:
+            layers = [dict(layer) for layer in self.layers.values()]
+        done = sum(1 for layer in layers if layer["done"])
+        current = sum(layer["current"] for layer in layers)
+        total = sum(layer["total"] for layer in layers)
+        if self.state in (DONE, SKIPPED):
+            percent = 100.0
+        elif total:
+            percent = 100.0 * current / total
+        else:
+            percent = 100.0 * done / len(layers) if layers else 0.0
+        return {"image": self.image, "state": self.state, "layers": len(layers), "layers_done": done,
+                "bytes": current, "total_bytes": total, "percent": round(percent, 1), "error": self.error}
+
+
+class PullScheduler:
+    """Pulls many images with a concurrency limit.
+
+    Images already present locally are skipped, and asking for an image that
+    is already queued or pulling returns the existing future instead of a
+    second pull.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY):
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="pull")
+        # Re-entrant: a pull that is already over when submit() adds its done callback runs _forget right there
+        self._lock = threading.RLock()
+        self._inflight = {}
+        self.progress = {}
+
+    def local_images(self):
+        if inventory.ready:
+            images = inventory.image_list()
+        else:
+            engine = docker_engine.get_engine()
+            if engine is None:
+                return set()
+            images = engine.images()
+        return {normalize(tag) for image in images for tag in (image.get("RepoTags") or [])}
+
+    def submit(self, images):
+        """Schedules pulls; returns {image: Future} (the future resolves to the final state)"""
+        try:
+            present = self.local_images()
+        except (DockerEngineError, OSError, http.client.HTTPException):
+            present = set()
+        futures = {}
+        with self._lock:
+            if not self._inflight:
+                self._clear_finished()  # a new batch: the aggregates only cover what is pulled from now on
+            for image in dict.fromkeys(normalize(i) for i in images if i.strip()):
+                if image in self._inflight:
+                    futures[image] = self._inflight[image]
+                    continue
+                progress = self.progress[image] = PullProgress(image)
+                if image in present:
+                    progress.state = SKIPPED
+                    futures[image] = self._pool.submit(lambda: SKIPPED)
+                    continue
+                future = self._pool.submit(self._pull, progress)
+                self._inflight[image] = future
+                future.add_done_callback(lambda _, image=image: self._forget(image))
+                futures[image] = future
+        return futures
+
+    def _forget(self, image):
+        with self._lock:
+            self._inflight.pop(image, None)
+
+    @profiled("pull")
+    def _pull(self, progress):
+        progress.state = PULLING
+        progress.started_at = time.time()
+        engine = docker_engine.get_engine()
+        try:
+            if engine is not None:
+                for message in engine.pull(progress.image):
+                    progress.update(message)
+            else:
+                # The CLI prints 'layer: status' lines without byte counts when piped
+                command = runner.start(["docker", "pull", progress.image], label="docker pull")
+                complaint = None
+                for line in command.lines():
+                    if line.startswith(STDERR_PREFIX):
+                        complaint = line[len(STDERR_PREFIX):].strip() or complaint  # e.g. 'manifest unknown'
+                        continue
+                    layer, _, status = line.strip().partition(": ")
+                    progress.update({"id": layer, "status": status} if status else {"status": line.strip()})
+                if not command.ok:
+                    progress.error = progress.error or complaint or f"docker pull {command.error or command.state}"
+        except (DockerEngineError, OSError, http.client.HTTPException) as e:
+            # e.g. IncompleteRead when the daemon drops the stream; still a failed pull, not a crashed future
+            if not isinstance(e, DockerEngineError):
+                docker_engine.drop_engine(engine)
+            progress.error = str(e) or type(e).__name__
+        progress.state = FAILED if progress.error else DONE
+        progress.finished_at = time.time()
+        summary = progress.summary()
+        store.record("pull", progress.image, progress.state, progress.started_at,
+                     progress.finished_at - progress.started_at, bytes=summary["total_bytes"],
+                     layers=summary["layers"], error=progress.error)
+        return progress.state
+
+    def summaries(self):
+        with self._lock:
+            progress = list(self.progress.values())  # workers add entries while we read
+        return [p.summary() for p in progress]
+
+    def error(self, image):
+        with self._lock:
+            progress = self.progress.get(normalize(image))
+        return progress.error if progress else None
+
+    def overall(self):
+        """One aggregate view of the current batch of pulls, for the GUI"""
+        summaries = self.summaries()
+        states = [s["state"] for s in summaries]
+        total = sum(s["total_bytes"] for s in summaries)
+        current = sum(s["bytes"] for s in summaries)
+        return {
+            "images": len(summaries),
+            "active": states.count(PULLING) + states.count(QUEUED),
+            "done": states.count(DONE) + states.count(SKIPPED),
+            "failed": states.count(FAILED),
+            "bytes": current, "total_bytes": total,
+            "percent": round(sum(s["percent"] for s in summaries) / len(summaries), 1) if summaries else 0.0,
+        }
+
+    def clear_finished(self):
+        with self._lock:
+            self._clear_finished()
+
+    def _clear_finished(self):
+        for image in [i for i, p in self.progress.items() if p.state in (DONE, SKIPPED, FAILED)]:
+            del self.progress[image]
+
+
+# Shared by the CLI menu and the GUI
+scheduler = PullScheduler()
@@ -0,0 +1,160 @@
+import errno
+import functools
+import os
+import subprocess
+import sys
+
+# Stub binaries can be used for testing, same as in vm_registry
+QEMU_SYSTEM = os.environ.get("QEMU_SYSTEM", "qemu-system-x86_64")
+HUGEPAGES_MOUNT = "/dev/hugepages"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RUN_DIR = os.path.join(BASE_DIR, "data", "run")
+
+SIZE_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(value, default_unit="M"):
+    """'4G' -> bytes. Bare numbers use QEMU's default unit for -m (MiB)"""
+    value = str(value).strip().upper().rstrip("B")
+    if value and value[-1] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(float(value) * SIZE_UNITS[default_unit])
+
+
+# --- HOST PROBES ---
+@functools.lru_cache(maxsize=None)
+def supported_accels(qemu=QEMU_SYSTEM):
+    """Accelerators compiled into the QEMU binary (empty if it cannot be asked)"""
+    try:
+        out = subprocess.run([qemu, "-accel", "help"], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return frozenset()
+    return frozenset(line.strip() for line in out.splitlines()[1:] if line.strip())
+
+
+def kvm_usable():
+    return os.path.exists("/dev/kvm") and os.access("/dev/kvm", os.R_OK | os.W_OK)
+
+
+def detect_accel(qemu=QEMU_SYSTEM):
+    """Best accelerator for this host: kvm / hvf / whpx, else multi-threaded TCG"""
+    built_in = supported_accels(qemu)
+
+    def available(name):
+        return not built_in or name in built_in
+
+    if sys.platform.startswith("linux") and kvm_usable() and available("kvm"):
+        return "kvm"
+    if sys.platform == "darwin" and available("hvf"):
+        return "hvf"
+    if os.name == "nt" and available("whpx"):
+        return "whpx"
+    return "tcg"
+
+
+def hugepages_free():
+    """Bytes of free huge pages, 0 if none are reserved or hugetlbfs is not mounted"""
+    if not os.path.ismount(HUGEPAGES_MOUNT):
+        return 0
+    info = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                info[key] = rest.split()
+    except OSError:
+        return 0
+    try:
+        return int(info["HugePages_Free"][0]) * int(info["Hugepagesize"][0]) * 1024
+    except (KeyError, IndexError, ValueError):
+        return 0
+
+
+def direct_io_supported(path):
+    """False when the disk's filesystem rejects O_DIRECT (tmpfs, some FUSE/overlay mounts): QEMU would
+    then refuse to open it with cache=none. A disk not created yet is probed through its folder."""
+    if not hasattr(os, "O_DIRECT"):
+        return False
+    try:
+        if os.path.exists(path):
+            os.close(os.open(path, os.O_RDONLY | os.O_DIRECT))
+        else:
+            probe = os.path.join(os.path.dirname(os.path.abspath(path)), f".direct-io-{os.getpid()}")
+            os.close(os.open(probe, os.O_CREAT | os.O_EXCL | os.O_WRONLY | os.O_DIRECT, 0o600))
+            os.remove(probe)
+    except OSError as e:
+        return e.errno != errno.EINVAL  # anything else (missing folder...) is not about O_DIRECT
+    return True
+
+
+def qmp_socket_path(vm_name):
+    return os.path.join(RUN_DIR, f"{vm_name}.qmp")
+
+
+def escape(value):
+    """QEMU option values use ',' as a separator, so literal commas are doubled"""
+    return str(value).replace(",", ",,")
+
+
+def disk_format(path):
+    try:
+        with open(path, "rb") as f:
+            return "qcow2" if f.read(4) == b"QFI\xfb" else "raw"
+    except OSError:
+        return "qcow2"
+
+
+# --- PROFILE BUILDER ---
+ACCEL_ARGS = {
+    "kvm": ["-accel", "kvm", "-cpu", "host"],
+    "hvf": ["-accel", "hvf", "-cpu", "host"],
+    "whpx": ["-accel", "whpx,kernel-irqchip=off"],
+    "tcg": ["-accel", "tcg,thread=multi", "-cpu", "max"],
+}
+
+
+def build_argv(name, ram, cpu, disk_path, iso_path=None, qmp_socket=None, accel=None,
+               disk_bus="virtio-blk", hugepages=None, qemu=QEMU_SYSTEM, loadvm=None, incoming=None):
+    """Builds a tuned qemu-system argv list for one guest.
+
+    accel and hugepages are probed from the host when left as None. disk_bus is
+    'virtio-blk' or 'virtio-scsi'; either way the disk gets its own iothread.
+    loadvm (an internal snapshot tag) or incoming (a migration URI) resume a
+    saved guest instead of booting it; the rest of the argv must match the save.
+    """
+    accel = accel or detect_accel(qemu)
+    ram_bytes = parse_size(ram)
+    if hugepages is None:
+        hugepages = accel == "kvm" and hugepages_free() >= ram_bytes
+
+    argv = [qemu, "-name", name, "-machine", "q35"] + ACCEL_ARGS[accel]
+    argv += ["-m", f"{ram_bytes >> 20}M", "-smp", str(cpu)]
+    if hugepages:
+        argv += ["-mem-path", HUGEPAGES_MOUNT, "-mem-prealloc"]
+
+    # Host page cache is bypassed (cache=none) wherever O_DIRECT + native AIO exist
+    if sys.platform.startswith("linux") and direct_io_supported(disk_path):
+        cache, aio = "none", "native"
+    else:
+        cache, aio = "writeback", "threads"
+    argv += [
+        "-object", "iothread,id=io0",
+        "-drive", f"file={escape(disk_path)},if=none,id=disk0,format={disk_format(disk_path)},"
+                  f"cache={cache},aio={aio},discard=unmap",
+    ]
+    if disk_bus == "virtio-scsi":
+        argv += ["-device", "virtio-scsi-pci,id=scsi0,iothread=io0",
+                 "-device", "scsi-hd,drive=disk0,bus=scsi0.0"]
+    else:
+        argv += ["-device", "virtio-blk-pci,drive=disk0,iothread=io0"]
+
+    argv += ["-nic", "user,model=virtio-net-pci"]
+    if iso_path:
+        argv += ["-drive", f"file={escape(iso_path)},media=cdrom,readonly=on", "-boot", "order=c,once=d"]
+    if qmp_socket:
+        argv += ["-qmp", f"unix:{escape(qmp_socket)},server=on,wait=off"]
+    if loadvm:
+        argv += ["-loadvm", loadvm]
+    if incoming:
+        argv += ["-incoming", incoming]
+    return argv
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+# --- QMP CONFIGURATION ---
+QMP_TIMEOUT = 5
+POLL_INTERVAL = 2
+
+
+class QMPError(Exception):
+    """Raised when QEMU answers a command with an error (or the socket goes away)"""
+    pass
+
+
+class QMPClient:
+    """Minimal asyncio client for the QEMU Machine Protocol over a Unix socket"""
+
+    def __init__(self, path, timeout=QMP_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.greeting = None
+        self.events = []
+        self._reader = None
+        self._writer = None
+        self._next_id = 0
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(self.path), self.timeout)
+        self.greeting = await self._read_message()
+        if "QMP" not in self.greeting:
+            raise QMPError(f"Unexpected greeting: {self.greeting}")
+        await self.execute("qmp_capabilities")
+        return self
+
+    async def close(self):
+        if self._writer:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _read_message(self):
+        line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+        if not line:
+            raise QMPError("QMP socket closed")
+        return json.loads(line)
+
+    async def execute(self, command, arguments=None):
+        """Sends one command and returns its 'return' value; events seen meanwhile are kept in self.events"""
+        async with self._lock:
+            self._next_id += 1
+            request = {"execute": command, "id": self._next_id}
+            if arguments:
+                request["arguments"] = arguments
+            self._writer.write(json.dumps(request).encode() + b"\n")
+            await self._writer.drain()
+            while True:
+                message = await self._read_message()
+                if "event" in message:
+                    self.events.append(message)
+                    continue
+                if message.get("id") not in (None, self._next_id):
+                    continue
+                if "error" in message:
+                    raise QMPError(f"{command}: {message['error'].get('desc', message['error'])}")
+                return message.get("return")
+
+    # --- COMMANDS ---
+    async def query_status(self):
+        return await self.execute("query-status")
+
+    async def query_blockstats(self):
+        return await self.execute("query-blockstats")
+
+    async def query_cpus(self):
+        return await self.execute("query-cpus-fast")
+
+    async def system_powerdown(self):
+        return await self.execute("system_powerdown")
+
+    async def quit(self):
+        try:
+            return await self.execute("quit")
+        except QMPError:
+            # QEMU may close the socket before the reply makes it out
+            return None
+
+    async def stats(self):
+        status, blocks, cpus = await self.query_status(), await self.query_blockstats(), await self.query_cpus()
+        read_bytes = sum(b.get("stats", {}).get("rd_bytes", 0) for b in blocks)
+        write_bytes = sum(b.get("stats", {}).get("wr_bytes", 0) for b in blocks)
+        return {
+            "status": status.get("status"), "running": status.get("running"),
+            "vcpus": len(cpus), "vcpu_threads": [c.get("thread-id") for c in cpus],
+            "rd_bytes": read_bytes, "wr_bytes": write_bytes, "sampled_at": time.time(),
+        }
+
+
+# --- ONE-SHOT HELPERS (for the CLI menu and GUI callbacks) ---
+async def _call(path, command, arguments=None, timeout=QMP_TIMEOUT):
+    async with QMPClient(path, timeout) as qmp:
+        if command == "stats":
+            return await qmp.stats()
+        if command == "quit":
+            return await qmp.quit()
+        return await qmp.execute(command, arguments)
+
+
+def qmp_call(path, command, arguments=None, timeout=QMP_TIMEOUT):
+    """Runs one QMP command synchronously; raises QMPError/OSError if the VM is unreachable"""
+    return asyncio.run(_call(path, command, arguments, timeout))
+
+
+async def collect_stats(paths, timeout=QMP_TIMEOUT):
+    """Polls many VMs concurrently; returns {name: stats or None}"""
+    names = list(paths)
+    results = await asyncio.gather(*(_call(paths[n], "stats", timeout=timeout) for n in names),
+                                   return_exceptions=True)
+    return {n: (None if isinstance(r, BaseException) else r) for n, r in zip(names, results)}
+
+
+class QMPPoller:
+    """Background thread that samples every running VM over its QMP socket.
+
+    `source` returns {vm_name: socket_path}; the latest results live in `stats`.
+    """
+
+    def __init__(self, source, interval=POLL_INTERVAL):
+        self.source = source
+        self.interval = interval
+        self.stats = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="qmp-poller", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            paths = {n: p for n, p in self.source().items() if os.path.exists(p)}
+            self.stats = asyncio.run(collect_stats(paths)) if paths else {}
+            self._stop.wait(self.interval)
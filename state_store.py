@@ -0,0 +1,346 @@
+import json
+import os
+import queue
+import threading
+import time
+
+# --- STORE CONFIGURATION ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# One SQLite file shared by the CLI, the GUI and the API server (WAL lets them read while one writes)
+STATE_DB = os.environ.get("STATE_DB", os.path.join(BASE_DIR, "data", "state.db"))
+# Writes are queued and committed by one thread, this many statements per transaction at most
+WRITE_BATCH = 500
+BUSY_TIMEOUT_MS = 5000
+# Operations older than this are dropped when a long-running process attaches
+KEEP_DAYS = int(os.environ.get("STATE_KEEP_DAYS", "365"))
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workloads (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    pid INTEGER,
+    settings TEXT NOT NULL DEFAULT '{}',
+    started_at REAL,
+    stopped_at REAL,
+    updated_at REAL NOT NULL,
+    owner INTEGER,
+    PRIMARY KEY (kind, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS workloads_state ON workloads (kind, state);
+
+CREATE TABLE IF NOT EXISTS operations (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    target TEXT NOT NULL,
+    state TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS operations_recent ON operations (kind, started_at, duration);
+CREATE INDEX IF NOT EXISTS operations_slowest ON operations (kind, duration);
+CREATE INDEX IF NOT EXISTS operations_target ON operations (target, kind, started_at);
+"""
+
+UPSERT_WORKLOAD = """
+INSERT INTO workloads (kind, name, state, pid, settings, started_at, stopped_at, updated_at, owner)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (kind, name) DO UPDATE SET
+    state = excluded.state, pid = excluded.pid, settings = excluded.settings,
+    started_at = excluded.started_at, stopped_at = excluded.stopped_at, updated_at = excluded.updated_at,
+    owner = excluded.owner
+"""
+INSERT_OPERATION = "INSERT INTO operations (kind, target, state, started_at, duration, detail) VALUES (?, ?, ?, ?, ?, ?)"
+
+# Operation outcomes; anything else (failed, timed-out, lost...) counts as a failure
+DONE_STATES = ("done", "stopped")
+# VM states that belong to whichever manager process last wrote the row (its 'owner')
+ACTIVE_STATES = ("queued", "running", "stopping")
+
+
+def parse_since(text):
+    """'7d', '24h', '30m' or a plain number of seconds -> epoch seconds that long ago"""
+    text = str(text).strip().lower()
+    units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+    scale = units.get(text[-1:], None)
+    value = float(text[:-1] if scale else text)
+    return time.time() - value * (scale or 1)
+
+
+def owner_alive(pid):
+    """True while the manager process (GUI, API server, CLI) that wrote a workload row still runs"""
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+class StateStore:
+    """Workloads and operation history in one SQLite database (WAL mode).
+
+    Writers never wait on the disk: record() and workload() queue a statement
+    and a single writer thread commits them in batches. Reads use one
+    connection per thread and go straight to the indexes:
+    (kind, started_at, duration) for recent history and the slowest operations
+    of a time window, (kind, duration) for the slowest of all time and
+    (target, kind, started_at) for one image or VM.
+    Nothing is opened until the first read or write.
+    """
+
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self.errors = 0
+        self.last_error = None
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._containers = {}
+
+    # --- CONNECTIONS ---
+    def _open(self):
+        import sqlite3
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; a crash loses at most the last batch
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    def _query(self, sql, params=()):
+        if self._writer is not None and self._queue.unfinished_tasks:
+            self.flush()  # read your own writes
+        return [dict(row) for row in self._reader().execute(sql, params)]
+
+    # --- WRITES (queued) ---
+    def _submit(self, sql, params):
+        with self._lock:
+            if self._writer is None:
+                import atexit
+                self._writer = threading.Thread(target=self._write_loop, name="state-store", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        self._queue.put((sql, params))
+
+    def _write_loop(self):
+        import sqlite3
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < WRITE_BATCH:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                conn = conn or self._open()
+                conn.execute("BEGIN")
+                for sql, params in batch:
+                    if sql is not None:
+                        conn.execute(sql, params)
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self.errors += 1
+                self.last_error = str(e)
+                if conn is not None and conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            for sql, params in batch:
+                if sql is None:
+                    params.set()  # a flush marker
+                self._queue.task_done()
+
+    def flush(self, timeout=10):
+        """Waits until everything queued so far is committed"""
+        if self._writer is None:
+            return True
+        done = threading.Event()
+        self._queue.put((None, done))
+        return done.wait(timeout)
+
+    def record(self, kind, target, state, started_at, duration=None, **detail):
+        """One finished operation: a pull, a build, a VM run, a command..."""
+        self._submit(INSERT_OPERATION, (kind, str(target), state, started_at,
+                                        None if duration is None else round(duration, 4),
+                                        json.dumps(detail, default=str) if detail else None))
+
+    def workload(self, kind, name, state, pid=None, settings=None, started_at=None, stopped_at=None):
+        """Upserts one workload; the writing process becomes its owner"""
+        self._submit(UPSERT_WORKLOAD, (kind, name, state, pid, json.dumps(settings or {}), started_at, stopped_at,
+                                       time.time(), os.getpid()))
+
+    def forget(self, kind, name):
+        self._submit("DELETE FROM workloads WHERE kind = ? AND name = ?", (kind, name))
+
+    def prune(self, days=KEEP_DAYS):
+        self._submit("DELETE FROM operations WHERE started_at < ?", (time.time() - days * 86400,))
+
+    # --- READS ---
+    def workloads(self, kind=None, state=None):
+        sql, params = "SELECT * FROM workloads WHERE 1", []
+        if kind:
+            sql, params = sql + " AND kind = ?", params + [kind]
+        if state:
+            sql, params = sql + " AND state = ?", params + [state]
+        rows = self._query(sql + " ORDER BY kind, name", params)
+        for row in rows:
+            row["settings"] = json.loads(row["settings"] or "{}")
+        return rows
+
+    def owned_elsewhere(self, kind, name):
+        """The pid of another live manager process that has this workload queued or running, else None"""
+        # No flush first: rows this process still has queued are its own, and those never count
+        row = self._reader().execute("SELECT state, owner FROM workloads WHERE kind = ? AND name = ?",
+                                     (kind, name)).fetchone()
+        if row and row["state"] in ACTIVE_STATES and row["owner"] != os.getpid() and owner_alive(row["owner"]):
+            return row["owner"]
+        return None
+
+    def operations(self, kind=None, target=None, since=None, limit=50):
+        """Newest first"""
+        clauses, params = [], []
+        for clause, value in (("kind = ?", kind), ("target = ?", target), ("started_at >= ?", since)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return self._decode(self._query(f"SELECT * FROM operations{where} ORDER BY started_at DESC LIMIT ?",
+                                        params + [limit]))
+
+    def slowest(self, kind, since=None, limit=10):
+        """The longest operations of one kind, e.g. slowest('pull', parse_since('7d'))"""
+        if since is None:
+            # All time: walk (kind, duration) from the top, the first rows are the answer
+            return self._decode(self._query(
+                "SELECT * FROM operations INDEXED BY operations_slowest WHERE kind = ? AND duration IS NOT NULL "
+                "ORDER BY duration DESC LIMIT ?", (kind, limit)))
+        # A window: range-scan (kind, started_at, duration) and sort only those index entries, then fetch
+        # the winning rows. Walking the duration index instead would read every older row of the kind
+        # when the window holds few long operations.
+        return self._decode(self._query(
+            "SELECT * FROM operations WHERE id IN (SELECT id FROM operations INDEXED BY operations_recent "
+            "WHERE kind = ? AND started_at >= ? AND duration IS NOT NULL ORDER BY duration DESC LIMIT ?) "
+            "ORDER BY duration DESC", (kind, since, limit)))
+
+    def last(self, kind, target, state=None):
+        """The newest operation on one target (optionally only with that outcome)"""
+        sql = "SELECT * FROM operations WHERE target = ? AND kind = ?" + (" AND state = ?" if state else "")
+        rows = self._query(sql + " ORDER BY started_at DESC LIMIT 1", (target, kind) + ((state,) if state else ()))
+        return self._decode(rows)[0] if rows else None
+
+    def summary(self, since=None):
+        """Count, failures and timings per kind of operation"""
+        rows = self._query(
+            "SELECT kind, COUNT(*) AS count, SUM(state NOT IN (?, ?)) AS failed, AVG(duration) AS avg_seconds, "
+            "MAX(duration) AS max_seconds FROM operations WHERE started_at >= ? GROUP BY kind ORDER BY kind",
+            DONE_STATES + (since or 0,))
+        for row in rows:
+            for key in ("avg_seconds", "max_seconds"):
+                row[key] = round(row[key], 3) if row[key] is not None else None
+        return rows
+
+    @staticmethod
+    def _decode(rows):
+        for row in rows:
+            row["detail"] = json.loads(row["detail"]) if row.get("detail") else {}
+        return rows
+
+    # --- FEEDS ---
+    def vm_changed(self, vm):
+        """Registry hook: every state change of a VM; a VM that exited also becomes a 'vm' operation"""
+        self.workload("vm", vm.name, vm.state, vm.pid, vm.settings(), vm.started_at, vm.stopped_at)
+        if vm.state in ("stopped", "failed") and vm.started_at and vm.stopped_at:
+            self.record("vm", vm.name, "done" if vm.state == "stopped" else "failed", vm.started_at,
+                        vm.stopped_at - vm.started_at, returncode=vm.returncode)
+
+    def command_finished(self, command):
+        """Command runner hook: every external command or queued GUI action"""
+        if command.started_at is not None:
+            self.record("command", command.label, command.state, command.started_at, command.seconds(),
+                        argv=command.argv, returncode=command.returncode, error=command.error)
+
+    def containers_changed(self, inventory):
+        """Inventory hook: upserts containers whose state changed and marks vanished ones removed"""
+        current = {}
+        for c in inventory.container_list():
+            name = (c.get("Names") or [c["Id"][:12]])[0].lstrip("/")
+            current[c["Id"]] = (name, c.get("State") or "unknown", c.get("Status"))
+            if self._containers.get(c["Id"]) != current[c["Id"]]:
+                self.workload("container", name, current[c["Id"]][1],
+                              settings={"id": c["Id"], "image": c.get("Image"), "status": c.get("Status")},
+                              started_at=c.get("Created"))
+        for cid in self._containers.keys() - current.keys():
+            self.workload("container", self._containers[cid][0], "removed", stopped_at=time.time())
+        self._containers = current
+
+    # --- STARTUP ---
+    def reconcile(self, registry):
+        """Brings back the VMs whose manager process has exited: a QEMU that is still alive is adopted,
+        the rest are marked stopped (and their run recorded as 'lost'); launches still queued are marked
+        failed ('abandoned'). Rows owned by another live GUI, API server or CLI are left to it.
+        Returns (adopted, lost) names."""
+        from vm_registry import VMError, QUEUED, STOPPED, FAILED
+        adopted, lost = [], []
+        for w in self.workloads("vm"):
+            name = w["name"]
+            if name in registry.vms or w["state"] not in ACTIVE_STATES or owner_alive(w["owner"]):
+                continue
+            try:
+                registry.define(name, **w["settings"])
+            except (VMError, TypeError):
+                continue
+            if w["state"] == QUEUED:
+                # Its manager exited while it waited for host capacity; that launch will never happen
+                self.workload("vm", name, FAILED, None, w["settings"], w["started_at"], time.time())
+                self.record("vm", name, "abandoned", w["updated_at"])
+                lost.append(name)
+                continue
+            try:
+                registry.adopt(name, w["pid"], w["started_at"])
+                adopted.append(name)
+            except VMError:
+                self.workload("vm", name, STOPPED, None, w["settings"], w["started_at"], time.time())
+                self.record("vm", name, "lost", w["started_at"] or time.time())
+                lost.append(name)
+        return adopted, lost
+
+    def attach(self, registry=None, inventory=None, runner=None):
+        """Called once by long-lived entry points: reconcile VMs, then keep recording"""
+        result = self.reconcile(registry) if registry is not None else ([], [])
+        if inventory is not None:
+            inventory.subscribe(lambda kind, action, object_id: kind in ("container", "inventory")
+                                and self.containers_changed(inventory))
+        if runner is not None:
+            runner.subscribe(self.command_finished)
+        self.prune()
+        return result
+
+
+def describe(operation):
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(operation["started_at"]))
+    duration = f"{operation['duration']:9.2f}s" if operation["duration"] is not None else f"{'-':>10}"
+    return f"{when}  {operation['kind']:<16} {operation['state']:<10} {duration}  {operation['target']}"
+
+
+# Shared by the registry, the schedulers, the CLI, the GUI and the API
+store = StateStore()
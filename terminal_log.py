@@ -0,0 +1,88 @@
+import atexit
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# --- LOG CONFIGURATION ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "logs")
+LOG_FILE = os.path.join(LOG_DIR, "terminal.log")
+MAX_LINES = 5000
+MAX_BYTES = 2 * 1024 * 1024
+TRIM_CHUNK = 500
+FILE_MAX_BYTES = 10 * 1024 * 1024
+FILE_BACKUPS = 5
+
+
+class RingLog:
+    """Fixed-capacity buffer of terminal lines, bounded by line count and by bytes.
+
+    Every line is also spilled to a rotating file, so the full history survives
+    while memory stays flat. The spill is one record per appended batch, written
+    by a background listener thread, so the caller (the Tk loop) never touches
+    the disk. Evicted lines are counted so a view can drop them in chunks
+    instead of on every insert.
+    """
+
+    def __init__(self, max_lines=MAX_LINES, max_bytes=MAX_BYTES, log_file=LOG_FILE,
+                 file_max_bytes=FILE_MAX_BYTES, file_backups=FILE_BACKUPS):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.lines = collections.deque()
+        self.size = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._file_log = None
+        self._listener = None
+        if log_file:
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=file_max_bytes, backupCount=file_backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))  # lines carry their batch's timestamp
+            spill = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(spill, handler)
+            self._listener.start()
+            atexit.register(self.close)
+            self._file_log = logging.getLogger(f"terminal_log.{id(self)}")
+            self._file_log.propagate = False
+            self._file_log.setLevel(logging.INFO)
+            self._file_log.addHandler(logging.handlers.QueueHandler(spill))
+
+    def append(self, lines):
+        if self._file_log and lines:
+            now = time.time()
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)) + f",{int(now % 1 * 1000):03d}"
+            self._file_log.info("\n".join(f"{stamp} {line}" for line in lines))
+        with self._lock:
+            for line in lines:
+                self.lines.append(line)
+                self.size += len(line) + 1
+            while self.lines and (len(self.lines) > self.max_lines or self.size > self.max_bytes):
+                self.size -= len(self.lines.popleft()) + 1
+                self.evicted += 1
+
+    def take_evicted(self, min_chunk=TRIM_CHUNK):
+        """Returns how many lines the view should drop, once at least min_chunk have piled up"""
+        with self._lock:
+            if self.evicted < min_chunk:
+                return 0
+            count, self.evicted = self.evicted, 0
+            return count
+
+    def text(self):
+        with self._lock:
+            return "\n".join(self.lines)
+
+    def close(self):
+        """Writes out whatever is still queued for the file"""
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+        if self._file_log:
+            for handler in list(self._file_log.handlers):
+                handler.close()
+                self._file_log.removeHandler(handler)
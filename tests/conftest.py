@@ -0,0 +1,23 @@
+import os
+import shutil
+import sys
+import tempfile
+
+# --- TEST ENVIRONMENT ---
+# The backends read their configuration at import time, so it has to be in place before any test imports them
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STUB_DIR = tempfile.mkdtemp(prefix="cm-tests-")
+os.environ["STATE_DB"] = os.path.join(STUB_DIR, "state.db")
+os.environ["DOCKER_SOCKET"] = os.path.join(STUB_DIR, "no-engine.sock")
+os.environ["CPU_OVERCOMMIT"] = "1000"
+
+import benchmark  # noqa: E402
+
+# Stub docker / qemu-img / qemu-system binaries, the same ones the benchmark runs against
+benchmark.install_fakes(STUB_DIR)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(STUB_DIR, ignore_errors=True)
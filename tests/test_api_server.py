@@ -0,0 +1,65 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import api_server
+from api_server import ApiError, Request, confined, dispatch
+from vm_registry import DISK_DIR
+
+
+def call(method, path, body=None, query=None):
+    req = Request(method, path, query or {}, {}, json.dumps(body).encode() if body is not None else b"", {})
+    return asyncio.run(dispatch(req))
+
+
+def status_of(method, path, body=None):
+    try:
+        return call(method, path, body)[0]
+    except ApiError as e:
+        return e.status
+
+
+# --- PATH CONFINEMENT ---
+def test_confined_resolves_inside_the_folder():
+    assert confined("a/b.qcow2", DISK_DIR, "disk_path") == os.path.join(os.path.realpath(DISK_DIR), "a", "b.qcow2")
+
+
+@pytest.mark.parametrize("path", ["../state.db", "/etc/passwd", "", None, ["x"]])
+def test_confined_rejects_escapes(path):
+    with pytest.raises(ApiError) as error:
+        confined(path, DISK_DIR, "disk_path")
+    assert error.value.status == 400
+
+
+def test_build_needs_a_context_inside_the_builds_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_server, "CONTEXT_DIR", str(tmp_path))
+    (tmp_path / "app").mkdir()
+    assert status_of("POST", "/images/build", {"tag": "app:1"}) == 400
+    assert status_of("POST", "/images/build", {"tag": "app:1", "path": "."}) == 400
+    assert status_of("POST", "/images/build", {"tag": "app:1", "path": "../"}) == 400
+    assert status_of("POST", "/images/build", {"tag": "app:1", "path": "/"}) == 400
+    assert status_of("POST", "/images/build", {"tag": "app:1", "path": "missing"}) == 400
+
+
+# --- REQUEST VALIDATION ---
+@pytest.mark.parametrize("images", [None, "nginx", [], [""], ["nginx", 3], {"nginx": 1}])
+def test_pull_needs_a_list_of_names(images):
+    assert status_of("POST", "/images/pull", {"images": images}) == 400
+
+
+@pytest.mark.parametrize("tag", ["..", "a%20b", ".hidden"])
+def test_snapshot_routes_reject_unsafe_tags(tag):
+    api_server.registry.define("api-guest")
+    try:
+        assert status_of("POST", f"/vms/api-guest/snapshots/{tag}/restore") == 400
+        assert status_of("DELETE", f"/vms/api-guest/snapshots/{tag}") == 400
+        assert status_of("POST", "/vms/api-guest/snapshots", {"tag": "../" + tag}) == 400
+    finally:
+        api_server.registry.remove("api-guest")
+
+
+def test_unknown_routes():
+    assert status_of("GET", "/nope") == 404
+    assert status_of("DELETE", "/vms") == 405
@@ -0,0 +1,72 @@
+import pytest
+
+from build_context import DockerIgnore, analyze
+
+
+# --- .dockerignore MATCHING ---
+@pytest.mark.parametrize("patterns, path, ignored", [
+    (["*.pyc"], "app.pyc", True),
+    (["*.pyc"], "pkg/app.pyc", False),  # '*' does not cross folders
+    (["**/*.pyc"], "pkg/sub/app.pyc", True),
+    (["**/*.pyc"], "app.pyc", True),
+    (["node_modules"], "node_modules/left-pad/index.js", True),  # a folder covers its contents
+    (["/build/"], "build/out.o", True),
+    (["build"], "src/build", False),
+    (["file?.txt"], "file1.txt", True),
+    (["file?.txt"], "file10.txt", False),
+    (["[a-c].log"], "b.log", True),
+    (["[!a-c].log"], "b.log", False),
+    (["docs/**"], "docs/a/b/c.md", True),
+    (["# *.md", "", "  "], "README.md", False),
+])
+def test_pattern_matching(patterns, path, ignored):
+    assert DockerIgnore(patterns).ignored(path) is ignored
+
+
+def test_exception_re_includes_and_last_match_wins():
+    rules = DockerIgnore(["*.md", "!README.md", "README*"])
+    assert rules.ignored("CHANGES.md")
+    assert rules.ignored("README.md")  # the later pattern wins over the exception
+    rules = DockerIgnore(["docs", "!docs/keep.md"])
+    assert rules.ignored("docs/drop.md")
+    assert not rules.ignored("docs/keep.md")
+    assert rules.has_exceptions
+
+
+def test_missing_file_ignores_nothing(tmp_path):
+    rules = DockerIgnore.load(str(tmp_path))
+    assert rules.rules == []
+    assert not rules.ignored("anything")
+
+
+# --- CONTEXT ANALYSIS ---
+def test_analyze_counts_sent_and_ignored_files(tmp_path):
+    (tmp_path / "Dockerfile").write_text("FROM python:3.12\nCOPY . .\n")
+    (tmp_path / ".dockerignore").write_text(".git\n*.log\nDockerfile\n")
+    (tmp_path / "app.py").write_text("print('hi')\n")
+    (tmp_path / "debug.log").write_bytes(b"x" * 100)
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "HEAD").write_bytes(b"y" * 40)
+    report = analyze(str(tmp_path))
+    assert sorted(report.files) == [".dockerignore", "Dockerfile", "app.py"]  # the Dockerfile is always sent
+    assert report.ignored_files == 2
+    assert report.ignored_bytes == 140
+
+
+# --- BUILD RESULT ---
+def test_build_image_reports_the_outcome(tmp_path, monkeypatch):
+    import build_context
+    import docker_manager
+    (tmp_path / "Dockerfile").write_text("FROM scratch\n")
+    assert docker_manager.build_image(str(tmp_path), "app:ok") is True  # the stub docker exits 0
+    monkeypatch.setattr(build_context.shutil, "which", lambda name: None)  # no CLI and no engine socket
+    assert docker_manager.build_image(str(tmp_path), "app:failed") is False
+
+
+def test_previous_build_comes_from_the_state_store():
+    from build_context import previous_build, record_build
+    assert previous_build("app:history") is None
+    record_build({"tag": "app:history", "started_at": 100.0, "duration": 2.5, "ok": True, "context_bytes": 10})
+    record_build({"tag": "app:history", "started_at": 200.0, "duration": 1.0, "ok": False, "context_bytes": 99})
+    previous = previous_build("app:history")
+    assert (previous["started_at"], previous["duration"], previous["context_bytes"]) == (100.0, 2.5, 10)
@@ -0,0 +1,34 @@
+import sys
+
+import docker_engine
+import docker_manager
+from command_runner import runner, STDERR_PREFIX
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+# --- OUTPUT ---
+def test_stderr_lines_are_tagged():
+    command = runner.run(python("import sys; print('out', flush=True); sys.stderr.write('bad\\n')"))
+    assert command.ok
+    assert sorted(command.output) == ["ERR: bad", "out"]
+
+
+def test_a_chatty_stderr_does_not_stall_the_child():
+    # Far more than a pipe buffer on each stream; a single reader would deadlock here
+    command = runner.run(python("import sys\nfor i in range(20000):\n print(i); print(i, file=sys.stderr)"))
+    assert command.ok
+    assert len(command.output) == 200  # OUTPUT_LINES tail of the 40000 lines
+
+
+def test_a_stderr_warning_does_not_fail_a_docker_action(monkeypatch):
+    monkeypatch.setattr(docker_engine, "cli_command", lambda action, **kwargs: python(
+        "import sys; print('WARNING: no swap limit support', file=sys.stderr); print('done')"))
+    assert docker_manager.run_docker_action("version")
+    monkeypatch.setattr(docker_engine, "cli_command", lambda action, **kwargs: python(
+        "import sys; print('Error response from daemon', file=sys.stderr); sys.exit(1)"))
+    lines = list(docker_engine.docker_lines("version"))
+    assert lines == [STDERR_PREFIX + "Error response from daemon", "ERR: docker version exited with code 1"]
+    assert not docker_manager.run_docker_action("version")
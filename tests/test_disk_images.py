@@ -0,0 +1,119 @@
+import os
+import struct
+
+from disk_images import (QCOW2_HEADER, QCOW2_V3_HEADER, QCOW2_MAGIC, QCOW2_SNAPSHOT, DiskIndex, image_info,
+                         read_qcow2_header, read_qcow2_snapshots)
+
+
+def qcow2_bytes(version=3, size=10 << 30, cluster_bits=16, incompatible=0, backing=b"", snapshots=0,
+                snapshots_offset=0, crypt_method=0):
+    """A qcow2 header as QEMU lays it out, with the backing file name right after it"""
+    header_length = QCOW2_HEADER.size + (QCOW2_V3_HEADER.size if version >= 3 else 0)
+    backing_offset = header_length if backing else 0
+    data = QCOW2_HEADER.pack(QCOW2_MAGIC, version, backing_offset, len(backing), cluster_bits, size, crypt_method,
+                             0, 0, 0, 0, snapshots, snapshots_offset)
+    if version >= 3:
+        data += QCOW2_V3_HEADER.pack(incompatible, 0, 0, 4, header_length)
+    return data + backing
+
+
+# --- HEADER ---
+def test_reads_a_v3_header(tmp_path):
+    path = tmp_path / "disk.qcow2"
+    path.write_bytes(qcow2_bytes(size=20 << 30, cluster_bits=16))
+    header = read_qcow2_header(str(path))
+    assert header == {"version": 3, "virtual_size": 20 << 30, "cluster_size": 65536, "encrypted": False,
+                      "snapshots": 0, "dirty": False, "backing_file": None}
+
+
+def test_dirty_bit_and_backing_file(tmp_path):
+    path = tmp_path / "overlay.qcow2"
+    path.write_bytes(qcow2_bytes(incompatible=1, backing=b"/images/base.qcow2"))
+    header = read_qcow2_header(str(path))
+    assert header["dirty"] is True
+    assert header["backing_file"] == "/images/base.qcow2"
+
+
+def test_v2_header_has_no_dirty_bit(tmp_path):
+    path = tmp_path / "old.qcow2"
+    # A v2 image whose first cluster happens to start with set bits where v3 keeps its feature flags
+    path.write_bytes(qcow2_bytes(version=2, crypt_method=1) + b"\xff" * 32)
+    header = read_qcow2_header(str(path))
+    assert header["version"] == 2
+    assert header["encrypted"] is True
+    assert header["dirty"] is False
+
+
+def test_non_qcow2_files(tmp_path):
+    raw = tmp_path / "disk.raw"
+    raw.write_bytes(b"\0" * 4096)
+    short = tmp_path / "short.qcow2"
+    short.write_bytes(QCOW2_MAGIC + b"\0\0\0\3")
+    assert read_qcow2_header(str(raw)) is None
+    assert read_qcow2_header(str(short)) is None
+    info = image_info(str(raw))
+    assert info["format"] == "raw"
+    assert info["virtual_size"] == 4096
+
+
+# --- SNAPSHOT TABLE ---
+def snapshot_entry(snapshot_id, tag, date_sec=1700000000, vm_clock_nsec=0, vm_state_size=0, extra=b""):
+    """One snapshot table entry, padded to 8 bytes like QEMU writes it"""
+    entry = QCOW2_SNAPSHOT.pack(0, 0, len(snapshot_id), len(tag), date_sec, 0, vm_clock_nsec,
+                                vm_state_size & 0xFFFFFFFF, len(extra))
+    entry += extra + snapshot_id.encode() + tag.encode()
+    return entry + b"\0" * (-len(entry) % 8)
+
+
+def test_reads_the_snapshot_table(tmp_path):
+    table_offset = 4096
+    entries = [
+        # v2-style entry without extra data; '1' + 'boot' leaves the entry unaligned, so it is padded
+        snapshot_entry("1", "boot", date_sec=1700000001, vm_clock_nsec=2_500_000_000, vm_state_size=123),
+        # v3 extra data: the 64-bit vm_state_size wins over the truncated 32-bit field, then the disk size
+        snapshot_entry("2", "before-upgrade", vm_state_size=6 << 30,
+                       extra=struct.pack(">QQ", 6 << 30, 20 << 30)),
+        snapshot_entry("3", "x"),
+    ]
+    header = qcow2_bytes(snapshots=len(entries), snapshots_offset=table_offset)
+    path = tmp_path / "disk.qcow2"
+    path.write_bytes(header.ljust(table_offset, b"\0") + b"".join(entries))
+
+    snapshots = read_qcow2_snapshots(str(path))
+    assert [(s["id"], s["tag"]) for s in snapshots] == [("1", "boot"), ("2", "before-upgrade"), ("3", "x")]
+    assert snapshots[0]["created"] == 1700000001
+    assert snapshots[0]["vm_clock"] == 2.5
+    assert snapshots[0]["vm_state_size"] == 123
+    assert snapshots[1]["vm_state_size"] == 6 << 30
+    assert read_qcow2_header(str(path))["snapshots"] == 3
+
+
+def test_truncated_snapshot_table_stops_early(tmp_path):
+    header = qcow2_bytes(snapshots=2, snapshots_offset=512)
+    path = tmp_path / "disk.qcow2"
+    path.write_bytes(header.ljust(512, b"\0") + snapshot_entry("1", "only"))
+    assert [s["tag"] for s in read_qcow2_snapshots(str(path))] == ["only"]
+
+
+def test_no_snapshots_outside_qcow2(tmp_path):
+    path = tmp_path / "disk.raw"
+    path.write_bytes(b"\0" * 512)
+    assert read_qcow2_snapshots(str(path)) == []
+
+
+# --- INDEX ---
+def test_index_refreshes_only_changed_images(tmp_path):
+    disks = tmp_path / "disks"
+    disks.mkdir()
+    (disks / "a.qcow2").write_bytes(qcow2_bytes(size=1 << 30))
+    (disks / "notes.txt").write_text("not an image")
+    index = DiskIndex(index_file=str(disks / "index.json"), disk_dir=str(disks))
+    assert index.refresh() == 1
+    assert index.refresh() == 0
+    assert index.summary()["virtual_size"] == 1 << 30
+
+    (disks / "b.qcow2").write_bytes(qcow2_bytes(incompatible=1))
+    os.remove(disks / "a.qcow2")
+    assert index.refresh() == 2
+    assert index.summary()["dirty"] == 1
+    assert DiskIndex(index_file=str(disks / "index.json"), disk_dir=str(disks)).entries == index.entries
@@ -0,0 +1,102 @@
+import os
+import threading
+
+import pytest
+
+import disk_templates
+from disk_templates import TemplateCatalog, TemplateError
+from state_store import StateStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = StateStore(str(tmp_path / "state.db"))
+    monkeypatch.setattr(disk_templates, "store", store)
+    return store
+
+
+@pytest.fixture
+def catalog(tmp_path, store):
+    catalog = TemplateCatalog(str(tmp_path / "templates.json"), str(tmp_path / "templates"))
+    base = tmp_path / "base.qcow2"
+    base.write_bytes(b"QFI\xfb" + b"\0" * 100)
+    catalog.add("debian", str(base))
+    return catalog
+
+
+def age(path, seconds):
+    then = os.path.getmtime(path) - seconds
+    os.utime(path, (then, then))
+
+
+# --- TEMPLATES ---
+def test_add_moves_the_base_and_makes_it_read_only(catalog, tmp_path):
+    path = catalog.templates["debian"]["path"]
+    assert not (tmp_path / "base.qcow2").exists()
+    assert os.stat(path).st_mode & 0o777 == 0o444
+    with pytest.raises(TemplateError):
+        catalog.add("debian", path)
+
+
+def test_add_copy_keeps_the_original(catalog, tmp_path):
+    original = tmp_path / "ubuntu.qcow2"
+    original.write_bytes(b"QFI\xfb" + b"\0" * 99 + b"\1")
+    path = catalog.add("ubuntu", str(original), copy=True)
+    assert original.exists()
+    assert open(path, "rb").read() == original.read_bytes()
+
+
+def test_raw_base_images_keep_their_format(catalog, tmp_path):
+    raw = tmp_path / "appliance.img"
+    raw.write_bytes(b"\0" * 512)
+    path = catalog.add("appliance", str(raw))
+    assert path.endswith("appliance.raw")
+    assert catalog.templates["appliance"]["format"] == "raw"
+    assert catalog.templates["debian"]["format"] == "qcow2"
+
+
+def test_template_in_use_cannot_be_removed(catalog, tmp_path):
+    overlay = tmp_path / "vm1.qcow2"
+    catalog.create_overlay("debian", str(overlay))
+    assert overlay.exists()
+    assert catalog.list()[0]["refs"] == 1
+    with pytest.raises(TemplateError, match="still used"):
+        catalog.remove("debian")
+    catalog.release(str(overlay))
+    catalog.remove("debian")
+    assert catalog.list() == []
+
+
+# --- GC ---
+def test_gc_deletes_only_overlays_no_vm_points_at(catalog, store, tmp_path):
+    recorded, defined, orphan, young = (tmp_path / f"{n}.qcow2" for n in ("recorded", "defined", "orphan", "young"))
+    for overlay in (recorded, defined, orphan, young):
+        catalog.create_overlay("debian", str(overlay))
+    for overlay in (recorded, defined, orphan):
+        age(overlay, 3600)
+    store.workload("vm", "recorded", "stopped", settings={"disk_path": str(recorded)})
+    gone = tmp_path / "gone.qcow2"
+    catalog.create_overlay("debian", str(gone))
+    os.remove(gone)
+
+    removed = catalog.gc(in_use=[str(defined)])
+    assert sorted(removed) == sorted([str(orphan), str(gone)])
+    assert recorded.exists() and defined.exists() and young.exists()
+    assert not orphan.exists()
+    assert catalog.list()[0]["refs"] == 3
+
+
+# --- SHARED CATALOG FILE ---
+def test_processes_sharing_the_file_keep_each_others_changes(catalog, tmp_path):
+    # Two catalogs on one file stand in for the GUI and the API server
+    other = TemplateCatalog(catalog.catalog_file, catalog.template_dir)
+
+    def create(owner, prefix):
+        for i in range(20):
+            owner.create_overlay("debian", str(tmp_path / f"{prefix}{i}.qcow2"))
+    workers = [threading.Thread(target=create, args=(owner, prefix)) for owner, prefix in ((catalog, "a"), (other, "b"))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert TemplateCatalog(catalog.catalog_file, catalog.template_dir).list()[0]["refs"] == 40
@@ -0,0 +1,171 @@
+import http.client
+import json
+import os
+import socketserver
+import threading
+
+import pytest
+
+import benchmark
+import docker_engine
+from docker_engine import DockerEngine, DockerEngineError
+
+
+class Handler(benchmark.FakeEngineHandler):
+    """The benchmark's fake engine plus the knobs these tests need"""
+    drop_idle = False  # close the keep-alive connection right after answering, like a restarting daemon
+    pull_error = None  # an error message the pull stream ends with
+    hang_up_on_post = False  # read a POST, then close without answering, like a daemon dying mid-request
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _send(self, payload, status=200):
+        super()._send(payload, status)
+        if self.drop_idle:
+            self.close_connection = True
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        with self.server.lock:
+            self.server.posts += 1
+        if self.hang_up_on_post:
+            self.close_connection = True
+            return
+        if path == "/containers/create":
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not self.server.pulled:
+                return self._send({"message": "No such image"}, 404)
+            return self._send({"Id": "c0ffee"}, 201)
+        if path.endswith("/start"):
+            return self._send({}, 204)
+        if path == "/images/create" and self.pull_error:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            for message in ({"status": "Pulling from library/nope"},
+                            {"error": self.pull_error, "errorDetail": {"message": self.pull_error}}):
+                self.wfile.write((json.dumps(message) + "\r\n").encode())
+            self.close_connection = True
+            return
+        if path == "/images/create":
+            self.server.pulled = True
+        super().do_POST()
+
+
+class Engine(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, handler):
+        super().__init__(path, handler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.posts = 0
+        self.pulled = False
+
+
+@pytest.fixture
+def engine_server(tmp_path):
+    def start(**knobs):
+        handler = type("Handler", (Handler,), dict(knobs, containers=2, pull_messages=3))
+        server = Engine(str(tmp_path / "engine.sock"), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+# --- POOLING + RETRY ---
+def test_requests_reuse_a_pooled_connection(engine_server):
+    server = engine_server()
+    engine = DockerEngine(server.server_address)
+    for _ in range(5):
+        assert engine.ping()
+        assert len(engine.ps()) == 2
+    assert server.connections == 1
+    engine.close()
+
+
+def test_retries_once_when_the_pooled_connection_was_closed(engine_server):
+    server = engine_server(drop_idle=True)
+    engine = DockerEngine(server.server_address)
+    assert engine.version()["ApiVersion"] == "1.43"
+    # The server hung up after answering, so the pooled connection is dead; the call must still succeed
+    assert engine.version()["ApiVersion"] == "1.43"
+    assert server.connections == 2
+    engine.close()
+
+
+def test_a_post_that_went_out_is_not_sent_again(engine_server):
+    server = engine_server(hang_up_on_post=True)
+    engine = DockerEngine(server.server_address)
+    with pytest.raises((OSError, http.client.HTTPException)):
+        engine.stop("web")
+    assert server.posts == 1  # the daemon may already have stopped it; a retry could act twice
+    engine.close()
+
+
+def test_error_status_raises(engine_server):
+    engine = DockerEngine(engine_server().server_address)
+    with pytest.raises(DockerEngineError) as error:
+        engine.request("GET", "/no/such/path")
+    assert error.value.status == 404
+    assert error.value.message == "not found"
+
+
+def test_unreachable_socket_raises_oserror(tmp_path):
+    with pytest.raises(OSError):
+        DockerEngine(str(tmp_path / "missing.sock")).version()
+
+
+# --- STREAMS ---
+def test_run_pulls_a_missing_image(engine_server):
+    engine = DockerEngine(engine_server().server_address)
+    assert engine.run("nginx:latest") == "c0ffee"
+
+
+def test_run_raises_on_pull_stream_error(engine_server):
+    engine = DockerEngine(engine_server(pull_error="manifest unknown").server_address)
+    with pytest.raises(DockerEngineError) as error:
+        engine.run("nope:latest")
+    assert error.value.status == 500
+    assert error.value.message == "manifest unknown"
+
+
+def test_docker_lines_reports_a_lost_connection(monkeypatch):
+    class Vanishing:
+        def pull(self, image):
+            yield {"status": "Pulling fs layer", "id": "layer0"}
+            raise ConnectionResetError()
+    monkeypatch.setattr(docker_engine, "get_engine", lambda: Vanishing())
+    lines = list(docker_engine.docker_lines("pull", image="nginx"))
+    assert lines[-1] == "ERR: lost the engine connection: ConnectionResetError"
+
+
+def test_docker_lines_falls_back_to_the_cli():
+    # conftest points DOCKER_SOCKET at a missing socket and puts the stub docker CLI on PATH
+    assert not os.path.exists(docker_engine.DOCKER_SOCKET)
+    lines = list(docker_engine.docker_lines("version"))
+    assert lines and not lines[-1].startswith("ERR:")
+
+
+def test_get_engine_falls_back_once_the_socket_goes_away(engine_server, monkeypatch):
+    server = engine_server()
+    monkeypatch.setattr(docker_engine, "_engine", DockerEngine(server.server_address))
+    assert docker_engine.get_engine() is docker_engine._engine
+    os.unlink(server.server_address)
+    assert docker_engine.get_engine() is None
+    assert docker_engine._engine is None
+
+
+def test_cli_lines_report_a_cancelled_command(monkeypatch):
+    monkeypatch.setenv("FAKE_DELAY", "5")
+    threading.Timer(0.3, lambda: docker_engine.runner.cancel_all("docker version")).start()
+    lines = list(docker_engine.docker_lines("version"))
+    assert lines[-1] == "ERR: docker version cancelled"
@@ -0,0 +1,84 @@
+import json
+import os
+
+from docker_inventory import Inventory
+
+EVENTS = os.path.join(os.path.dirname(__file__), "fixtures", "events.jsonl")
+WEB, REDIS = "a" * 64, "b" * 64
+
+
+# --- RECORDED EVENTS ---
+def test_replay_builds_the_model():
+    inventory = Inventory()
+    seen = []
+    inventory.subscribe(lambda *change: seen.append(change))
+    # exec_start, network and the pull's reload mark change nothing in the container model
+    assert inventory.replay(EVENTS) == 8
+    assert list(inventory.containers) == [REDIS]
+    redis = inventory.containers[REDIS]
+    assert redis["State"] == "running"
+    assert redis["Names"] == ["/redis"]
+    assert redis["Image"] == "redis:7"
+    assert ("container", "destroy", WEB) in seen
+    assert ("image", "pull", "alpine:3.19") in seen
+    assert inventory.counts() == {"running": 1, "containers": 1, "images": 0}
+
+
+def test_die_records_the_exit_code():
+    inventory = Inventory()
+    with open(EVENTS) as f:
+        for line in list(f)[:7]:  # up to the 'die', before the 'destroy'
+            inventory.apply_event(json.loads(line))
+    web = inventory.containers[WEB]
+    assert web["State"] == "exited"
+    assert web["Status"] == "Exited (137)"
+
+
+def test_unknown_destroy_and_other_types_are_ignored():
+    inventory = Inventory()
+    seen = []
+    inventory.subscribe(lambda *change: seen.append(change))
+    assert not inventory.apply_event({"Type": "container", "Action": "destroy", "Actor": {"ID": WEB}})
+    assert not inventory.apply_event({"Type": "volume", "Action": "create", "Actor": {"ID": "v"}})
+    assert seen == []
+
+
+# --- IMAGES ---
+def test_image_events_reload_the_list_on_the_sync_thread():
+    inventory = Inventory()
+    inventory.load([], [{"Id": "sha256:1", "Created": 1}])
+    inventory.apply_event({"Type": "image", "Action": "delete", "Actor": {"ID": "sha256:1"}})
+    assert inventory.images == {}
+
+    class Engine:
+        calls = 0
+
+        def ps(self):
+            return []
+
+        def images(self):
+            Engine.calls += 1
+            return [{"Id": "sha256:2", "Created": 2}] if Engine.calls > 1 else []
+
+        def events(self, since=None):
+            yield {"Type": "image", "Action": "tag", "Actor": {"ID": "sha256:2"}}
+            # Reads only serve the cache: the event above was already handled when this runs
+            assert [i["Id"] for i in inventory.image_list()] == ["sha256:2"]
+            yield {"Type": "container", "Action": "start", "Actor": {"ID": WEB}}
+    inventory.apply_event({"Type": "image", "Action": "tag", "Actor": {"ID": "sha256:2"}})
+    assert inventory.image_list() == []  # never a daemon round trip on the read path
+    inventory._follow_events(Engine())
+    assert Engine.calls == 2 and not inventory._images_stale
+
+
+def test_a_failing_subscriber_does_not_stop_the_others():
+    inventory = Inventory()
+    seen = []
+
+    def broken(*change):
+        raise RuntimeError("boom")
+    inventory.subscribe(broken)
+    inventory.subscribe(lambda *change: seen.append(change))
+    inventory.load([], [])
+    assert seen == [("inventory", "load", None)]
+    assert inventory.ready
@@ -0,0 +1,127 @@
+import pytest
+
+import host_scheduler
+from host_scheduler import HostScheduler, NumaNode, AdmissionError, QUEUE, parse_cpulist, numactl_prefix
+
+GB = 1 << 30
+
+
+def make_scheduler(monkeypatch, policy=host_scheduler.REJECT, budget=16 * GB, overcommit=1.0):
+    """Two 4-core nodes with 8 GB each, and a fixed host memory budget instead of /proc/meminfo"""
+    nodes = [NumaNode(0, [0, 1, 2, 3], 8 * GB), NumaNode(1, [4, 5, 6, 7], 8 * GB)]
+    scheduler = HostScheduler(policy=policy, reserved_bytes=0, overcommit=overcommit, nodes=nodes)
+    monkeypatch.setattr(scheduler, "memory_budget", lambda: budget)
+    return scheduler
+
+
+def test_parse_cpulist():
+    assert parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpulist("") == []
+
+
+# --- ADMISSION ---
+def test_rejects_what_does_not_fit(monkeypatch):
+    scheduler = make_scheduler(monkeypatch)
+    scheduler.admit("a", "12G", 4)
+    with pytest.raises(AdmissionError, match="needs 6144 MB"):
+        scheduler.admit("b", "6G", 1)
+    with pytest.raises(AdmissionError):
+        scheduler.admit("c", "1G", 5)
+    assert list(scheduler.reservations) == ["a"]
+
+
+def test_admit_is_idempotent_per_name(monkeypatch):
+    scheduler = make_scheduler(monkeypatch)
+    first = scheduler.admit("a", "1G", 1)
+    assert scheduler.admit("a", "1G", 1) is first
+
+
+def test_queued_launch_starts_when_capacity_frees(monkeypatch):
+    scheduler = make_scheduler(monkeypatch, policy=QUEUE)
+    scheduler.admit("a", "10G", 2, on_admit=lambda r: None)
+    started = []
+    assert scheduler.admit("b", "10G", 2, on_admit=started.append) is None
+    assert scheduler.status()["queued"] == ["b"]
+    scheduler.release("a")
+    assert [r.name for r in started] == ["b"]
+    assert list(scheduler.reservations) == ["b"]
+    assert scheduler.queue == []
+
+
+def test_cancel_drops_a_queued_launch(monkeypatch):
+    scheduler = make_scheduler(monkeypatch, policy=QUEUE)
+    scheduler.admit("a", "16G", 1)
+    started = []
+    scheduler.admit("b", "1G", 1, on_admit=started.append)
+    scheduler.cancel("b")
+    scheduler.release("a")
+    assert started == []
+
+
+# --- PLACEMENT ---
+def test_best_fit_packs_onto_the_fullest_node(monkeypatch):
+    scheduler = make_scheduler(monkeypatch)
+    a = scheduler.admit("a", "6G", 2)
+    b = scheduler.admit("b", "1G", 1)
+    assert b.node is a.node  # 2 GB left there beats 8 GB on the empty node
+    assert not set(a.cpus) & set(b.cpus)  # vCPUs go to the least-loaded cores
+    c = scheduler.admit("c", "4G", 1)
+    assert c.node is not a.node
+
+
+def test_release_returns_the_node_share(monkeypatch):
+    scheduler = make_scheduler(monkeypatch)
+    a = scheduler.admit("a", "2G", 2)
+    scheduler.release("a")
+    assert a.node.mem_reserved == 0
+    assert set(a.node.cpu_load.values()) == {0}
+    assert scheduler.free() == {"ram_bytes": 16 * GB, "vcpus": 8}
+
+
+def test_spilled_vm_only_prefers_its_node(monkeypatch):
+    scheduler = make_scheduler(monkeypatch)
+    monkeypatch.setattr(host_scheduler.shutil, "which", lambda name: "/usr/bin/numactl")
+    fits = scheduler.admit("fits", "4G", 2)
+    big = scheduler.admit("big", "10G", 2)
+    assert not fits.spilled
+    assert big.spilled and big.info()["spilled"]
+    assert numactl_prefix(fits)[-1] == f"--membind={fits.node.id}"
+    assert numactl_prefix(big)[-1] == f"--preferred={big.node.id}"
+
+
+def test_no_numactl_means_no_prefix(monkeypatch):
+    scheduler = make_scheduler(monkeypatch)
+    monkeypatch.setattr(host_scheduler.shutil, "which", lambda name: None)
+    assert numactl_prefix(scheduler.admit("a", "1G", 1)) == []
+
+
+# --- MEMORY BUDGET (read from meminfo) ---
+def test_back_to_back_launches_count_untouched_memory(monkeypatch):
+    # 16 GB host, 6 GB used by other processes; guests have not faulted any memory in yet
+    monkeypatch.setattr(host_scheduler, "read_meminfo", lambda path=None: {"MemTotal": 16 * GB,
+                                                                           "MemAvailable": 10 * GB})
+    nodes = [NumaNode(0, list(range(8)), 16 * GB)]
+    scheduler = HostScheduler(reserved_bytes=0, overcommit=1.0, nodes=nodes)
+    scheduler.admit("a", "8G", 1)
+    with pytest.raises(AdmissionError):
+        scheduler.admit("b", "7G", 1)
+    assert scheduler.free()["ram_bytes"] == 2 * GB
+
+
+def test_resident_guest_memory_is_not_counted_twice(monkeypatch):
+    meminfo = {"MemTotal": 16 * GB, "MemAvailable": 10 * GB}
+    monkeypatch.setattr(host_scheduler, "read_meminfo", lambda path=None: meminfo)
+    monkeypatch.setattr(host_scheduler, "resident_bytes", lambda pid: 8 * GB if pid == 4242 else 0)
+    scheduler = HostScheduler(reserved_bytes=0, overcommit=1.0, nodes=[NumaNode(0, list(range(8)), 16 * GB)])
+    scheduler.admit("a", "8G", 1).pid = 4242
+    # 'a' has now touched all of its 8 GB, so MemAvailable dropped by as much
+    meminfo["MemAvailable"] = 2 * GB
+    assert scheduler.free()["ram_bytes"] == 2 * GB
+    scheduler.admit("b", "2G", 1)
+    with pytest.raises(AdmissionError):
+        scheduler.admit("c", "1G", 1)
+
+
+def test_resident_bytes_of_this_process():
+    assert host_scheduler.resident_bytes(host_scheduler.os.getpid()) > 0
+    assert host_scheduler.resident_bytes(2 ** 22 + 1) == 0
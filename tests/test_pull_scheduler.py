@@ -0,0 +1,116 @@
+import http.client
+import threading
+
+import pytest
+
+import pull_scheduler
+from pull_scheduler import PullProgress, PullScheduler, normalize, DONE, FAILED, SKIPPED
+from state_store import store
+
+
+class Engine:
+    """Stands in for the engine client: canned local images and a scripted pull stream per image"""
+
+    def __init__(self, local=(), streams=None, gate=None):
+        self.local = local
+        self.streams = streams or {}
+        self.gate = gate
+        self.pulled = []
+
+    def images(self):
+        return [{"RepoTags": [tag]} for tag in self.local]
+
+    def pull(self, image):
+        self.pulled.append(image)
+        if self.gate:
+            self.gate.wait(5)
+        for message in self.streams.get(image, [{"id": "l1", "status": "Pull complete"}]):
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    def install(**kwargs):
+        engine = Engine(**kwargs)
+        monkeypatch.setattr(pull_scheduler.docker_engine, "get_engine", lambda: engine)
+        return engine
+    return install
+
+
+def test_normalize():
+    assert normalize(" nginx ") == "nginx:latest"
+    assert normalize("registry:5000/app:1.2") == "registry:5000/app:1.2"
+
+
+# --- PROGRESS ---
+def test_progress_rolls_up_layers():
+    progress = PullProgress("nginx:latest")
+    progress.update({"id": "latest", "status": "Pulling from library/nginx"})
+    progress.update({"id": "a", "status": "Downloading", "progressDetail": {"current": 50, "total": 100}})
+    progress.update({"id": "b", "status": "Already exists"})
+    summary = progress.summary()
+    assert (summary["layers"], summary["layers_done"]) == (2, 1)
+    assert (summary["bytes"], summary["total_bytes"], summary["percent"]) == (50, 100, 50.0)
+
+
+def test_summary_while_layers_are_added():
+    progress = PullProgress("big:latest")
+
+    def pull():
+        for i in range(20000):
+            progress.update({"id": f"layer{i}", "status": "Downloading",
+                             "progressDetail": {"current": 1, "total": 2}})
+    worker = threading.Thread(target=pull)
+    worker.start()
+    while worker.is_alive():
+        progress.summary()  # used to raise 'dictionary changed size during iteration'
+    worker.join()
+    assert progress.summary()["layers"] == 20000
+
+
+# --- SCHEDULING ---
+def test_skips_local_images_and_dedupes_spellings(engine):
+    fake = engine(local=["redis:7"])
+    scheduler = PullScheduler(concurrency=2)
+    futures = scheduler.submit(["nginx", "nginx:latest", "redis:7", " "])
+    assert set(futures) == {"nginx:latest", "redis:7"}
+    assert {image: f.result(5) for image, f in futures.items()} == {"nginx:latest": DONE, "redis:7": SKIPPED}
+    assert fake.pulled == ["nginx:latest"]
+    assert scheduler.overall()["done"] == 2
+
+
+def test_inflight_pull_is_shared(engine):
+    gate = threading.Event()
+    fake = engine(gate=gate)
+    scheduler = PullScheduler()
+    first = scheduler.submit(["alpine"])["alpine:latest"]
+    second = scheduler.submit(["alpine:latest"])["alpine:latest"]
+    gate.set()
+    assert first is second
+    assert first.result(5) == DONE
+    assert fake.pulled == ["alpine:latest"]
+
+
+def test_stream_errors_fail_the_pull_and_are_recorded(engine):
+    engine(streams={
+        "broken:latest": [{"id": "l1", "status": "Downloading", "progressDetail": {"current": 1, "total": 9}},
+                          http.client.IncompleteRead(b"partial")],
+        "missing:latest": [{"error": "manifest unknown", "errorDetail": {"message": "manifest unknown"}}],
+    })
+    scheduler = PullScheduler()
+    futures = scheduler.submit(["broken", "missing"])
+    assert [f.result(5) for f in futures.values()] == [FAILED, FAILED]
+    assert scheduler.error("missing") == "manifest unknown"
+    assert "IncompleteRead" in scheduler.error("broken")
+    store.flush()
+    assert store.last("pull", "broken:latest")["state"] == FAILED
+
+
+def test_a_new_batch_starts_with_fresh_aggregates(engine):
+    engine()
+    scheduler = PullScheduler()
+    scheduler.submit(["one"])["one:latest"].result(5)
+    scheduler.submit(["two"])["two:latest"].result(5)
+    assert [s["image"] for s in scheduler.summaries()] == ["two:latest"]
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import socket
+import threading
+
+import pytest
+
+import qmp_client
+from qmp_client import QMPClient, QMPError, qmp_call, collect_stats
+
+GREETING = {"QMP": {"version": {"qemu": {"major": 8, "minor": 2, "micro": 0}}, "capabilities": []}}
+REPLIES = {
+    "qmp_capabilities": {},
+    "query-status": {"status": "running", "running": True},
+    "query-blockstats": [{"device": "disk0", "stats": {"rd_bytes": 100, "wr_bytes": 7}},
+                         {"device": "cd0", "stats": {"rd_bytes": 20, "wr_bytes": 0}}],
+    "query-cpus-fast": [{"cpu-index": 0, "thread-id": 101}, {"cpu-index": 1, "thread-id": 102}],
+    "system_powerdown": {},
+}
+
+
+def fake_qemu(sock, received, events=(), silent=()):
+    """Answers QMP on one end of a socketpair: canned replies, events before each reply, errors otherwise"""
+    stream = sock.makefile("rwb")
+
+    def send(message):
+        stream.write(json.dumps(message).encode() + b"\n")
+        stream.flush()
+    try:
+        send(GREETING)
+        for line in stream:
+            request = json.loads(line)
+            command = request["execute"]
+            received.append(request)
+            if command in silent:
+                continue
+            if command == "quit":
+                break  # QEMU exits before the reply gets out
+            for event in events:
+                send(event)
+            if command in REPLIES:
+                send({"return": REPLIES[command], "id": request["id"]})
+            else:
+                send({"error": {"class": "CommandNotFound", "desc": f"The command {command} has not been found"},
+                      "id": request["id"]})
+    except OSError:
+        pass
+    finally:
+        stream.close()
+        sock.close()
+
+
+@pytest.fixture
+def qemu(monkeypatch):
+    """Routes every QMP connection to a fake QEMU thread over a socketpair instead of a real socket path"""
+    state = {"events": (), "silent": (), "received": {}}
+    real_open = asyncio.open_unix_connection
+
+    async def open_unix_connection(path, **kwargs):
+        ours, theirs = socket.socketpair()
+        received = state["received"].setdefault(path, [])
+        threading.Thread(target=fake_qemu, args=(theirs, received, state["events"], state["silent"]),
+                         daemon=True).start()
+        return await real_open(sock=ours, **kwargs)
+    monkeypatch.setattr(qmp_client.asyncio, "open_unix_connection", open_unix_connection)
+    return state
+
+
+async def connected(timeout=qmp_client.QMP_TIMEOUT):
+    return await QMPClient("vm0.qmp", timeout).connect()
+
+
+# --- PROTOCOL ---
+def test_connect_negotiates_capabilities(qemu):
+    async def main():
+        qmp = await connected()
+        await qmp.close()
+        return qmp
+    qmp = asyncio.run(main())
+    assert qmp.greeting == GREETING
+    assert [r["execute"] for r in qemu["received"]["vm0.qmp"]] == ["qmp_capabilities"]
+
+
+def test_execute_returns_the_matching_reply(qemu):
+    assert qmp_call("vm0.qmp", "query-status") == {"status": "running", "running": True}
+    ids = [r["id"] for r in qemu["received"]["vm0.qmp"]]
+    assert ids == [1, 2]
+
+
+def test_events_are_kept_aside(qemu):
+    qemu["events"] = ({"event": "RESUME", "timestamp": {"seconds": 1, "microseconds": 0}},)
+
+    async def main():
+        async with QMPClient("vm0.qmp") as qmp:
+            status = await qmp.query_status()
+            return status, qmp.events
+    status, events = asyncio.run(main())
+    assert status["running"] is True
+    assert [e["event"] for e in events] == ["RESUME", "RESUME"]
+
+
+def test_error_reply_raises(qemu):
+    with pytest.raises(QMPError, match="has not been found"):
+        qmp_call("vm0.qmp", "no-such-command")
+
+
+def test_stats_aggregates_block_and_cpu_figures(qemu):
+    stats = qmp_call("vm0.qmp", "stats")
+    assert stats["status"] == "running"
+    assert stats["vcpus"] == 2
+    assert stats["vcpu_threads"] == [101, 102]
+    assert (stats["rd_bytes"], stats["wr_bytes"]) == (120, 7)
+
+
+def test_quit_tolerates_the_socket_closing(qemu):
+    assert qmp_call("vm0.qmp", "quit") is None
+    assert qemu["received"]["vm0.qmp"][-1]["execute"] == "quit"
+
+
+def test_unanswered_command_times_out(qemu):
+    qemu["silent"] = ("query-status",)
+    with pytest.raises(asyncio.TimeoutError):
+        qmp_call("vm0.qmp", "query-status", timeout=0.2)
+
+
+def test_collect_stats_polls_every_vm(qemu):
+    results = asyncio.run(collect_stats({"web": "web.qmp", "db": "db.qmp"}))
+    assert set(results) == {"web", "db"}
+    assert all(r["vcpus"] == 2 for r in results.values())
+    assert set(qemu["received"]) == {"web.qmp", "db.qmp"}
+
+
+def test_collect_stats_returns_none_for_a_missing_socket(tmp_path):
+    results = asyncio.run(collect_stats({"gone": str(tmp_path / "gone.qmp")}, timeout=0.5))
+    assert results == {"gone": None}
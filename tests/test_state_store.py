@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from state_store import StateStore, SCHEMA_VERSION, owner_alive, parse_since
+from vm_registry import VMRegistry, FAILED, STOPPED
+
+
+@pytest.fixture
+def store(tmp_path):
+    return StateStore(str(tmp_path / "state.db"))
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def write_vm(store, name, state, owner, pid=None, settings=None):
+    """A workload row as another manager process would have left it"""
+    store.workload("vm", name, state, pid, settings or {"disk_path": f"/tmp/{name}.qcow2"}, time.time() - 60)
+    store.flush()
+    store._reader().execute("UPDATE workloads SET owner = ? WHERE kind = 'vm' AND name = ?", (owner, name))
+
+
+# --- HISTORY ---
+def test_operations_and_slowest(store):
+    now = time.time()
+    for i, (target, duration) in enumerate([("nginx", 3.0), ("redis", 9.0), ("alpine", 1.0), ("old", 50.0)]):
+        started = now - (30 * 86400 if target == "old" else i)
+        store.record("pull", target, "done", started, duration, bytes=i)
+    store.record("pull", "broken", "failed", now + 1, 2.0, error="manifest unknown")
+    assert [o["target"] for o in store.slowest("pull", limit=2)] == ["old", "redis"]
+    assert [o["target"] for o in store.slowest("pull", parse_since("7d"), limit=2)] == ["redis", "nginx"]
+    assert store.last("pull", "broken")["detail"] == {"error": "manifest unknown"}
+    assert store.last("pull", "nginx", state="failed") is None
+    assert [o["target"] for o in store.operations(kind="pull", limit=2)] == ["broken", "nginx"]
+    summary = store.summary(parse_since("7d"))
+    assert summary == [{"kind": "pull", "count": 4, "failed": 1, "avg_seconds": 3.75, "max_seconds": 9.0}]
+
+
+def test_schema_is_created_once(store):
+    store.workloads()
+    assert store._reader().execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    indexes = {row[0] for row in store._reader().execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"operations_recent", "operations_slowest", "operations_target"} <= indexes
+
+
+def test_parse_since():
+    assert abs(parse_since("2h") - (time.time() - 7200)) < 1
+    assert abs(parse_since("90") - (time.time() - 90)) < 1
+    with pytest.raises(ValueError):
+        parse_since("soon")
+
+
+# --- OWNERSHIP ---
+def test_workloads_belong_to_the_writing_process(store):
+    store.workload("vm", "web", "running", 1234, {"ram": "1G"})
+    [row] = store.workloads("vm")
+    assert (row["owner"], row["settings"]) == (os.getpid(), {"ram": "1G"})
+    assert store.owned_elsewhere("vm", "web") is None  # our own
+
+
+def test_owner_alive():
+    assert owner_alive(os.getpid())
+    assert owner_alive(os.getppid())
+    assert not owner_alive(dead_pid())
+    assert not owner_alive(None)
+
+
+def test_owned_elsewhere_only_counts_live_owners(store):
+    write_vm(store, "gui-vm", "running", os.getppid())
+    write_vm(store, "orphan", "running", dead_pid())
+    write_vm(store, "idle", "stopped", os.getppid())
+    assert store.owned_elsewhere("vm", "gui-vm") == os.getppid()
+    assert store.owned_elsewhere("vm", "orphan") is None
+    assert store.owned_elsewhere("vm", "idle") is None
+
+
+# --- RECONCILE ---
+def test_reconcile_leaves_live_owners_alone(store, monkeypatch):
+    import vm_registry
+    monkeypatch.setattr(vm_registry, "store", store)
+    write_vm(store, "gui-running", "running", os.getppid(), pid=os.getppid())
+    write_vm(store, "gui-queued", "queued", os.getppid())
+    registry = VMRegistry()
+    assert store.reconcile(registry) == ([], [])
+    assert registry.vms == {}
+    assert {w["name"]: w["state"] for w in store.workloads("vm")} == {"gui-running": "running",
+                                                                     "gui-queued": "queued"}
+    registry.define("gui-running")
+    with pytest.raises(vm_registry.VMError, match="another manager process"):
+        registry.launch("gui-running")
+
+
+def test_reconcile_takes_over_rows_of_exited_managers(store, monkeypatch):
+    import vm_registry
+    monkeypatch.setattr(vm_registry, "store", store)
+    gone = dead_pid()
+    write_vm(store, "crashed", "running", gone, pid=dead_pid())
+    write_vm(store, "waiting", "queued", gone)
+    write_vm(store, "done", "stopped", gone)
+    registry = VMRegistry()
+    adopted, lost = store.reconcile(registry)
+    assert (adopted, sorted(lost)) == ([], ["crashed", "waiting"])
+    store.flush()
+    states = {w["name"]: (w["state"], w["owner"]) for w in store.workloads("vm")}
+    assert states == {"crashed": (STOPPED, os.getpid()), "waiting": (FAILED, os.getpid()), "done": ("stopped", gone)}
+    assert store.last("vm", "waiting")["state"] == "abandoned"
+    assert store.last("vm", "crashed")["state"] == "lost"
@@ -0,0 +1,53 @@
+from terminal_log import RingLog
+
+
+# --- EVICTION ---
+def test_evicts_oldest_lines_past_max_lines():
+    log = RingLog(max_lines=3, log_file=None)
+    log.append(["a", "b"])
+    log.append(["c", "d", "e"])
+    assert log.text() == "c\nd\ne"
+    assert log.evicted == 2
+
+
+def test_evicts_by_bytes_counting_newlines():
+    log = RingLog(max_lines=100, max_bytes=10, log_file=None)
+    log.append(["1234", "5678"])  # 5 + 5 bytes fits exactly
+    assert log.text() == "1234\n5678"
+    log.append(["x"])
+    assert log.text() == "5678\nx"
+    assert log.size == 7
+
+
+def test_oversized_line_empties_the_buffer():
+    log = RingLog(max_lines=100, max_bytes=8, log_file=None)
+    log.append(["short", "this line is longer than the budget"])
+    assert log.text() == ""
+    assert log.size == 0
+
+
+def test_take_evicted_waits_for_a_full_chunk():
+    log = RingLog(max_lines=2, log_file=None)
+    log.append([str(i) for i in range(5)])
+    assert log.take_evicted(min_chunk=4) == 0
+    log.append(["5"])
+    assert log.take_evicted(min_chunk=4) == 4
+    assert log.take_evicted(min_chunk=1) == 0
+
+
+# --- FILE SPILL ---
+def test_spills_every_line_to_the_file(tmp_path):
+    path = tmp_path / "terminal.log"
+    log = RingLog(max_lines=2, log_file=str(path))
+    log.append(["one", "two"])
+    log.append(["three"])
+    log.close()
+    written = path.read_text().splitlines()
+    assert [line.split(" ", 2)[2] for line in written] == ["one", "two", "three"]
+    assert log.text() == "two\nthree"
+
+
+def test_close_is_idempotent(tmp_path):
+    log = RingLog(log_file=str(tmp_path / "terminal.log"))
+    log.close()
+    log.close()
@@ -0,0 +1,78 @@
+import pytest
+
+import vm_registry
+from host_scheduler import QUEUE
+from vm_registry import VMRegistry, VMError, DEFINED, RUNNING, STOPPED, QUEUED, FAILED
+
+
+@pytest.fixture
+def registry():
+    changes = []
+    registry = VMRegistry(on_change=changes.append)
+    registry.changes = changes
+    yield registry
+    registry.stop_all(force=True)
+    for vm in list(registry.vms.values()):
+        registry.wait(vm.name, timeout=10)
+
+
+# --- NAMES ---
+@pytest.mark.parametrize("name", ["", "../escape", "a/b", "with space", "semi;colon", None])
+def test_define_rejects_unsafe_names(registry, name):
+    with pytest.raises(VMError):
+        registry.define(name)
+    assert registry.vms == {}
+
+
+def test_define_accepts_plain_names(registry):
+    vm = registry.define("web-01.test_vm")
+    assert vm.state == DEFINED
+    assert registry.get("web-01.test_vm") is vm
+
+
+def test_get_unknown_vm_raises(registry):
+    with pytest.raises(VMError):
+        registry.get("nope")
+
+
+# --- LIFECYCLE (stub qemu from conftest) ---
+def test_launch_stop_and_remove(registry, tmp_path):
+    disk = tmp_path / "guest.qcow2"
+    registry.define("guest", ram="64M", cpu="1", disk_size="1G", accel="tcg", disk_path=str(disk))
+    vm = registry.launch("guest")
+    assert vm.state == RUNNING
+    assert vm.pid and disk.exists()
+    with pytest.raises(VMError):
+        registry.launch("guest")
+    with pytest.raises(VMError):
+        registry.remove("guest")
+
+    registry.stop("guest", force=True)
+    assert registry.wait("guest", timeout=10)
+    assert vm.state == STOPPED
+    assert vm.reservation is None
+    assert [v.state for v in registry.changes][-1] == STOPPED
+
+    registry.remove("guest", delete_disk=True)
+    assert not disk.exists()
+    assert registry.list() == []
+
+
+# --- CHANGE NOTIFICATIONS ---
+def test_a_launch_that_fails_to_start_is_reported(registry, tmp_path):
+    registry.define("broken", ram="64M", cpu="1", disk_size="1G", disk_path=str(tmp_path / "broken.qcow2"))
+    with pytest.raises(VMError):
+        registry.launch("broken", argv=[str(tmp_path / "no-such-qemu")])
+    assert [v.state for v in registry.changes] == [FAILED]
+    assert "broken" not in vm_registry.host_scheduler.reservations
+
+
+def test_stopping_a_queued_vm_is_reported(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(vm_registry.host_scheduler, "policy", QUEUE)
+    registry.define("waiting", ram="100000G", cpu="1", disk_size="1G", disk_path=str(tmp_path / "waiting.qcow2"))
+    states = []
+    registry.on_change = lambda vm: states.append(vm.state)
+    assert registry.launch("waiting").state == QUEUED
+    registry.stop("waiting")
+    assert states == [QUEUED, STOPPED]
+    assert all(name != "waiting" for name, *_ in vm_registry.host_scheduler.queue)
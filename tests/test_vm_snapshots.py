@@ -0,0 +1,25 @@
+import pytest
+
+from vm_registry import VMRegistry
+from vm_snapshots import SnapshotStore, SnapshotError, valid_tag
+
+
+@pytest.mark.parametrize("tag", ["snap-20240101-120000", "before.upgrade", "v1_2", "A"])
+def test_plain_tags_are_valid(tag):
+    assert valid_tag(tag)
+
+
+@pytest.mark.parametrize("tag", ["", "../x", "..", "a/b", "with space", "-flag", ".hidden", "x" * 65, None, 7])
+def test_unsafe_tags_are_rejected(tag):
+    assert not valid_tag(tag)
+
+
+def test_save_restore_and_delete_check_the_tag_first(tmp_path):
+    registry = VMRegistry()
+    registry.define("guest", disk_path=str(tmp_path / "guest.qcow2"))
+    manager = SnapshotStore(vms=registry, snapshot_dir=str(tmp_path / "snapshots"))
+    for call in (lambda: manager.save("guest", "../../escape"), lambda: manager.restore("guest", "a b"),
+                 lambda: manager.delete("guest", "../guest")):
+        with pytest.raises(SnapshotError, match="Invalid snapshot tag"):
+            call()
+    assert not (tmp_path / "snapshots").exists()
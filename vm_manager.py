@@ -1,8 +1,11 @@
-import subprocess
 import json
 import os
 import sys
 
+from disk_templates import catalog as template_catalog
+from iso_catalog import catalog as iso_catalog, describe as describe_iso, ISOError
+from vm_registry import registry, VMError, QUEUED, RUNNING
+
 # --- CONFIGURATION PATHS ---
 # We define the paths here so they are easy to change
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -22,6 +25,7 @@ def create_vm():
         return
 
     # Default Variables
+    name = "vm"
     ram = "4G"
     cpu = "2"
     disk_size = "5G"
@@ -29,6 +33,7 @@ def create_vm():
     # FIX: Disk is now saved in data/disks/
     disk_name = os.path.join(DISK_DIR, "vm_disk.img")
     iso_path = ""
+    template = None
 
     # Ensure directories exist
     os.makedirs(DISK_DIR, exist_ok=True)
@@ -37,25 +42,34 @@ def create_vm():
     # --- INPUT LOGIC ---
     if choice == '1':
         print("\nPlease enter VM Configuration:")
+        name = input(f"Enter VM name [Default: {name}]: ").strip() or name
+        disk_name = os.path.join(DISK_DIR, f"{name}.img")
         ram = input(f"Enter RAM size [Default: {ram}]: ") or ram
         cpu = input(f"Enter CPU cores [Default: {cpu}]: ") or cpu
         disk_size = input(f"Enter Disk size [Default: {disk_size}]: ") or disk_size
-        
+
+        # Templates give a ready-made disk, so no ISO install is needed
+        templates = template_catalog.list()
+        if templates:
+            print("\nAvailable templates: " + ", ".join(t["name"] for t in templates))
+            template = input("Enter template name (press Enter to install from ISO): ").strip() or None
+
+    if choice == '1' and not template:
         # Helper: Show available ISOs
         print(f"\nAvailable ISOs in {ISO_DIR}:")
-        try:
-            isos = [f for f in os.listdir(ISO_DIR) if f.endswith(".iso")]
-            for f in isos: print(f" - {f}")
-        except FileNotFoundError:
+        # Label and size come from the catalog; only new or changed files are read
+        iso_catalog.refresh()
+        isos = iso_catalog.list()
+        for entry in isos: print(f" - {describe_iso(entry)}")
+        if not isos:
             print(" (No ISOs found. Please put .iso files in data/iso/)")
 
-        iso_input = input("\nEnter ISO filename (e.g., ubuntu.iso): ").strip()
+        iso_input = input("\nEnter ISO filename or volume label (e.g., ubuntu.iso): ").strip()
         
-        # FIX: Check if user typed full path OR just filename
-        if os.path.exists(iso_input):
-            iso_path = iso_input
-        else:
-            # Try looking in the data/iso folder
+        # Full path, file name in data/iso, or volume label
+        try:
+            iso_path = iso_catalog.resolve(iso_input)
+        except ISOError:
             iso_path = os.path.join(ISO_DIR, iso_input)
 
     elif choice == '2':
@@ -67,61 +81,94 @@ def create_vm():
             print(f"[ERROR] Config file not found at: {file_path}")
             return
         try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-                ram = data.get('ram', '4G')
-                cpu = data.get('cpu', '2')
-                disk_size = data.get('disk_size', '20G')
-                # We overwrite the disk path to force organization
-                disk_name = os.path.join(DISK_DIR, data.get('disk_name', 'vm_disk.img'))
-                iso_path = data.get('iso_path', '')
-                print(f"Loaded config: {ram} RAM, {cpu} CPU, {disk_size} Disk")
+            name, ram, cpu, disk_size, disk_name, iso_path, template = load_config(file_path)
+            print(f"Loaded config: {ram} RAM, {cpu} CPU, {disk_size} Disk")
         except Exception as e:
             print(f"Error reading config: {e}")
             return
-    else:
+    elif choice != '1':
         print("Invalid choice.")
         return
 
+    boot_vm(name, ram, cpu, disk_size, iso_path, disk_name, template)
+
+
+def load_config(file_path):
+    """(name, ram, cpu, disk_size, disk_name, iso_path, template) from a VM config file"""
+    with open(file_path, 'r') as f:
+        data = json.load(f)
+    ram = data.get('ram', '4G')
+    cpu = data.get('cpu', '2')
+    disk_size = data.get('disk_size', '20G')
+    # We overwrite the disk path to force organization
+    disk_name = os.path.join(DISK_DIR, data.get('disk_name', 'vm_disk.img'))
+    name = data.get('name') or os.path.splitext(os.path.basename(disk_name))[0]
+    return name, ram, cpu, disk_size, disk_name, data.get('iso_path', ''), data.get('template')
+
+
+def boot_vm(name, ram, cpu, disk_size, iso_path, disk_name, template=None, resume=None, suspend=False):
+    """Creates the disk if needed, boots the VM and waits for it (shared by the menu and `main.py vm start`).
+
+    resume: continue from a RAM snapshot instead of booting ("" for the newest one).
+    suspend: Ctrl-C saves the RAM state to a file first, so the next --resume picks up where it stopped.
+    """
     # --- CHECK ISO ---
-    if not iso_path or not os.path.exists(iso_path):
+    if not template and (not iso_path or not os.path.exists(iso_path)):
         print(f"\n[ERROR] ISO file not found at: {iso_path}")
         print(f"Please move your ISO file to: {ISO_DIR}")
-        return
+        return False
 
     # --- EXECUTION LOGIC ---
-    
+    try:
+        vm = registry.define(name, ram=ram, cpu=cpu, disk_size=disk_size, iso_path=iso_path if not template else "",
+                             disk_path=disk_name, template=template)
+    except VMError as e:
+        print(f"[ERROR] {e}")
+        return False
+
     # Task 1: Create Hard Disk (in data/disks/)
     if not os.path.exists(disk_name):
-        print(f"\n[1/2] Creating Hard Disk at {disk_name}...")
-        cmd_disk = f'qemu-img create -f qcow2 "{disk_name}" {disk_size}'
+        print(f"\n[1/2] Creating {'overlay of template ' + template if template else 'Hard Disk'} at {disk_name}...")
         try:
-            subprocess.run(cmd_disk, shell=True, check=True)
+            registry.ensure_disk(vm)
             print("Disk created successfully.")
-        except subprocess.CalledProcessError:
-            print("Error creating disk. Is QEMU installed?")
-            return
+        except (VMError, OSError) as e:
+            print(f"{e}\nIs QEMU installed?")
+            return False
     else:
         print(f"\n[1/2] Using existing disk: {disk_name}")
 
-    # Task 2: Boot VM
-    print(f"\n[2/2] Booting Virtual Machine...")
-    
-    cmd_boot = (
-        f'qemu-system-x86_64 '
-        f'-accel whpx,kernel-irqchip=off ' 
-        f'-m {ram} '
-        f'-smp {cpu} '
-        f'-hda "{disk_name}" '  # Quotes added for safety
-        f'-boot d '
-        f'-cdrom "{iso_path}"'
-    )
-    
-    print(f"Executing: {cmd_boot}")
+    # Task 2: Boot VM (or resume it)
+    from vm_snapshots import snapshots, SnapshotError, FILE
     try:
-        subprocess.run(cmd_boot, shell=True)
+        if resume is not None:
+            print(f"\n[2/2] Resuming Virtual Machine '{name}' from {'snapshot ' + resume if resume else 'its last snapshot'}...")
+            _, seconds = snapshots.restore(name, resume or None)
+            print(f"Guest running again after {seconds:.1f}s.")
+        else:
+            print(f"\n[2/2] Booting Virtual Machine '{name}'...")
+            print(f"Executing: {' '.join(vm.boot_argv())}")
+            if registry.launch(name).state == QUEUED:
+                print("Not enough free RAM/CPU on the host right now; the VM will start when capacity frees up.")
+        registry.wait(name)
+        print(f"VM '{name}' exited with code {registry.get(name).returncode}.")
+    except (VMError, SnapshotError) as e:
+        print(f"[ERROR] {e}")
+        return False
     except KeyboardInterrupt:
+        if suspend and registry.get(name).state == RUNNING:
+            print("\nSaving the VM state...")
+            try:
+                entry = snapshots.save(name, kind=FILE, stop=True)
+                registry.wait(name)
+                print(f"VM '{name}' suspended as '{entry['tag']}' ({entry['save_seconds']}s); resume with --resume.")
+                return True
+            except SnapshotError as e:
+                print(f"[ERROR] {e}")
+        registry.stop(name)
         print("\nVM stopped by user.")
+    return True
+
 
 if __name__ == "__main__":
     create_vm()
\ No newline at end of file
@@ -0,0 +1,460 @@
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+
+from command_runner import runner
+from host_scheduler import scheduler as host_scheduler, AdmissionError, numactl_prefix, pin_process, pin_vcpus
+from disk_templates import catalog as template_catalog, TemplateError
+from profiling import profiled
+from qemu_profile import build_argv, qmp_socket_path
+from state_store import store
+
+# --- CONFIGURATION PATHS ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+DISK_DIR = os.path.join(DATA_DIR, "disks")
+
+# Both binaries can be swapped for stub scripts with these environment variables
+QEMU_SYSTEM = os.environ.get("QEMU_SYSTEM", "qemu-system-x86_64")
+QEMU_IMG = os.environ.get("QEMU_IMG", "qemu-img")
+REAP_INTERVAL = 0.5
+# Names become file names (disk, QMP socket) and a QEMU option value, where ',' would split the option
+VM_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# --- VM STATES ---
+DEFINED = "defined"
+QUEUED = "queued"
+RUNNING = "running"
+STOPPING = "stopping"
+STOPPED = "stopped"
+FAILED = "failed"
+
+
+class VMError(Exception):
+    pass
+
+
+def qemu_alive(pid, name):
+    """True when pid is still the QEMU of this VM (and not a recycled pid)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            argv = f.read().split(b"\0")
+    except OSError:
+        return True  # no procfs: the pid is all there is to go on
+    return b"-name" in argv and name.encode() in argv
+
+
+class AdoptedProcess:
+    """Stands in for Popen for a QEMU started by an earlier run of the app.
+
+    It is not our child, so its exit status is unknown; it is reported as 0 once the pid is gone.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, 0)
+            except ProcessLookupError:
+                self.returncode = 0
+            except PermissionError:
+                pass
+        return self.returncode
+
+    def terminate(self):
+        self._signal(signal.SIGTERM)
+
+    def kill(self):
+        self._signal(signal.SIGKILL if os.name != "nt" else signal.SIGTERM)
+
+    def _signal(self, sig):
+        try:
+            os.kill(self.pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+class VM:
+    """One named guest and the QEMU process backing it"""
+
+    def __init__(self, name, ram="4G", cpu="2", disk_size="5G", iso_path="", disk_path=None, template=None,
+                 accel=None, disk_bus="virtio-blk"):
+        self.name = name
+        self.ram = ram
+        self.cpu = str(cpu)
+        self.disk_size = disk_size
+        self.iso_path = iso_path
+        self.template = template
+        self.accel = accel
+        self.disk_bus = disk_bus
+        self.disk_path = disk_path or os.path.join(DISK_DIR, f"{name}.img")
+        self.qmp_socket = qmp_socket_path(name)
+        self.state = DEFINED
+        self.process = None
+        self.pid = None
+        self.returncode = None
+        self.started_at = None
+        self.stopped_at = None
+        self.reservation = None
+        self.vcpus_pinned = False
+        self.disk_lock = threading.Lock()
+
+    def settings(self):
+        """The define() arguments that recreate this VM"""
+        return {"ram": self.ram, "cpu": self.cpu, "disk_size": self.disk_size, "iso_path": self.iso_path,
+                "disk_path": self.disk_path, "template": self.template, "accel": self.accel, "disk_bus": self.disk_bus}
+
+    def boot_argv(self, loadvm=None, incoming=None):
+        # Accelerator, disk bus, cache/aio modes and hugepages come from the shared launch profile
+        return build_argv(self.name, self.ram, self.cpu, self.disk_path, iso_path=self.iso_path,
+                          qmp_socket=self.qmp_socket, accel=self.accel, disk_bus=self.disk_bus,
+                          qemu=QEMU_SYSTEM, loadvm=loadvm, incoming=incoming)
+
+    def info(self):
+        return {
+            "name": self.name, "state": self.state, "pid": self.pid, "qmp": self.qmp_socket,
+            "ram": self.ram, "cpu": self.cpu, "disk": self.disk_path, "iso": self.iso_path,
+            "template": self.template,
+            "returncode": self.returncode, "started_at": self.started_at, "stopped_at": self.stopped_at,
+            "cpus": self.reservation.cpus if self.reservation else None,
+            "numa_node": self.reservation.node.id if self.reservation else None,
+        }
+
+
+class VMRegistry:
+    """Tracks many QEMU guests by name.
+
+    Launch and stop return immediately; a single reaper thread polls every
+    child and records exits, instead of one blocking wait() thread per VM.
+    """
+
+    def __init__(self, on_change=None):
+        self.vms = {}
+        self.on_change = on_change
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._reaper = None
+
+    # --- REGISTRY ---
+    def define(self, name, **settings):
+        if not isinstance(name, str) or not VM_NAME.match(name):
+            raise VMError(f"Invalid VM name {name!r}: use letters, digits, '.', '_' and '-' only")
+        with self._lock:
+            vm = self.vms.get(name)
+            if vm and vm.state in (RUNNING, STOPPING, QUEUED):
+                raise VMError(f"VM '{name}' is already running")
+            vm = VM(name, **settings)
+            self.vms[name] = vm
+            return vm
+
+    def get(self, name):
+        with self._lock:
+            if name not in self.vms:
+                raise VMError(f"No VM named '{name}'")
+            return self.vms[name]
+
+    def remove(self, name, delete_disk=False):
+        with self._lock:
+            vm = self.get(name)
+            if vm.state in (RUNNING, STOPPING, QUEUED):
+                raise VMError(f"VM '{name}' is still {vm.state}")
+            del self.vms[name]
+        store.forget("vm", name)
+        if delete_disk:
+            if vm.template:
+                template_catalog.release(vm.disk_path)
+            elif os.path.exists(vm.disk_path):
+                os.remove(vm.disk_path)
+
+    def gc_overlays(self):
+        """Deletes template overlays that neither a recorded VM nor one defined here points at"""
+        with self._lock:
+            in_use = [vm.disk_path for vm in self.vms.values()]
+        return template_catalog.gc(in_use)
+
+    def list(self):
+        with self._lock:
+            return [vm.info() for vm in self.vms.values()]
+
+    def running(self):
+        with self._lock:
+            return [vm for vm in self.vms.values() if vm.state in (RUNNING, STOPPING)]
+
+    # --- LIFECYCLE ---
+    @profiled("vm.ensure_disk")
+    def ensure_disk(self, vm):
+        with vm.disk_lock:
+            return self._create_disk(vm)
+
+    def _create_disk(self, vm):
+        if os.path.exists(vm.disk_path):
+            return False
+        if vm.template:
+            try:
+                template_catalog.create_overlay(vm.template, vm.disk_path)
+            except TemplateError as e:
+                raise VMError(str(e))
+            return True
+        os.makedirs(os.path.dirname(vm.disk_path), exist_ok=True)
+        command = runner.run([QEMU_IMG, "create", "-f", "qcow2", vm.disk_path, vm.disk_size], label="qemu-img create")
+        if not command.ok:
+            raise VMError(f"Error creating disk for '{vm.name}': {command.tail()}")
+        return True
+
+    @profiled("vm.launch")
+    def launch(self, name, argv=None):
+        """Starts the QEMU process for a defined VM and returns without waiting on it.
+
+        The host scheduler must admit the VM first; depending on its policy a VM
+        that does not fit raises VMError or is left QUEUED until capacity frees up.
+        A VM that another live manager process (GUI, API server, CLI) runs is never booted a second time.
+        """
+        vm = self.get(name)
+        if vm.state not in (RUNNING, STOPPING, QUEUED):
+            owner = store.owned_elsewhere("vm", name)
+            if owner:
+                raise VMError(f"VM '{name}' is already running in another manager process (pid {owner})")
+            # qemu-img can take a while; only this VM's disk lock is held meanwhile, not the registry
+            try:
+                self.ensure_disk(vm)
+            except OSError as e:
+                raise VMError(f"Could not create the disk for '{name}': {e}")
+        with self._lock:
+            vm = self.get(name)
+            if vm.state in (RUNNING, STOPPING, QUEUED):
+                raise VMError(f"VM '{name}' is already {vm.state}")
+            try:
+                reservation = host_scheduler.admit(name, vm.ram, vm.cpu,
+                                                   on_admit=lambda r: self._start_admitted(name, r, argv))
+            except AdmissionError as e:
+                raise VMError(str(e))
+            # A new run: if it never starts, the previous run must not be recorded a second time
+            vm.started_at = vm.stopped_at = None
+            error = None
+            if reservation is None:
+                vm.state = QUEUED
+            else:
+                try:
+                    self._start(vm, reservation, argv)
+                except VMError as e:
+                    error = e
+        self._notify(vm)  # FAILED included, so the store does not keep the previous state
+        if error:
+            raise error
+        return vm
+
+    def _start_admitted(self, name, reservation, argv):
+        with self._lock:
+            vm = self.vms.get(name)
+            if vm is None or vm.state != QUEUED:
+                host_scheduler.release(name)
+                return
+            try:
+                self._start(vm, reservation, argv)
+            except VMError:
+                pass
+        self._notify(vm)
+
+    def _start(self, vm, reservation, argv=None):
+        try:
+            self.ensure_disk(vm)
+            os.makedirs(os.path.dirname(vm.qmp_socket), exist_ok=True)
+            if os.path.exists(vm.qmp_socket):
+                os.unlink(vm.qmp_socket)
+            prefix = numactl_prefix(reservation)
+            # Own session: Ctrl-C in the terminal reaches the manager, which decides between stop and suspend
+            vm.process = subprocess.Popen(prefix + (argv or vm.boot_argv()), stdin=subprocess.DEVNULL,
+                                          start_new_session=True)
+        except (OSError, VMError) as e:
+            vm.state = FAILED
+            host_scheduler.release(vm.name)
+            raise e if isinstance(e, VMError) else VMError(f"Could not start QEMU for '{vm.name}': {e}")
+        if not prefix:
+            pin_process(vm.process.pid, reservation.cpus)
+        reservation.pid = vm.process.pid
+        vm.reservation = reservation
+        vm.vcpus_pinned = False
+        vm.pid = vm.process.pid
+        vm.returncode = None
+        vm.started_at = time.time()
+        vm.stopped_at = None
+        vm.state = RUNNING
+        self._start_reaper()
+
+    def adopt(self, name, pid, started_at=None):
+        """Takes over a defined VM whose QEMU is still running from an earlier run of the app"""
+        with self._lock:
+            vm = self.get(name)
+            if vm.state in (RUNNING, STOPPING, QUEUED):
+                raise VMError(f"VM '{name}' is already {vm.state}")
+            if not pid or not qemu_alive(pid, name):
+                raise VMError(f"QEMU of '{name}' (pid {pid}) is no longer running")
+            vm.process = AdoptedProcess(pid)
+            vm.pid = pid
+            vm.returncode = None
+            vm.started_at = started_at or time.time()
+            vm.stopped_at = None
+            vm.reservation = host_scheduler.adopt(name, vm.ram, vm.cpu)
+            vm.reservation.pid = pid
+            vm.vcpus_pinned = True  # pinned (or not) by whoever started it
+            vm.state = RUNNING
+            self._start_reaper()
+        self._notify(vm)
+        return vm
+
+    @profiled("vm.stop")
+    def stop(self, name, force=False):
+        """Asks a VM to exit (SIGTERM, or SIGKILL with force); the reaper records the exit"""
+        with self._lock:
+            vm = self.get(name)
+            if vm.state == QUEUED:
+                host_scheduler.cancel(name)
+                vm.state = STOPPED
+            elif vm.state not in (RUNNING, STOPPING) or (vm.state == STOPPING and not force):
+                return vm
+            else:
+                vm.state = STOPPING
+                if force:
+                    vm.process.kill()
+                else:
+                    vm.process.terminate()
+        self._notify(vm)
+        self._wakeup.set()
+        return vm
+
+    @profiled("vm.powerdown")
+    def powerdown(self, name):
+        """Sends an ACPI power button press over QMP, falling back to SIGTERM if QMP is unreachable"""
+        vm = self.get(name)
+        if vm.state != RUNNING:
+            return vm
+        from qmp_client import qmp_call, QMPError  # asyncio is only loaded once a VM is talked to
+        try:
+            qmp_call(vm.qmp_socket, "system_powerdown")
+        except (QMPError, OSError, TimeoutError):
+            return self.stop(name)
+        with self._lock:
+            if vm.state == RUNNING:
+                vm.state = STOPPING
+        self._notify(vm)
+        return vm
+
+    def quit(self, name):
+        """Tells QEMU to exit immediately over QMP, falling back to SIGKILL"""
+        vm = self.get(name)
+        if vm.state not in (RUNNING, STOPPING):
+            return vm
+        from qmp_client import qmp_call, QMPError
+        try:
+            qmp_call(vm.qmp_socket, "quit")
+        except (QMPError, OSError, TimeoutError):
+            return self.stop(name, force=True)
+        with self._lock:
+            vm.state = STOPPING
+        self._notify(vm)
+        self._wakeup.set()
+        return vm
+
+    def stats(self, name):
+        """Live status, vCPU and block I/O figures for one VM straight from QMP"""
+        from qmp_client import qmp_call
+        return qmp_call(self.get(name).qmp_socket, "stats")
+
+    def qmp_sockets(self):
+        return {vm.name: vm.qmp_socket for vm in self.running()}
+
+    def poller(self, interval=None):
+        """A QMPPoller over every running VM (started by the caller)"""
+        from qmp_client import QMPPoller
+        return QMPPoller(self.qmp_sockets, **({"interval": interval} if interval else {}))
+
+    def stop_all(self, force=False):
+        with self._lock:
+            names = [vm.name for vm in self.vms.values() if vm.state in (RUNNING, STOPPING, QUEUED)]
+        for name in names:
+            self.stop(name, force=force)
+
+    def wait(self, name, timeout=None):
+        """Blocks until the VM has exited (used by the interactive CLI)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.get(name).state in (RUNNING, STOPPING, QUEUED):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(REAP_INTERVAL / 5)
+        return True
+
+    # --- REAPER ---
+    def _start_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap_loop, name="vm-reaper", daemon=True)
+            self._reaper.start()
+
+    def reap(self):
+        """Collects every exited child once; returns the VMs that changed state"""
+        exited = []
+        with self._lock:
+            for vm in self.vms.values():
+                if vm.state in (RUNNING, STOPPING) and vm.process.poll() is not None:
+                    vm.returncode = vm.process.returncode
+                    vm.state = STOPPED if vm.state == STOPPING or vm.returncode == 0 else FAILED
+                    vm.stopped_at = time.time()
+                    vm.process = None
+                    if os.path.exists(vm.qmp_socket):
+                        os.unlink(vm.qmp_socket)
+                    exited.append(vm)
+            unpinned = [vm for vm in self.vms.values()
+                        if vm.state == RUNNING and not vm.vcpus_pinned and os.path.exists(vm.qmp_socket)]
+        for vm in exited:
+            vm.reservation = None
+            self._notify(vm)
+            # Releasing capacity may start queued VMs straight away
+            host_scheduler.release(vm.name)
+        for vm in unpinned:
+            self._pin_vcpus(vm)
+        return exited
+
+    def _pin_vcpus(self, vm):
+        """One vCPU thread per reserved core, once QMP is up"""
+        from qmp_client import qmp_call, QMPError
+        try:
+            cpus = qmp_call(vm.qmp_socket, "query-cpus-fast", timeout=1)
+        except (QMPError, OSError, TimeoutError):
+            return
+        if vm.reservation:
+            pin_vcpus([c["thread-id"] for c in cpus if "thread-id" in c], vm.reservation.cpus)
+        vm.vcpus_pinned = True
+
+    def _reap_loop(self):
+        while True:
+            self.reap()
+            if not self.running():
+                with self._lock:
+                    if not self.running():
+                        self._reaper = None
+                        return
+            self._wakeup.wait(REAP_INTERVAL)
+            self._wakeup.clear()
+
+    def _notify(self, vm):
+        store.vm_changed(vm)  # persisted so the next start of the app can find (or adopt) it
+        if self.on_change:
+            try:
+                self.on_change(vm)
+            except Exception:
+                pass
+
+
+# Shared by the CLI menu and the GUI
+registry = VMRegistry()
@@ -0,0 +1,385 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import shlex
+import threading
+import time
+
+import vm_registry
+from command_runner import runner
+from disk_images import read_qcow2_header, read_qcow2_snapshots
+from qemu_profile import detect_accel
+from qmp_client import QMPClient, QMPError
+from state_store import store
+from vm_registry import registry, VMError, RUNNING, STOPPING, QUEUED
+
+# --- CONFIGURATION PATHS ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "data", "snapshots")
+# Saving or loading several GB of RAM takes a while; QMP reads wait this long
+SNAPSHOT_TIMEOUT = 600
+# QEMU throttles migration to 128 MiB/s by default, which only makes sense over a network
+MIGRATE_BANDWIDTH = 64 << 30
+MIGRATE_POLL = 0.1
+# The drive id build_argv gives the system disk
+DISK_DEVICE = "disk0"
+
+# --- SNAPSHOT KINDS ---
+INTERNAL = "internal"  # savevm: RAM, devices and disk inside the qcow2 image; resumed with -loadvm
+DISK = "disk"          # disk only (taken while the VM was off); restoring means a cold boot
+FILE = "file"          # RAM and devices streamed to a file by migration, plus a disk snapshot of the same tag;
+                       # resumed with -incoming
+
+# Tags become file names (<tag>.state) and HMP arguments (savevm <tag>), so they stay plain words
+SNAPSHOT_TAG = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# Settings that must match between save and resume, or QEMU rejects the state
+MACHINE_KEYS = ("ram", "cpu", "accel", "disk_bus", "cdrom")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def valid_tag(tag):
+    return isinstance(tag, str) and bool(SNAPSHOT_TAG.match(tag))
+
+
+def check_tag(tag):
+    if not valid_tag(tag):
+        raise SnapshotError(f"Invalid snapshot tag {tag!r}: start with a letter or digit, then use letters, "
+                            f"digits, '.', '_' and '-' only (at most 64)")
+
+
+def machine(vm):
+    return {"ram": vm.ram, "cpu": vm.cpu, "accel": vm.accel or detect_accel(vm_registry.QEMU_SYSTEM),
+            "disk_bus": vm.disk_bus, "cdrom": bool(vm.iso_path)}
+
+
+def migration_uris(path, version):
+    """(outgoing, incoming) URIs for a state file; the file: transport exists from QEMU 8.2"""
+    if (version.get("major", 0), version.get("minor", 0)) >= (8, 2):
+        return f"file:{path}", f"file:{path}"
+    return f"exec:cat > {shlex.quote(path)}", f"exec:cat {shlex.quote(path)}"
+
+
+# --- QMP SESSIONS ---
+async def _hmp(qmp, command):
+    """savevm/loadvm/delvm only exist as monitor commands; errors come back as text"""
+    output = (await qmp.execute("human-monitor-command", {"command-line": command})) or ""
+    if "error" in output.lower():
+        raise QMPError(f"{command}: {output.strip()}")
+    return output
+
+
+async def _save_internal(socket_path, tag):
+    async with QMPClient(socket_path, SNAPSHOT_TIMEOUT) as qmp:
+        await _hmp(qmp, f"savevm {tag}")
+
+
+async def _save_to_file(socket_path, tag, path, resume):
+    """Pauses the guest, snapshots the disk and streams RAM/device state to path; resume=False leaves it paused"""
+    async with QMPClient(socket_path, SNAPSHOT_TIMEOUT) as qmp:
+        version = (await qmp.execute("query-version")).get("qemu", {})
+        was_running = (await qmp.query_status()).get("running")
+        outgoing, incoming = migration_uris(path, version)
+        await qmp.execute("stop")
+        try:
+            # Same tag on the disk, so the RAM image is always resumed on top of the disk it was taken with
+            await qmp.execute("blockdev-snapshot-internal-sync", {"device": DISK_DEVICE, "name": tag})
+            try:
+                await qmp.execute("migrate-set-parameters", {"max-bandwidth": MIGRATE_BANDWIDTH})
+                await qmp.execute("migrate", {"uri": outgoing})
+                while True:
+                    info = await qmp.execute("query-migrate")
+                    status = info.get("status")
+                    if status == "completed":
+                        break
+                    if status in ("failed", "cancelled"):
+                        raise QMPError(f"Migration {status}: {info.get('error-desc', '')}".rstrip(": "))
+                    await asyncio.sleep(MIGRATE_POLL)
+            except QMPError:
+                await qmp.execute("blockdev-snapshot-delete-internal-sync", {"device": DISK_DEVICE, "name": tag})
+                raise
+        except QMPError:
+            if was_running:
+                await qmp.execute("cont")
+            raise
+        if resume and was_running:
+            await qmp.execute("cont")
+        return incoming, info.get("ram", {}).get("total", 0)
+
+
+async def _load_internal(socket_path, tag):
+    async with QMPClient(socket_path, SNAPSHOT_TIMEOUT) as qmp:
+        await _hmp(qmp, f"loadvm {tag}")
+
+
+async def _delete_internal(socket_path, tag):
+    async with QMPClient(socket_path, SNAPSHOT_TIMEOUT) as qmp:
+        await _hmp(qmp, f"delvm {tag}")
+
+
+async def _finish_incoming(socket_path, deadline, alive):
+    """Waits for QMP and the incoming migration, then starts the vCPUs (the guest was paused when saved)"""
+    while True:
+        if not alive():
+            raise SnapshotError("QEMU exited while loading the saved state")
+        try:
+            async with QMPClient(socket_path, SNAPSHOT_TIMEOUT) as qmp:
+                while True:
+                    status = (await qmp.query_status()).get("status")
+                    if status != "inmigrate":
+                        break
+                    if time.monotonic() > deadline:
+                        raise SnapshotError("Timed out waiting for the saved state to load")
+                    await asyncio.sleep(MIGRATE_POLL)
+                if status in ("paused", "postmigrate", "prelaunch"):
+                    await qmp.execute("cont")
+                elif status != "running":
+                    raise SnapshotError(f"Restored guest is {status}")
+                return
+        except (OSError, asyncio.TimeoutError):
+            if time.monotonic() > deadline:
+                raise SnapshotError("QMP socket never came up")
+            await asyncio.sleep(MIGRATE_POLL)
+
+
+# --- STORE ---
+class SnapshotStore:
+    """Snapshots of the VMs in a registry.
+
+    Internal snapshots live in the qcow2 image and are listed straight from its
+    snapshot table. File snapshots keep RAM in data/snapshots/<vm>/<tag>.state.
+    index.json next to them records what a table cannot hold: the kind, the
+    machine settings the state was taken with and how long saving took.
+    """
+
+    def __init__(self, vms=registry, snapshot_dir=SNAPSHOT_DIR):
+        self.registry = vms
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+
+    # --- PERSISTENCE ---
+    def _index_file(self, name):
+        return os.path.join(self.snapshot_dir, name, "index.json")
+
+    def _load(self, name):
+        try:
+            with open(self._index_file(name), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, name, entries):
+        path = self._index_file(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f, indent=4)
+        os.replace(tmp, path)
+
+    def _record(self, name, tag, **entry):
+        with self._lock:
+            entries = self._load(name)
+            entries[tag] = dict(entry, tag=tag)
+            self._save(name, entries)
+        return entries[tag]
+
+    def state_file(self, name, tag):
+        return os.path.join(self.snapshot_dir, name, f"{tag}.state")
+
+    # --- LISTING ---
+    def list(self, name):
+        """Every snapshot of a VM, oldest first"""
+        vm = self.registry.get(name)
+        recorded = self._load(name)
+        table = read_qcow2_snapshots(vm.disk_path) if os.path.exists(vm.disk_path) else []
+        trusted = os.path.exists(vm.disk_path) and read_qcow2_header(vm.disk_path) is not None
+        snapshots = {}
+        for s in table:
+            snapshots[s["tag"]] = dict(recorded.get(s["tag"], {}), tag=s["tag"], created=s["created"],
+                                       kind=INTERNAL if s["vm_state_size"] else DISK, size=s["vm_state_size"])
+        for tag, entry in recorded.items():
+            if entry["kind"] == FILE:
+                if os.path.exists(entry["state_file"]):
+                    snapshots[tag] = dict(entry, size=os.path.getsize(entry["state_file"]))
+            elif tag not in snapshots and not trusted:
+                snapshots[tag] = entry  # stub or raw images have no table to read
+        return sorted(snapshots.values(), key=lambda s: s["created"])
+
+    def find(self, name, tag=None):
+        """One snapshot by tag, or the newest one that holds RAM state"""
+        snapshots = self.list(name)
+        if tag is None:
+            resumable = [s for s in snapshots if s["kind"] in (INTERNAL, FILE)]
+            if not resumable:
+                raise SnapshotError(f"VM '{name}' has no snapshot to resume from")
+            return resumable[-1]
+        for s in snapshots:
+            if s["tag"] == tag:
+                return s
+        raise SnapshotError(f"VM '{name}' has no snapshot '{tag}'")
+
+    # --- SAVE ---
+    def save(self, name, tag=None, kind=FILE, stop=False):
+        """Takes a snapshot. A running VM keeps running unless stop=True; a stopped VM gets a disk snapshot"""
+        tag = tag or time.strftime("snap-%Y%m%d-%H%M%S")
+        check_tag(tag)
+        vm = self.registry.get(name)
+        if any(s["tag"] == tag for s in self.list(name)):
+            raise SnapshotError(f"VM '{name}' already has a snapshot '{tag}'")
+        started = time.monotonic()
+        try:
+            if vm.state != RUNNING:
+                if vm.state in (STOPPING, QUEUED):
+                    raise SnapshotError(f"VM '{name}' is {vm.state}")
+                self._qemu_img(vm, "-c", tag)
+                kind, extra = DISK, {}
+            elif kind == INTERNAL:
+                asyncio.run(_save_internal(vm.qmp_socket, tag))
+                extra = {}
+            else:
+                path = self.state_file(name, tag)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                try:
+                    incoming, ram = asyncio.run(_save_to_file(vm.qmp_socket, tag, path, resume=not stop))
+                except BaseException:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    raise
+                extra = {"state_file": path, "incoming": incoming, "ram_bytes": ram}
+        except (QMPError, OSError, asyncio.TimeoutError) as e:
+            raise SnapshotError(f"Could not snapshot '{name}': {e}")
+        entry = self._record(name, tag, kind=kind, created=int(time.time()), machine=machine(vm),
+                             save_seconds=round(time.monotonic() - started, 3), **extra)
+        store.record("snapshot.save", name, "done", time.time() - entry["save_seconds"], entry["save_seconds"],
+                     tag=entry["tag"], snapshot_kind=kind)
+        if stop and vm.state == RUNNING:
+            self.registry.quit(name)  # suspend: the state is on disk, nothing needs a clean shutdown
+        return entry
+
+    # --- RESTORE ---
+    def restore(self, name, tag=None, timeout=SNAPSHOT_TIMEOUT):
+        """Brings a VM back to a snapshot. Stopped VMs are launched from it (resume mode); a running VM
+        can only jump to an internal snapshot in place. Returns (vm, seconds until the guest runs)."""
+        if tag is not None:
+            check_tag(tag)
+        vm = self.registry.get(name)
+        snapshot = self.find(name, tag)
+        started = time.monotonic()
+        saved = snapshot.get("machine")
+        if saved:
+            current = dict(machine(vm), accel=saved["accel"])
+            changed = [k for k in MACHINE_KEYS if k in saved and saved[k] != current[k]]
+            if snapshot["kind"] != DISK:
+                if changed:
+                    raise SnapshotError(f"'{snapshot['tag']}' was taken with different {', '.join(changed)}; "
+                                        f"define the VM the same way to resume it")
+                vm.accel = saved["accel"]  # a kvm save cannot be loaded under tcg and the other way round
+        try:
+            if vm.state == RUNNING:
+                if snapshot["kind"] != INTERNAL:
+                    raise SnapshotError(f"Stop '{name}' before restoring the {snapshot['kind']} snapshot "
+                                        f"'{snapshot['tag']}'")
+                asyncio.run(_load_internal(vm.qmp_socket, snapshot["tag"]))
+            elif snapshot["kind"] == INTERNAL:
+                self.registry.launch(name, argv=vm.boot_argv(loadvm=snapshot["tag"]))
+            else:
+                self._qemu_img(vm, "-a", snapshot["tag"])
+                if snapshot["kind"] == DISK:
+                    self.registry.launch(name)
+                else:
+                    self.registry.launch(name, argv=vm.boot_argv(incoming=snapshot["incoming"]))
+                    deadline = time.monotonic() + timeout
+                    while vm.state == QUEUED and time.monotonic() < deadline:
+                        time.sleep(MIGRATE_POLL)  # admitted once the host has room
+                    if vm.state != RUNNING:
+                        raise SnapshotError(f"VM '{name}' did not start ({vm.state})")
+                    asyncio.run(_finish_incoming(vm.qmp_socket, deadline, lambda: vm.state == RUNNING))
+        except (QMPError, OSError, asyncio.TimeoutError) as e:
+            raise SnapshotError(f"Could not restore '{name}' to '{snapshot['tag']}': {e}")
+        seconds = round(time.monotonic() - started, 3)
+        store.record("snapshot.restore", name, "done", time.time() - seconds, seconds,
+                     tag=snapshot["tag"], snapshot_kind=snapshot["kind"])
+        return vm, seconds
+
+    def resume(self, name, timeout=SNAPSHOT_TIMEOUT):
+        """Launch mode for a stopped VM: continue from its newest RAM snapshot instead of booting"""
+        return self.restore(name, None, timeout)
+
+    # --- DELETE ---
+    def delete(self, name, tag):
+        check_tag(tag)
+        vm = self.registry.get(name)
+        snapshot = self.find(name, tag)
+        try:
+            if vm.state == RUNNING:
+                if snapshot["kind"] == INTERNAL:
+                    asyncio.run(_delete_internal(vm.qmp_socket, tag))
+                else:
+                    asyncio.run(self._delete_disk_snapshot(vm.qmp_socket, tag))
+            elif vm.state in (STOPPING, QUEUED):
+                raise SnapshotError(f"VM '{name}' is {vm.state}")
+            else:
+                self._qemu_img(vm, "-d", tag)
+        except (QMPError, OSError, asyncio.TimeoutError) as e:
+            raise SnapshotError(f"Could not delete '{tag}' of '{name}': {e}")
+        if snapshot.get("state_file") and os.path.exists(snapshot["state_file"]):
+            os.remove(snapshot["state_file"])
+        with self._lock:
+            entries = self._load(name)
+            if entries.pop(tag, None) is not None:
+                self._save(name, entries)
+
+    @staticmethod
+    async def _delete_disk_snapshot(socket_path, tag):
+        async with QMPClient(socket_path, SNAPSHOT_TIMEOUT) as qmp:
+            await qmp.execute("blockdev-snapshot-delete-internal-sync", {"device": DISK_DEVICE, "name": tag})
+
+    @staticmethod
+    def _qemu_img(vm, flag, tag):
+        """qemu-img snapshot -c/-a/-d on the image of a VM that is not running"""
+        if not os.path.exists(vm.disk_path):
+            raise SnapshotError(f"Disk not found: {vm.disk_path}")
+        command = runner.run([vm_registry.QEMU_IMG, "snapshot", flag, tag, vm.disk_path], label="qemu-img snapshot")
+        if not command.ok:
+            raise SnapshotError(f"qemu-img snapshot {flag} {tag} failed: {command.tail()}")
+
+
+def describe(snapshot):
+    size = f" {snapshot['size'] / 2 ** 30:.1f} GB" if snapshot.get("size") else ""
+    created = time.strftime("%Y-%m-%d %H:%M", time.localtime(snapshot["created"]))
+    return f"{snapshot['tag']:<28} {snapshot['kind']:<9} {created}{size}"
+
+
+# Shared by the CLI, the GUI and the API
+snapshots = SnapshotStore()
+
+
+if __name__ == "__main__":
+    # Works on disks of VMs that are not running: python vm_snapshots.py list data/disks/vm1.img
+    parser = argparse.ArgumentParser(description="Internal snapshots of a VM disk image (VM must be off)")
+    parser.add_argument("command", choices=("list", "create", "apply", "delete"))
+    parser.add_argument("disk")
+    parser.add_argument("tag", nargs="?")
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.disk))[0]
+    registry.define(name, disk_path=os.path.abspath(args.disk))
+    try:
+        if args.command == "list":
+            for s in snapshots.list(name):
+                print(describe(s))
+        elif not args.tag:
+            parser.error(f"{args.command} needs a tag")
+        elif args.command == "create":
+            print(describe(snapshots.save(name, args.tag)))
+        elif args.command == "apply":
+            SnapshotStore._qemu_img(registry.get(name), "-a", args.tag)
+        else:
+            snapshots.delete(name, args.tag)
+    except (SnapshotError, VMError) as e:
+        print(f"[ERROR] {e}")